@@ -11,6 +11,7 @@ class AndroidApp(App):
         self.main_page = apk.get_main_activity()
         self.abilities = apk.get_activities()
         self.app_name = apk.get_app_name()
+        self.permissions = apk.get_permissions()
 
         # # 获取原始 XML 字符串
         # manifest_xml = apk.get_android_manifest_xml()
@@ -0,0 +1,121 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .device import Device
+
+
+class AsyncDevice(object):
+    """
+    The class wraps a Device for asyncio code.
+
+    Actions (click, back, ...) go through a single-threaded lane per device, so they reach
+    the device in the order they were awaited or scheduled. Observations (dump_page,
+    screenshot, page_info, ...) run on a separate pool and may overlap with each other and
+    with any other coroutine of the event loop, e.g. a pending LLM request. An observation
+    first waits for the actions issued before it, so it never sees a page older than them.
+    """
+
+    def __init__(self, device: Device, observers=4):
+        """
+        Args:
+            device (Device): The wrapped device.
+            observers (int): How many observations may run at the same time.
+        """
+        self.device = device
+        self.serial = device.serial
+        self._action_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix='action-%s' % device.serial)
+        self._observers = ThreadPoolExecutor(max_workers=observers, thread_name_prefix='observe-%s' % device.serial)
+        self._last_action = None
+
+    @property
+    def connector(self):
+        return self.device.connector
+
+    @property
+    def automator(self):
+        return self.device.automator
+
+    async def act(self, func, *args, **kwargs):
+        """
+        Run a blocking call of the device, its connector or automator on the action lane.
+
+        Returns:
+            The result of func.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._action_lane, functools.partial(func, *args, **kwargs))
+        self._last_action = future
+        return await future
+
+    async def observe(self, func, *args, **kwargs):
+        """
+        Run a blocking read-only call once the actions issued before it have finished.
+
+        Returns:
+            The result of func.
+        """
+        pending = self._last_action
+        if pending is not None and not pending.done():
+            # An observation must not fail because of an earlier action, the action's awaiter gets the error
+            await asyncio.wait([pending])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._observers, functools.partial(func, *args, **kwargs))
+
+    async def click(self, x, y):
+        return await self.act(self.device.click, x, y)
+
+    async def long_click(self, x, y):
+        return await self.act(self.device.long_click, x, y)
+
+    async def drag(self, x1, y1, x2, y2, speed=2000):
+        return await self.act(self.device.drag, x1, y1, x2, y2, speed)
+
+    async def swipe(self, x1, y1, x2, y2, speed=2000):
+        return await self.act(self.device.swipe, x1, y1, x2, y2, speed)
+
+    async def input(self, text):
+        return await self.act(self.device.input, text)
+
+    async def home(self):
+        return await self.act(self.device.home)
+
+    async def back(self):
+        return await self.act(self.device.back)
+
+    async def recent(self):
+        return await self.act(self.device.recent)
+
+    async def start_app(self, app):
+        return await self.act(self.device.start_app, app)
+
+    async def restart_app_by_bundle(self, bundle):
+        return await self.act(self.device.restart_app_by_bundle, bundle)
+
+    async def wait_for_idle(self, **kwargs):
+        # Queued behind the actions so it waits for the UI they disturbed
+        return await self.act(self.device.wait_for_idle, **kwargs)
+
+    async def dump_page(self, refresh=False):
+        return await self.observe(self.device.dump_page, refresh=refresh)
+
+    async def dump_hierarchy(self):
+        return await self.observe(self.device.dump_hierarchy)
+
+    async def screenshot(self, path='', raw=None):
+        return await self.observe(self.device.screenshot, path, raw)
+
+    async def page_info(self):
+        return await self.observe(self.device.page_info)
+
+    async def resources(self, bundle=None):
+        return await self.observe(self.device.resources, bundle)
+
+    def close(self):
+        self._action_lane.shutdown(wait=False)
+        self._observers.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,4 +1,20 @@
 from abc import ABC, abstractmethod
+import functools
+import time
+
+
+def action(func):
+    """
+    Mark an automator method that may change the screen, so frames captured before it returns are stale.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self._acted()
+    return wrapper
+
 
 class Automator(ABC):
     """
@@ -127,15 +143,16 @@ class Automator(ABC):
         pass
 
     @abstractmethod
-    def screenshot(self, path=''):
+    def screenshot(self, path='', raw=False):
         """
         Take a screenshot of the device display.
 
         Args:
             path (str): The local path to save the screenshot.
+            raw (bool): Keep the compressed (JPEG) bytes produced by the device instead of decoding them.
 
         Returns:
-            str: The path where the screenshot is saved.
+            numpy.ndarray or bytes: The screenshot, as bytes only if raw is set.
         """
         pass
 
@@ -150,9 +167,12 @@ class Automator(ABC):
     #     pass
 
     @abstractmethod
-    def display_info(self, refresh=True):
+    def display_info(self, refresh=False):
         """
-        Get display info about the device.
+        Get display info about the device, cached until rotation or screen size changes.
+
+        Args:
+            refresh (bool): Bypass the cache and query the device.
 
         Returns:
             Dict: The display info as a dict.
@@ -189,4 +209,37 @@ class Automator(ABC):
 
     @abstractmethod
     def identify(self, node):
-        pass
\ No newline at end of file
+        pass
+
+    def attach_frame_source(self, source):
+        """
+        Serve screenshots from a FrameSource instead of capturing a frame per call.
+
+        Args:
+            source (FrameSource): The source feeding the ring buffer, it is started here.
+        """
+        self.detach_frame_source()
+        self._frame_source = source
+        source.start()
+
+    def detach_frame_source(self):
+        source = getattr(self, '_frame_source', None)
+        if source is not None:
+            source.stop()
+        self._frame_source = None
+
+    def _acted(self):
+        """
+        Record the end of an action; frames grabbed before it are stale.
+        """
+        self._action_ts = time.time()
+
+    def _fresh_frame(self, timeout=1.0):
+        """
+        Get the newest frame captured after the last action, or None to fall back to a per-call capture.
+        """
+        source = getattr(self, '_frame_source', None)
+        if source is None:
+            return None
+        frame = source.latest(newer_than=getattr(self, '_action_ts', 0), timeout=timeout)
+        return frame.img if frame is not None else None
@@ -0,0 +1,90 @@
+from loguru import logger
+import threading
+
+
+class DisplayCache(object):
+    """
+    The class caches the display info of one device.
+
+    The cached info stays valid until a background watcher sees the rotation or the
+    screen size of the device change, so actions do not pay a round trip for it.
+    Automators (U2 or H2) of the same serial share one cache.
+    """
+    _caches = {}
+    _caches_lock = threading.Lock()
+
+    @classmethod
+    def of(cls, serial):
+        """
+        Return the display cache of a device, creating it on first use.
+
+        Args:
+            serial (str): The serial of device.
+        """
+        with cls._caches_lock:
+            if serial not in cls._caches:
+                cls._caches[serial] = cls(serial)
+            return cls._caches[serial]
+
+    def __init__(self, serial, interval=5.0):
+        """
+        Args:
+            serial (str): The serial of device.
+            interval (float): Seconds between two polls of the rotation watcher.
+        """
+        self.serial = serial
+        self.interval = interval
+        self._info = None
+        self._state = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stopped = threading.Event()
+
+    def get(self, fetch, refresh=False):
+        """
+        Get the display info, fetching it only if nothing valid is cached.
+
+        Args:
+            fetch (callable): Returns a fresh DisplayInfo from the device.
+            refresh (bool): Fetch even if a valid info is cached.
+
+        Returns:
+            DisplayInfo: The display info of the device.
+        """
+        with self._lock:
+            if self._info is None or refresh:
+                self._info = fetch()
+            return self._info
+
+    def invalidate(self):
+        with self._lock:
+            self._info = None
+
+    def watch(self, probe):
+        """
+        Start the rotation watcher unless it is already running.
+
+        Args:
+            probe (callable): A cheap call whose result changes whenever rotation or screen size changes.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stopped.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(probe,), daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self, probe):
+        while not self._stopped.wait(self.interval):
+            try:
+                state = probe()
+            except Exception as e:
+                logger.debug("display probe failed on device:%s: %s" % (self.serial, e))
+                continue
+            if state != self._state:
+                if self._state is not None:
+                    logger.debug("display of device:%s changed, invalidate display info" % self.serial)
+                    self.invalidate()
+                self._state = state
@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from loguru import logger
+import threading
+import time
+
+
+@dataclass
+class Frame:
+    img: object
+    ts: float
+
+
+class FrameSource(ABC):
+    """
+    The interface describes a source of screen frames.
+
+    Decoded frames are kept in a bounded ring buffer, so the newest frame can be
+    served to screenshot() without a round trip to the device.
+    """
+    def __init__(self, capacity=4):
+        """
+        Args:
+            capacity (int): How many of the newest frames the ring buffer keeps.
+        """
+        self._frames = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+
+    @abstractmethod
+    def start(self):
+        """
+        Start feeding frames into the ring buffer.
+        """
+        pass
+
+    @abstractmethod
+    def stop(self):
+        """
+        Stop feeding frames.
+        """
+        pass
+
+    def _push(self, img, ts=None):
+        with self._cond:
+            self._frames.append(Frame(img=img, ts=time.time() if ts is None else ts))
+            self._cond.notify_all()
+
+    def latest(self, newer_than=0, timeout=0):
+        """
+        Get the newest frame in the ring buffer.
+
+        Args:
+            newer_than (float): Only accept a frame captured after this timestamp.
+            timeout (float): Seconds to wait for such a frame to arrive.
+
+        Returns:
+            Frame: The newest frame, or None if no acceptable frame arrived in time.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._frames or self._frames[-1].ts <= newer_than:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._frames[-1]
+
+    def frames(self):
+        with self._cond:
+            return list(self._frames)
+
+
+class StreamFrameSource(FrameSource):
+    """
+    Continuously pulls frames from the device in a background thread.
+    """
+    def __init__(self, grab, capacity=4, interval=0.1):
+        """
+        Args:
+            grab (callable): Returns one decoded frame from the device.
+            capacity (int): How many of the newest frames the ring buffer keeps.
+            interval (float): Seconds to rest between two grabs.
+        """
+        super().__init__(capacity)
+        self._grab = grab
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # A frame is only known to be newer than anything that happened before its grab started
+            ts = time.time()
+            try:
+                img = self._grab()
+            except Exception as e:
+                logger.debug("frame grab failed: %s" % e)
+                self._stopped.wait(1)
+                continue
+            if img is not None:
+                self._push(img, ts)
+            self._stopped.wait(self.interval)
+
+
+class ReplayFrameSource(FrameSource):
+    """
+    Replays recorded frames (image files or arrays), standing in for a device in tests.
+    """
+    def __init__(self, frames, capacity=4, fps=10, loop=True):
+        """
+        Args:
+            frames (list): Paths of image files or decoded images, in playing order.
+            capacity (int): How many of the newest frames the ring buffer keeps.
+            fps (float): Frames pushed per second.
+            loop (bool): Start over after the last frame.
+        """
+        super().__init__(capacity)
+        self._source = list(frames)
+        self.fps = fps
+        self.loop = loop
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            for frame in self._source:
+                if self._stopped.is_set():
+                    return
+                if isinstance(frame, str):
+                    from hmbot.utils.cv import read
+                    frame = read(frame)
+                self._push(frame)
+                self._stopped.wait(1 / self.fps)
+            if not self.loop:
+                return
@@ -1,19 +1,27 @@
-from .automator import Automator
+from .automator import Automator, action
+from .display import DisplayCache
+from .watchdog import Watchdog
 from hmbot.model.vht import VHTParser
 from hmbot.utils.proto import SwipeDirection, DisplayInfo
 from hmbot.app.app import App
 from hmdriver2.driver import Driver
 from hmdriver2.proto import KeyCode
 from loguru import logger
-import uuid, os, shutil, logging
+import uuid, os, logging
 h2_logger = logging.getLogger('hmdriver2')
 h2_logger.setLevel(logging.CRITICAL)
 
 class H2(Automator):
     def __init__(self, device):
         self._serial = device.serial
-        self._driver = Driver(self._serial)
-        self._display_info = None
+        self.watchdog = Watchdog(lambda: Driver(self._serial), self._serial,
+                                 actions=('click', 'long_click', 'swipe', 'go_home', 'go_back', 'press_key',
+                                          'start_app', 'stop_app', 'install_app', 'uninstall_app'),
+                                 deadlines={'install_app': 600, 'dump_hierarchy': 60})
+        self.watchdog.start_heartbeat(lambda driver: driver.display_rotation)
+        self._driver = self.watchdog.proxy()
+        self._display = DisplayCache.of(self._serial)
+        self._display.watch(self._display_state)
         logger.debug("hmdriver2 is connected to device:%s" %(self._serial))
 
     def install_app(self, app):
@@ -28,12 +36,14 @@ class H2(Automator):
         else:
             raise TypeError('expected an App, not %s' % type(app).__name__)
 
+    @action
     def start_app(self, app):
         if isinstance(app, App):
             self._driver.start_app(app.package_name)
         else:
             raise TypeError('expected an App, not %s' % type(app).__name__)
 
+    @action
     def stop_app(self, app):
         if isinstance(app, App):
             self._driver.stop_app(app.package_name)
@@ -44,18 +54,23 @@ class H2(Automator):
         self.stop_app(app)
         self.start_app(app)
     
+    @action
     def click(self, x, y):
         return self._driver.click(x, y)
 
+    @action
     def long_click(self, x, y):
         return self._driver.long_click(x, y)
 
+    @action
     def drag(self, x1, y1, x2, y2, speed):
         return self._driver.swipe(x1, y1, x2, y2, speed)
 
+    @action
     def swipe(self, x1, y1, x2, y2, speed):
         return self._driver.swipe(x1, y1, x2, y2, speed)
 
+    @action
     def swipe_ext(self, direction, scale=0.3):
         if direction == SwipeDirection.LEFT :
             self._driver.swipe(0.5, 0.5, 0.5-scale, 0.5, 500)
@@ -66,6 +81,7 @@ class H2(Automator):
         elif direction == SwipeDirection.DOWN :
             self._driver.swipe(0.5, 0.5, 0.5, 0.5+scale, 500)
 
+    @action
     def input(self, node, text):
         id = node.attribute['id']
         if id:
@@ -74,18 +90,37 @@ class H2(Automator):
     def dump_hierarchy(self, device):
         return VHTParser._parse_hdc_json(self._driver.dump_hierarchy(), device)
 
-    def screenshot(self, path=''):
+    def screenshot(self, path='', raw=False):
         if isinstance(path, str):
-            _uuid = uuid.uuid4().hex
-            _tmp_path = f"_tmp_{_uuid}.jpeg"
-            from hmbot.utils.cv import read
-            img = read(self._driver.screenshot(_tmp_path))
+            # Buffered frames are decoded, so raw bytes always come from a capture
+            img = None if raw else self._fresh_frame()
+            if img is None:
+                img = self._grab_frame(raw)
             if path:
-                shutil.copyfile(_tmp_path, path)
-            os.remove(_tmp_path)
+                from hmbot.utils.cv import write
+                write(path, img)
             return img
         else:
             raise TypeError('expected an str, not %s' % type(path).__name__)
+
+    def _grab_frame(self, raw=False):
+        _tmp_path = f"_tmp_{uuid.uuid4().hex}.jpeg"
+        self._driver.screenshot(_tmp_path)
+        if raw:
+            with open(_tmp_path, 'rb') as f:
+                img = f.read()
+        else:
+            from hmbot.utils.cv import read
+            img = read(_tmp_path)
+        os.remove(_tmp_path)
+        return img
+
+    def stream_frames(self, capacity=4, interval=0.1):
+        """
+        Keep the newest screen frames in a ring buffer fed by a background stream.
+        """
+        from .frame import StreamFrameSource
+        self.attach_frame_source(StreamFrameSource(self._grab_frame, capacity, interval))
     
     # def display_size(self):
     #     return self._driver.display_size
@@ -93,21 +128,28 @@ class H2(Automator):
     # def display_rotation(self):
     #     return self._driver.display_rotation
 
-    def display_info(self, refresh=True):
-        if self._display_info is None or refresh:
-            info = self._driver.device_info
-            self._display_info = DisplayInfo(sdk=info.sdkVersion,
-                                             width=info.displaySize[0],
-                                             height=info.displaySize[1],
-                                             rotation=info.displayRotation)
-        return self._display_info
+    def display_info(self, refresh=False):
+        return self._display.get(self._fetch_display_info, refresh)
+
+    def _fetch_display_info(self):
+        info = self._driver.device_info
+        return DisplayInfo(sdk=info.sdkVersion,
+                           width=info.displaySize[0],
+                           height=info.displaySize[1],
+                           rotation=info.displayRotation)
+
+    def _display_state(self):
+        return self._driver.display_rotation, self._driver.display_size
 
+    @action
     def home(self):
         self._driver.go_home()
 
+    @action
     def back(self):
         self._driver.go_back()
 
+    @action
     def recent(self):
         self._driver.swipe(0.5, 2710/2720, 0.5, 2400/2720, 500)
 
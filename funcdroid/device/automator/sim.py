@@ -0,0 +1,109 @@
+from .automator import Automator, action
+from hmbot.device.simulator import Recording
+from hmbot.utils.proto import DisplayInfo, DisplayRotation
+from loguru import logger
+import cv2
+
+
+class SimAutomator(Automator):
+    """
+    The automator of a simulated device, acting on the recording its serial points to.
+    """
+    def __init__(self, device):
+        self._serial = device.serial
+        self.recording = Recording.of(self._serial)
+        logger.debug("simulator is connected to recording:%s" % (self._serial))
+
+    def install_app(self, app):
+        pass
+
+    def uninstall_app(self, app):
+        pass
+
+    @action
+    def start_app(self, app):
+        self.recording.launch()
+
+    @action
+    def stop_app(self, app):
+        self.recording.stop()
+
+    def restart_app(self, app):
+        self.stop_app(app)
+        self.start_app(app)
+
+    def clear_app(self, app):
+        self.recording.stop()
+
+    @action
+    def restart_app_by_bundle(self, bundle):
+        self.recording.launch()
+
+    @action
+    def click(self, x, y):
+        if x < 1 and y < 1:
+            x = x * self.recording.width
+            y = y * self.recording.height
+        return self.recording.tap(x, y)
+
+    @action
+    def long_click(self, x, y):
+        return self.click(x, y)
+
+    @action
+    def drag(self, x1, y1, x2, y2, speed=2000):
+        pass
+
+    @action
+    def swipe(self, x1, y1, x2, y2, speed=2000):
+        pass
+
+    def swipe_ext(self, direction, scale=0.4):
+        # Recordings hold no scrolled states, a swipe leaves the page as it is
+        pass
+
+    @action
+    def input(self, text):
+        self.recording.input(text)
+
+    def dump_hierarchy(self, device):
+        return self.recording.hierarchy(device)
+
+    def screenshot(self, path='', raw=False):
+        if isinstance(path, str):
+            # Buffered frames are decoded, so raw bytes always come from a capture
+            img = None if raw else self._fresh_frame()
+            if img is None:
+                img = self.recording.screenshot()
+                if raw:
+                    img = cv2.imencode('.jpeg', img)[1].tobytes()
+            if path:
+                from hmbot.utils.cv import write
+                write(path, img)
+            return img
+        else:
+            raise TypeError('expected an str, not %s' % type(path).__name__)
+
+    def display_info(self, refresh=False):
+        return DisplayInfo(sdk='simulated',
+                           width=self.recording.width,
+                           height=self.recording.height,
+                           rotation=DisplayRotation.ROTATION_0)
+
+    @action
+    def home(self):
+        self.recording.stop()
+
+    @action
+    def back(self):
+        self.recording.back()
+
+    @action
+    def recent(self):
+        pass
+
+    def hop(self, dst_device_name=None, app_name=None):
+        return False
+
+    def identify(self, node):
+        return node
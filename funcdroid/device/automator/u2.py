@@ -1,5 +1,8 @@
-from .automator import Automator
+from .automator import Automator, action
+from .display import DisplayCache
+from .watchdog import Watchdog
 from hmbot.model.vht import VHTParser, VHT, VHTNode
+from hmbot.model.array_vht import ArrayVHT
 from hmbot.utils.proto import SwipeDirection, DisplayInfo, DisplayRotation, SystemKey
 from hmbot.app.app import App
 from loguru import logger
@@ -10,8 +13,18 @@ import time
 class U2(Automator):
     def __init__(self, device):
         self._serial = device.serial
-        self._driver = uiautomator2.connect(self._serial)
-        self._display_info = None
+        self.watchdog = Watchdog(lambda: uiautomator2.connect(self._serial), self._serial,
+                                 actions=('click', 'long_click', 'swipe', 'drag', 'press', 'send_keys',
+                                          'app_start', 'app_stop', 'app_clear', 'app_install'),
+                                 deadlines={'app_install': 600, 'dump_hierarchy': 60})
+        self.watchdog.start_heartbeat(lambda driver: driver.info)
+        self._driver = self.watchdog.proxy()
+        self.incremental = True
+        # Keep hierarchies as arrays (ArrayVHT), nodes are built only for query results
+        self.array_vht = False
+        self._last_vht = None
+        self._display = DisplayCache.of(self._serial)
+        self._display.watch(self._display_state)
         logger.debug("uiautomator2 is connected to device:%s" %(self._serial))
 
     def install_app(self, app):
@@ -27,12 +40,14 @@ class U2(Automator):
         # else:
         #     raise TypeError('expected an App, not %s' % type(app).__name__)
 
+    @action
     def start_app(self, app):
         if isinstance(app, App):
             self._driver.app_start(app.package_name)
         else:
             raise TypeError('expected an App, not %s' % type(app).__name__)
 
+    @action
     def stop_app(self, app):
         if isinstance(app, App):
             self._driver.app_stop(app.package_name)
@@ -49,26 +64,30 @@ class U2(Automator):
         else:
             raise TypeError('expected an App, not %s' % type(app).__name__)
 
+    @action
     def restart_app_by_bundle(self, bundle):
         self._driver.app_stop(bundle)
         self._driver.app_start(bundle)
 
+    @action
     def click(self, x, y):
-        self.display_info(refresh=True)
-        width = self._display_info.width
-        height = self._display_info.height
+        display_info = self.display_info()
+        width = display_info.width
+        height = display_info.height
         if x < 1 and y < 1:
             x = x * width
             y = y * height
         return self._driver.click(x, y)
 
+    @action
     def long_click(self, x, y):
         return self._driver.long_click(x, y, 1.5)
 
+    @action
     def drag(self, x1, y1, x2, y2, duration=0.5):
-        self.display_info(refresh=True)
-        width = self._display_info.width
-        height = self._display_info.height
+        display_info = self.display_info()
+        width = display_info.width
+        height = display_info.height
         if x1 < 1 and y1 < 1:
             x1 = x1*width
             y1 = y1*height
@@ -77,15 +96,17 @@ class U2(Automator):
             y2 = y2*height
         return self._driver.drag(x1, y1, x2, y2, duration)
 
+    @action
     def swipe(self, x1, y1, x2, y2, duration=0.5):
         if x1 < 1 and y1 < 1 and x2 < 1 and y2 < 1:
-            self.display_info(refresh=True)
-            width = self._display_info.width
-            height = self._display_info.height
+            display_info = self.display_info()
+            width = display_info.width
+            height = display_info.height
             return self._driver.swipe(x1 * width, y1 * height, x2 * width, y2 * height, duration)
         else:
             return self._driver.swipe(x1, y1, x2, y2, duration)
 
+    @action
     def swipe_ext(self, direction, scale=0.4):
         if direction == SwipeDirection.LEFT :
             self.swipe(0.5, 0.5, 0.5-scale, 0.5)
@@ -109,42 +130,70 @@ class U2(Automator):
     #         except uiautomator2.UiObjectNotFoundError:
     #             self.identify(node=node, type='android.widget.AutoCompleteTextView', enabled="true", focused="true").set_text(text)
 
+    @action
     def input(self, text):
         self._driver.send_keys(text, True)
 
     def dump_hierarchy(self, device):
-        root = VHTParser._parse_adb_xml(self._driver.dump_hierarchy(compressed=False), device)._root
+        if self.array_vht:
+            return ArrayVHT.from_adb_xml(self._driver.dump_hierarchy(compressed=False), device)
+        # Unchanged subtrees are shared with the previous dump (after parsing), so diff() skips them
+        previous = self._last_vht if self.incremental else None
+        root = VHTParser._parse_adb_xml(self._driver.dump_hierarchy(compressed=False), device, previous)._root
         # root_child = max(root._children, key=lambda child:
         #     (child.attribute['bounds'][1][0] - child.attribute['bounds'][0][0]) * (child.attribute['bounds'][1][1] - child.attribute['bounds'][0][1]))
         # root_child.attribute['type'] = 'root'
         # root_child.attribute['page'] = self._current()['activity']
-        return VHT(root)
+        self._last_vht = VHT(root)
+        return self._last_vht
 
-    def screenshot(self, path=''):
-        img = self._driver.screenshot(format='opencv')
+    def screenshot(self, path='', raw=False):
         if isinstance(path, str):
+            # Buffered frames are decoded, so raw bytes always come from a capture
+            img = None if raw else self._fresh_frame()
+            if img is None:
+                img = self._grab_frame(raw)
             if path:
-                from ..cv import write
+                from hmbot.utils.cv import write
                 write(path, img)
             return img
         else:
             raise TypeError('expected an str, not %s' % type(path).__name__)
+
+    def _grab_frame(self, raw=False):
+        # format='raw' keeps the JPEG bytes encoded by the device
+        return self._driver.screenshot(format='raw' if raw else 'opencv')
+
+    def stream_frames(self, capacity=4, interval=0.1):
+        """
+        Keep the newest screen frames in a ring buffer fed by a background stream.
+        """
+        from .frame import StreamFrameSource
+        self.attach_frame_source(StreamFrameSource(self._grab_frame, capacity, interval))
     
-    def display_info(self, refresh=True):
-        if self._display_info is None or refresh:
-            info = self._driver.info
-            self._display_info = DisplayInfo(sdk=info['sdkInt'],
-                                             width=info['displayWidth'],
-                                             height=info['displayHeight'],
-                                             rotation=info['displayRotation'])
-        return self._display_info
+    def display_info(self, refresh=False):
+        return self._display.get(self._fetch_display_info, refresh)
+
+    def _fetch_display_info(self):
+        info = self._driver.info
+        return DisplayInfo(sdk=info['sdkInt'],
+                           width=info['displayWidth'],
+                           height=info['displayHeight'],
+                           rotation=info['displayRotation'])
+
+    def _display_state(self):
+        # `dumpsys window displays` is far lighter than `dumpsys input` for a periodic probe
+        return self._driver.shell('wm size; dumpsys window displays | grep mCurrentRotation').output
 
+    @action
     def home(self):
         self._driver.press(SystemKey.HOME)
 
+    @action
     def back(self):
         self._driver.press(SystemKey.BACK)
 
+    @action
     def recent(self):
         self._driver.press(SystemKey.RECENT)
 
@@ -0,0 +1,178 @@
+from hmbot.utils.exception import RPCTimeoutError
+from hmbot.utils.proto import Incident
+from collections import deque
+from loguru import logger
+import threading
+import time
+
+
+class Watchdog(object):
+    """
+    Guards the RPC driver (uiautomator2 or hmdriver2) of one device.
+
+    Every driver call runs against a deadline. A call that hangs or fails marks the session
+    as broken: the driver is reconnected with a bounded backoff and, unless the call was an
+    action that may already have reached the device, the call is retried on the new session.
+    An action that timed out returns None; any other call raises RPCTimeoutError once its
+    retries are exhausted.
+    Every incident is logged and kept in `incidents`.
+    """
+    def __init__(self, connect, serial, actions=(), deadline=30, deadlines=None,
+                 retries=2, backoff=1, max_backoff=30, reconnects=5):
+        """
+        Args:
+            connect (callable): Returns a freshly connected driver.
+            serial (str): The serial of device.
+            actions (iterable): Names of driver calls that change the device; they are not re-issued after a timeout.
+            deadline (float): Seconds a driver call may take.
+            deadlines (dict): Per-call deadlines overriding `deadline`, e.g. {'app_install': 600}.
+            retries (int): How many times a failed call is retried on a new session.
+            backoff (float): Seconds to wait before the first reconnection attempt, doubled on every failure.
+            max_backoff (float): Upper bound of the backoff.
+            reconnects (int): Connection attempts before the device is given up.
+        """
+        self.serial = serial
+        self._connect = connect
+        self.actions = set(actions)
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reconnects = reconnects
+        self.incidents = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._last_call = time.time()
+        self._heartbeat = None
+        self._stopped = threading.Event()
+        self.driver = connect()
+
+    def proxy(self):
+        return _DriverProxy(self)
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        Run func(driver, *args, **kwargs) under the deadline of `name`, recovering a broken session.
+        """
+        deadline = self.deadlines.get(name, self.deadline)
+        attempt = 0
+        while True:
+            generation = self._generation
+            self._last_call = time.time()
+            try:
+                return self._run(func, self.driver, deadline, args, kwargs)
+            except TimeoutError as e:
+                (kind, detail, error) = ('timeout', str(e), e)
+            except Exception as e:
+                if not self._is_connection_error(e):
+                    raise
+                (kind, detail, error) = ('error', '%s: %s' % (type(e).__name__, e), e)
+            unsafe = kind == 'timeout' and name in self.actions
+            self._record(name, kind, detail)
+            self._recover(generation)
+            if unsafe:
+                # The action may have reached the device, its caller verifies the resulting page
+                logger.warning('%s on device:%s is not re-issued after %s' % (name, self.serial, kind))
+                return None
+            if attempt >= self.retries:
+                # A read has no sensible fallback value, its caller must not go on with None
+                raise RPCTimeoutError('%s on device:%s failed %d times' % (name, self.serial, attempt + 1)) from error
+            attempt += 1
+
+    @staticmethod
+    def _run(func, driver, deadline, args, kwargs):
+        result = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                result['value'] = func(driver, *args, **kwargs)
+            except BaseException as e:
+                result['error'] = e
+            finally:
+                done.set()
+
+        # A hung RPC cannot be interrupted, its thread is abandoned as a daemon
+        threading.Thread(target=target, daemon=True).start()
+        if not done.wait(deadline):
+            raise TimeoutError('no answer after %ss' % deadline)
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    @staticmethod
+    def _is_connection_error(e):
+        # Errors of the RPC transport itself; errors about the UI (e.g. a missing widget) pass through
+        if isinstance(e, (ConnectionError, TimeoutError, EOFError)):
+            return True
+        name = type(e).__name__
+        return any(key in name for key in ('Connection', 'Timeout', 'RPC', 'Rpc', 'Gateway', 'HTTPError'))
+
+    def _record(self, name, kind, detail, recovered=True):
+        incident = Incident(ts=time.time(), serial=self.serial, call=name, kind=kind, detail=detail, recovered=recovered)
+        self.incidents.append(incident)
+        logger.warning('driver %s of device:%s on %s: %s' % (kind, self.serial, name, detail))
+
+    def _recover(self, generation):
+        with self._lock:
+            if generation != self._generation:
+                # Another thread already reconnected after the same failure
+                return
+            delay = self.backoff
+            for attempt in range(1, self.reconnects + 1):
+                try:
+                    self.driver = self._run(lambda _: self._connect(), None, self.deadline, (), {})
+                    self._generation += 1
+                    logger.info('driver of device:%s reconnected (attempt %d)' % (self.serial, attempt))
+                    return
+                except Exception as e:
+                    logger.warning('reconnecting device:%s failed (attempt %d): %s' % (self.serial, attempt, e))
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+            self._record('connect', 'lost', 'gave up after %d attempts' % self.reconnects, recovered=False)
+            raise RPCTimeoutError('driver of device:%s cannot be reconnected' % self.serial)
+
+    def start_heartbeat(self, probe, interval=60):
+        """
+        Probe an idle session periodically, so a hung session is recovered before the next real call.
+
+        Args:
+            probe (callable): A cheap read-only call taking the driver.
+            interval (float): Seconds without driver calls before a probe is sent.
+        """
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=self._beat, args=(probe, interval), daemon=True)
+        self._heartbeat.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self, probe, interval):
+        while not self._stopped.wait(interval / 2):
+            if time.time() - self._last_call < interval:
+                continue
+            try:
+                self.call('heartbeat', probe)
+            except Exception as e:
+                logger.debug('heartbeat of device:%s failed: %s' % (self.serial, e))
+
+
+class _DriverProxy(object):
+    """
+    Stands in for the driver: attribute reads and method calls go through the watchdog.
+    """
+    def __init__(self, watchdog):
+        self._watchdog = watchdog
+
+    def __getattr__(self, name):
+        watchdog = self._watchdog
+        if callable(getattr(type(watchdog.driver), name, None)):
+            return lambda *args, **kwargs: watchdog.call(name, lambda driver: getattr(driver, name)(*args, **kwargs))
+        # Properties such as u2's `info` run an RPC when read
+        return watchdog.call(name, lambda driver: getattr(driver, name))
+
+    def __call__(self, *args, **kwargs):
+        return self._watchdog.driver(*args, **kwargs)
@@ -1,6 +1,7 @@
 from .connector import Connector
 from hmbot.utils.exception import DeviceError, ADBError
-from hmbot.utils.proto import PageInfo, Resource, AudioInfo, AudioType, Status, CameraInfo, CameraType
+from hmbot.utils.proto import Transport, PageInfo, Resource, AudioInfo, AudioType, Status, CameraInfo, CameraType
+from .transport import get_session
 from loguru import logger
 import subprocess
 import re
@@ -12,13 +13,23 @@ except ImportError:
 
 
 class ADB(Connector):
-    def __init__(self, device=None):
+    _resumed_re = re.compile(r'_set_resumed_activity.*?: \[\d+,([^/,\]]+)/([^,\]]+)')
+
+    def __init__(self, device=None, transport=Transport.SUBPROCESS):
         from hmbot.device.device import Device
         if isinstance(device, Device):
             self.serial = device.serial
         else:
             raise DeviceError
         self.cmd_prefix = ['adb', "-s", device.serial]
+        self.transport = Transport(transport)
+        self._session = get_session('adb', self.serial) if self.transport == Transport.PERSISTENT else None
+        self._resource_cache = {}
+        self.resource_ttl = 2.0
+        self._watcher = None
+        self._crash_monitor = None
+        self._event_hub = None
+        self._event_source = None
         self.info = self.page_info()
 
     def run_cmd(self, extra_args):
@@ -29,6 +40,9 @@ class ADB(Connector):
             logger.warning(msg)
             raise ADBError(msg)
 
+        if self._session and extra_args and extra_args[0] == 'shell':
+            return self._session_shell(' '.join(extra_args[1:]))
+
         args = [] + self.cmd_prefix
         args += extra_args
 
@@ -59,6 +73,10 @@ class ADB(Connector):
             logger.warning(msg)
             raise ADBError(msg)
 
+        if self._session:
+            _, out = self._session.shell(' '.join([quote(arg) for arg in extra_args]))
+            return self._grep_lines(out, grep_args)
+
         args = self.cmd_prefix + ['shell'] + [quote(arg) for arg in extra_args]
         grep_args = ['grep'] + [quote(arg) for arg in grep_args]
 
@@ -77,6 +95,38 @@ class ADB(Connector):
         return [s for s in shell_out if grep_args in s]
 
     def page_info(self):
+        if self._watcher is not None and self._watcher.alive:
+            self.info = self._watcher.info
+            return self.info
+        return self._poll_page_info()
+
+    def _watch_args(self):
+        # ActivityManager event log: [user, package/activity, reason]; input_focus follows
+        # the focused window, which also changes for dialogs and popups
+        return self.cmd_prefix + ['logcat', '-b', 'events', '-v', 'brief', '-T', '1',
+                                  'wm_set_resumed_activity:I', 'am_set_resumed_activity:I', 'input_focus:I', '*:S']
+
+    def _crash_args(self):
+        return self.cmd_prefix + ['logcat', '-v', 'threadtime', '-b', 'crash,main,system', '-T', '1',
+                                  'AndroidRuntime:E', 'ActivityManager:E', 'ACRA:E', '*:S']
+
+    def _event_source_for(self, hub):
+        from .events import AccessibilityStream
+        return AccessibilityStream(self.cmd_prefix + ['shell', 'uiautomator', 'events'], hub, self.serial)
+
+    def _parse_watch_line(self, line):
+        if 'input_focus' in line:
+            # Re-polled, so a focused dialog is reported as PopupWindow as by _poll_page_info()
+            return True
+        match = self._resumed_re.search(line)
+        if not match:
+            return None
+        bundle, ability = match.groups()
+        if ability.startswith('.'):
+            ability = bundle + ability
+        return PageInfo(bundle=bundle, ability=ability, name=ability)
+
+    def _poll_page_info(self):
         focus_lines = self.shell_grep("dumpsys window", "mCurrentFocus").splitlines()
         infos_re = re.compile(".*u0 (.*)/(.*)}")
         if len(focus_lines) > 0:
@@ -93,6 +143,43 @@ class ADB(Connector):
                     return self.info
         return None
 
+    def _data_prefix(self, bundle):
+        # run-as works for debuggable apps, otherwise the device must be rooted
+        (run_as, su) = self.batch_shell(['run-as %s true' % bundle, 'su 0 true'])
+        if run_as.returncode == 0:
+            return ['run-as', bundle], False
+        if su.returncode == 0:
+            return ['su', '0'], True
+        raise ADBError('cannot access the data of %s: app is not debuggable and device is not rooted' % bundle)
+
+    def checkpoint_app(self, bundle, archive):
+        (prefix, _) = self._data_prefix(bundle)
+        self.shell('am force-stop %s' % bundle)
+        args = self.cmd_prefix + ['exec-out'] + prefix + \
+            ['tar', '-cf', '-', '-C', '/data/data/%s' % bundle,
+             '--exclude=./lib', '--exclude=./cache', '--exclude=./code_cache', '.']
+        with open(archive, 'wb') as f:
+            subprocess.run(args, stdout=f, check=True)
+
+    def restore_app(self, bundle, archive):
+        (prefix, root) = self._data_prefix(bundle)
+        data_dir = '/data/data/%s' % bundle
+        self.shell('am force-stop %s' % bundle)
+        self.shell("%s sh -c 'cd %s && find . -mindepth 1 -maxdepth 1 ! -name lib -exec rm -rf {} +'"
+                   % (' '.join(prefix), data_dir))
+        with open(archive, 'rb') as f:
+            subprocess.run(self.cmd_prefix + ['exec-in'] + prefix + ['tar', '-xf', '-', '-C', data_dir],
+                           stdin=f, check=True)
+        if root:
+            # Files extracted by root keep their owner but need the app's SELinux label
+            self.shell('su 0 restorecon -R %s' % data_dir)
+
+    def start_ability(self, bundle, ability):
+        self.shell('am start -n %s/%s' % (bundle, ability))
+
+    def is_installed(self, bundle):
+        return 'package:' in self.shell('pm path %s' % bundle)
+
     def get_uid(self, bundle=None):
         if not bundle:
             if not self.info:
@@ -113,8 +200,8 @@ class ADB(Connector):
             if not self.info:
                 return Resource(None, None)
             bundle = self.info.bundle
-        return Resource(audio=self.get_audio(bundle),
-                        camera=self.get_camera(bundle))
+        return self._cached_resources(bundle, lambda: Resource(audio=self.get_audio(bundle),
+                                                               camera=self.get_camera(bundle)))
 
     def get_audio(self, bundle=None):
         return AudioInfo(type=AudioType.MUSIC, stat=Status.STOPPED)
@@ -1,11 +1,23 @@
 from abc import ABC, abstractmethod
+from hmbot.utils.proto import Transport, ShellResult
+import subprocess
+import time
+import uuid
 
 class Connector(ABC):
     """
     this interface describes a connector (ADB or HDC)
     """
     @abstractmethod
-    def __init__(self, device=None):
+    def __init__(self, device=None, transport=Transport.SUBPROCESS):
+        """
+        Initialize a connector
+
+        Args:
+            device (Device): The device to connect.
+            transport (Transport): SUBPROCESS launches a host process per command,
+            PERSISTENT multiplexes shell-commands over a long-lived connection per serial.
+        """
         pass
 
     @abstractmethod
@@ -58,6 +70,122 @@ class Connector(ABC):
         """
         pass
 
+    def watch(self):
+        """
+        Start following activity transitions in the background, page_info() then reads
+        the always-current page info of the watcher instead of querying the device.
+
+        Returns:
+            ActivityWatcher: The watcher of the device.
+        """
+        from .watcher import ActivityWatcher
+        if self._watcher is None:
+            self._watcher = ActivityWatcher(self, self._watch_args(), self._parse_watch_line)
+        self._watcher.start()
+        return self._watcher
+
+    def unwatch(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def monitor_crashes(self, bundle=None):
+        """
+        Start reporting crashes and ANRs of an app from the device log in the background.
+
+        Args:
+            bundle (str): The bundle name of the app, all apps if None.
+
+        Returns:
+            CrashMonitor: The crash monitor of the device.
+        """
+        from .crash import CrashMonitor
+        if self._crash_monitor is None:
+            self._crash_monitor = CrashMonitor(self._crash_args(), self.serial, bundle)
+        self._crash_monitor.start()
+        return self._crash_monitor
+
+    def _crash_args(self):
+        """
+        Returns:
+            list: The host command streaming crash and ANR logs of the device.
+        """
+        raise NotImplementedError
+
+    def events(self):
+        """
+        Start streaming UI events (window and content changes, toasts) of the device in the background.
+
+        Returns:
+            EventHub: The event hub of the device, see EventHub.subscribe() and EventHub.wait_for().
+        """
+        from .events import EventHub
+        if self._event_hub is None:
+            hub = EventHub()
+            self._event_source = self._event_source_for(hub)
+            self._event_hub = hub
+        self._event_source.start()
+        return self._event_hub
+
+    def stop_events(self):
+        if self._event_hub is not None:
+            self._event_source.stop()
+            (self._event_hub, self._event_source) = (None, None)
+
+    def _event_source_for(self, hub):
+        """
+        Returns:
+            The source publishing the UI events of the device to hub, with start() and stop().
+        """
+        raise NotImplementedError
+
+    def _watch_args(self):
+        """
+        Returns:
+            list: The host command streaming activity transitions of the device.
+        """
+        raise NotImplementedError
+
+    def _parse_watch_line(self, line):
+        """
+        Returns:
+            PageInfo or True or None: the new page info, True if it must be re-polled, None if irrelevant.
+        """
+        raise NotImplementedError
+
+    def checkpoint_app(self, bundle, archive):
+        """
+        Stop an app and save its private data directory into a tar archive on the host.
+
+        Args:
+            bundle (str): The bundle name of the app.
+            archive (str): The host path of the archive to write.
+        """
+        raise NotImplementedError
+
+    def restore_app(self, bundle, archive):
+        """
+        Stop an app and replace its private data directory with a saved archive.
+
+        Args:
+            bundle (str): The bundle name of the app.
+            archive (str): The host path of an archive written by checkpoint_app().
+        """
+        raise NotImplementedError
+
+    def start_ability(self, bundle, ability):
+        """
+        Launch an ability (activity) of an app directly.
+        """
+        raise NotImplementedError
+
+    def is_installed(self, bundle):
+        """
+        Returns:
+            bool: True if an app with the bundle name is installed on the device.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_resources(self, bundle):
         """
@@ -91,4 +219,83 @@ class Connector(ABC):
         """
         pass
 
+    def batch_shell(self, cmds):
+        """
+        Run several shell-commands in one round trip to the device.
+
+        Args:
+            cmds (list): shell-commands to run one after another.
+
+        Returns:
+            list: a ShellResult(command, returncode, output) for every command, in order.
+            A command that did not report back (e.g. the connection dropped) has returncode -1.
+        """
+        if not cmds:
+            return []
+        marker = '__hmbot_%s__' % uuid.uuid4().hex
+        script = ' ; '.join(["( %s ) </dev/null 2>&1 ; printf '\\n%s %%d\\n' $?" % (cmd, marker) for cmd in cmds])
+        out = self.shell(script)
+        results = []
+        lines = []
+        prefix = marker + ' '
+        for line in out.splitlines():
+            if line.startswith(prefix) and line[len(prefix):].isdigit():
+                if lines and lines[-1] == '':
+                    lines.pop()
+                results.append(ShellResult(command=cmds[len(results)],
+                                           returncode=int(line[len(prefix):]),
+                                           output='\n'.join(lines)))
+                lines = []
+                if len(results) == len(cmds):
+                    break
+            else:
+                lines.append(line)
+        for cmd in cmds[len(results):]:
+            results.append(ShellResult(command=cmd, returncode=-1, output=''))
+        return results
+
+    def _cached_resources(self, bundle, probe):
+        """
+        Return the Resource of a bundle probed within the last `resource_ttl` seconds, probing again otherwise.
 
+        Args:
+            bundle (str): bundle name of the app.
+            probe (callable): probes the device and returns a fresh Resource.
+        """
+        now = time.time()
+        cached = self._resource_cache.get(bundle)
+        if cached is not None and now - cached[0] < self.resource_ttl:
+            return cached[1]
+        rsc = probe()
+        self._resource_cache[bundle] = (now, rsc)
+        return rsc
+
+    def _session_shell(self, cmd):
+        """
+        Run a shell-command over the persistent session of the connector.
+
+        Raises:
+            subprocess.CalledProcessError: the command exits with non-zero, same as the subprocess path.
+        """
+        returncode, out = self._session.shell(cmd)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, out)
+        return out.strip()
+
+    @staticmethod
+    def _grep_lines(shell_out, grep_args):
+        """
+        Filter the output of a shell-command in-process, like a fixed-string `grep`.
+
+        Args:
+            shell_out (str): output of a shell-command.
+            grep_args (list): arguments of grep, options are ignored.
+
+        Returns:
+            str: the matched lines.
+        """
+        patterns = [arg for arg in grep_args if not arg.startswith('-')]
+        if not patterns:
+            return shell_out
+        pattern = patterns[0]
+        return '\n'.join([line for line in shell_out.splitlines() if pattern in line])
@@ -0,0 +1,168 @@
+from .watcher import LineWatcher
+from hmbot.utils.proto import Crash
+from loguru import logger
+import hashlib
+import threading
+import time
+import re
+
+
+class CrashMonitor(LineWatcher):
+    """
+    Follows the logcat of a device and reports app crashes (FATAL EXCEPTION, or an exception
+    caught by the ACRA crash reporter) and ANRs as they happen.
+
+    A stack trace is reduced to a signature (exception type and top frames, without line
+    numbers and generated names), so the same bug is reported once however often it recurs.
+    """
+    _line_re = re.compile(r'^\d\d-\d\d \d\d:\d\d:\d\d\.\d+\s+(\d+)\s+\d+\s+([VDIWEF])\s+(.*?)\s*: (.*)$')
+    _frame_re = re.compile(r'^\s*at\s+(\S+?)\(')
+    _noise_re = re.compile(r'\$\$Lambda\$[^.$(]*|\$[0-9a-f]{6,}|\$\d+|\d+')
+    _acra_re = re.compile(r'^ACRA caught an? \S+ for (\S+)')
+    # A crash ACRA passes on to the default handler is logged twice, once by each
+    duplicate_window = 5
+    # Lines after the last one of a trace are buffered so long; then the trace is complete
+    settle = 0.5
+
+    def __init__(self, args, serial, bundle=None, frames=5):
+        """
+        Args:
+            args (list): The host command streaming the logcat of the device.
+            serial (str): The serial of device, used in logs.
+            bundle (str): Only report crashes of this app (and its sub-processes); all apps if None.
+            frames (int): How many top stack frames make up a signature.
+        """
+        super().__init__(args, name='crash monitor of %s' % serial)
+        self.bundle = bundle
+        self.frames = frames
+        self.crashes = {}
+        self._events = []
+        self._pending = {}
+        # pid -> (signature, start) of the last crash reported for the process
+        self._last = {}
+        self._lock = threading.RLock()
+        self._callbacks = []
+
+    def start(self):
+        super().start()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def on_crash(self, callback):
+        """
+        Call callback(crash, first) for every reported crash; first is False for a known signature.
+        """
+        self._callbacks.append(callback)
+
+    def on_line(self, line):
+        m = self._line_re.match(line)
+        if not m:
+            return
+        (pid, level, tag, msg) = m.groups()
+        with self._lock:
+            if tag == 'AndroidRuntime':
+                if msg.startswith('FATAL EXCEPTION'):
+                    self._close(pid)
+                    self._pending[pid] = {'kind': 'crash', 'process': '', 'lines': [], 'start': time.time(), 'ts': time.time()}
+                elif pid in self._pending:
+                    record = self._pending[pid]
+                    if msg.startswith('Process: '):
+                        record['process'] = msg[len('Process: '):].split(',')[0].strip()
+                    else:
+                        record['lines'].append(msg)
+                    record['ts'] = time.time()
+            elif tag == 'ACRA' and level == 'E':
+                acra = self._acra_re.match(msg)
+                if acra:
+                    self._close(pid)
+                    self._pending[pid] = {'kind': 'crash', 'process': acra.group(1), 'lines': [],
+                                          'start': time.time(), 'ts': time.time()}
+                elif pid in self._pending and self._pending[pid]['kind'] == 'crash' \
+                        and (not self._pending[pid]['lines'] or msg[:1].isspace() or msg.startswith('Caused by: ')):
+                    # ACRA logs other errors around a trace, only the exception and its frames belong to it
+                    self._pending[pid]['lines'].append(msg)
+                    self._pending[pid]['ts'] = time.time()
+            elif tag == 'ActivityManager' and level == 'E':
+                if msg.startswith('ANR in '):
+                    process = msg[len('ANR in '):].split(' ')[0]
+                    self._close(pid)
+                    self._pending[pid] = {'kind': 'anr', 'process': process, 'lines': [], 'start': time.time(), 'ts': time.time()}
+                elif pid in self._pending and self._pending[pid]['kind'] == 'anr':
+                    self._pending[pid]['lines'].append(msg)
+                    self._pending[pid]['ts'] = time.time()
+
+    def flush(self):
+        """
+        Report the traces still being collected, e.g. after the logcat stream ended.
+        """
+        with self._lock:
+            for pid in list(self._pending):
+                self._close(pid)
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.settle):
+            with self._lock:
+                for pid in [pid for (pid, r) in self._pending.items() if time.time() - r['ts'] >= self.settle]:
+                    self._close(pid)
+
+    def _close(self, pid):
+        # Called with the lock held
+        record = self._pending.pop(pid, None)
+        if record is None or not record['lines']:
+            return
+        process = record['process']
+        if self.bundle and process != self.bundle and not process.startswith(self.bundle + ':'):
+            return
+        (exception, signature) = self.signature(record['kind'], record['lines'])
+        last = self._last.get(pid)
+        self._last[pid] = (signature, record['start'])
+        if last is not None and last[0] == signature and record['start'] - last[1] < self.duplicate_window:
+            return
+        first = signature not in self.crashes
+        if first:
+            crash = Crash(ts=record['start'], kind=record['kind'], process=process, exception=exception,
+                          signature=signature, trace='\n'.join(record['lines']), count=1)
+            self.crashes[signature] = crash
+            logger.warning('%s in %s: %s [%s]' % (record['kind'], process, exception, signature))
+        else:
+            crash = self.crashes[signature]
+            crash.count += 1
+        self._events.append((record['start'], crash))
+        for callback in self._callbacks:
+            try:
+                callback(crash, first)
+            except Exception as e:
+                logger.debug('%s callback failed: %s' % (self.name, e))
+
+    def signature(self, kind, lines):
+        """
+        Returns:
+            (str, str): The exception (or ANR reason) and the signature of a trace.
+        """
+        if kind == 'anr':
+            reason = next((line[len('Reason: '):] for line in lines if line.startswith('Reason: ')), lines[0])
+            key = 'anr|' + self._noise_re.sub('', reason)
+            return reason, hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+        # The innermost "Caused by" names the root cause, its frames follow it
+        start = 0
+        for (i, line) in enumerate(lines):
+            if line.startswith('Caused by: '):
+                start = i
+        head = lines[start][len('Caused by: '):] if lines[start].startswith('Caused by: ') else lines[start]
+        exception = head.split(':')[0].strip()
+        frames = []
+        for line in lines[start + 1:]:
+            m = self._frame_re.match(line)
+            if m:
+                frames.append(self._noise_re.sub('', m.group(1)))
+                if len(frames) >= self.frames:
+                    break
+        key = '|'.join([exception] + frames)
+        return head, hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+
+    def since(self, ts):
+        """
+        Returns:
+            list: The crashes (known signatures included) that happened after ts, oldest first.
+        """
+        with self._lock:
+            return [crash for (t, crash) in self._events if t > ts]
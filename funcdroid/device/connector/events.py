@@ -0,0 +1,211 @@
+from .watcher import LineWatcher
+from hmbot.utils.proto import UIEvent, UIEventType
+from collections import deque
+from queue import Queue, Empty, Full
+from loguru import logger
+import threading
+import time
+import re
+
+
+class Subscription(object):
+    """
+    A stream of UI events delivered after subscribing, usable as a blocking iterator.
+    """
+    def __init__(self, hub, types=None, maxsize=1024):
+        self._hub = hub
+        self.types = set(types) if types else None
+        self._queue = Queue(maxsize=maxsize)
+        self.closed = False
+
+    def _put(self, event):
+        if self.types is not None and event.type not in self.types:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            # A slow subscriber loses its oldest events rather than stalling the source
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                pass
+            self._queue.put_nowait(event)
+
+    def get(self, timeout=None):
+        """
+        Returns:
+            UIEvent: The next event, or None if none arrived within timeout.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def __iter__(self):
+        while not self.closed:
+            event = self.get(timeout=1)
+            if event is not None:
+                yield event
+
+    def close(self):
+        self.closed = True
+        self._hub._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EventHub(object):
+    """
+    Fans the UI events of one device out to subscribers and keeps the latest ones for queries.
+    """
+    def __init__(self, capacity=512):
+        """
+        Args:
+            capacity (int): How many of the latest events are kept for since() and wait_for().
+        """
+        self._recent = deque(maxlen=capacity)
+        self._subscriptions = []
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            self._recent.append(event)
+            for subscription in self._subscriptions:
+                subscription._put(event)
+            self._cond.notify_all()
+
+    def subscribe(self, types=None):
+        """
+        Args:
+            types (iterable): The UIEventTypes to deliver, all if None.
+
+        Returns:
+            Subscription: The stream of events published from now on.
+        """
+        subscription = Subscription(self, types)
+        with self._cond:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._cond:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def since(self, ts, types=None):
+        """
+        Returns:
+            list: The kept events of the given types that happened after ts, oldest first.
+        """
+        with self._cond:
+            return [e for e in self._recent if e.ts > ts and (types is None or e.type in types)]
+
+    def wait_for(self, types=None, since=None, timeout=5):
+        """
+        Wait for an event of the given types after `since` (default: now).
+
+        Returns:
+            UIEvent: The first such event, or None on timeout.
+        """
+        since = time.time() if since is None else since
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                for event in self._recent:
+                    if event.ts > since and (types is None or event.type in types):
+                        return event
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wait_for_quiet(self, quiet=0.5, timeout=5, types=None):
+        """
+        Wait until no event of the given types has been published for `quiet` seconds.
+
+        Returns:
+            bool: True if the UI went quiet before the deadline.
+        """
+        start = time.time()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                last = max([e.ts for e in self._recent if types is None or e.type in types] + [start])
+                now = time.time()
+                if now - last >= quiet:
+                    return True
+                if now >= deadline:
+                    return False
+                self._cond.wait(min(quiet - (now - last), deadline - now))
+
+
+class AccessibilityStream(LineWatcher):
+    """
+    Streams accessibility events of an Android device through `uiautomator events`.
+
+    `uiautomator events` holds the single UiAutomation connection of the device, so it
+    cannot run together with the uiautomator2 agent: U2 calls fail while the stream is open
+    (and the watchdog keeps reconnecting). Use it with automators that do not rely on
+    UiAutomation, or stop the stream before driving the device through U2.
+    """
+    _type_re = re.compile(r'EventType: (\w+)')
+    _field_res = {'package': re.compile(r'PackageName: ([^;]*)'),
+                  'class_name': re.compile(r'ClassName: ([^;]*)'),
+                  'text': re.compile(r'Text: \[([^\]]*)\]')}
+
+    def __init__(self, args, hub, serial):
+        super().__init__(args, name='accessibility stream of %s' % serial)
+        self.hub = hub
+
+    def on_line(self, line):
+        m = self._type_re.search(line)
+        if not m:
+            return
+        try:
+            event_type = UIEventType(m.group(1))
+        except ValueError:
+            return
+        fields = {}
+        for (key, field_re) in self._field_res.items():
+            fm = field_re.search(line)
+            fields[key] = fm.group(1).strip() if fm else ''
+        self.hub.publish(UIEvent(ts=time.time(), type=event_type, **fields))
+
+
+class SimulatedEventSource(object):
+    """
+    An event source driven by hand (or by a simulated device), standing in for a device in tests.
+    """
+    def __init__(self, hub):
+        self.hub = hub
+        self._timers = []
+
+    @property
+    def alive(self):
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def emit(self, type, package='', class_name='', text='', delay=0):
+        """
+        Publish an event now, or after `delay` seconds.
+        """
+        event_type = UIEventType(type)
+        if delay > 0:
+            timer = threading.Timer(delay, self.emit, args=(event_type, package, class_name, text))
+            timer.daemon = True
+            self._timers.append(timer)
+            timer.start()
+            return
+        logger.debug('simulated %s of %s' % (event_type.value, package))
+        self.hub.publish(UIEvent(ts=time.time(), type=event_type, package=package, class_name=class_name, text=text))
@@ -1,6 +1,7 @@
 from .connector import Connector
 from hmbot.utils.exception import DeviceError, HDCError
-from hmbot.utils.proto import PageInfo, Resource, AudioInfo, AudioType, CameraInfo, CameraType, Status
+from hmbot.utils.proto import Transport, PageInfo, Resource, AudioInfo, AudioType, CameraInfo, CameraType, Status
+from .transport import get_session
 from loguru import logger
 import subprocess, re
 
@@ -11,7 +12,7 @@ except ImportError:
 
 
 class HDC(Connector):
-    def __init__(self, device=None):
+    def __init__(self, device=None, transport=Transport.SUBPROCESS):
         if device is None and len(HDC.devices()) > 0:
             self.serial = HDC.devices()[0]
         from hmbot.device.device import Device
@@ -20,6 +21,14 @@ class HDC(Connector):
         else:
             raise DeviceError
         self.cmd_prefix = ['hdc', "-t", self.serial]
+        self.transport = Transport(transport)
+        self._session = get_session('hdc', self.serial) if self.transport == Transport.PERSISTENT else None
+        self._resource_cache = {}
+        self.resource_ttl = 2.0
+        self._watcher = None
+        self._crash_monitor = None
+        self._event_hub = None
+        self._event_source = None
         self.info = self.page_info()
 
     def run_cmd(self, extra_args):
@@ -30,6 +39,9 @@ class HDC(Connector):
             logger.warning(msg)
             raise HDCError(msg)
 
+        if self._session and extra_args and extra_args[0] == 'shell':
+            return self._session_shell(' '.join(extra_args[1:]))
+
         args = [] + self.cmd_prefix
         args += extra_args
 
@@ -68,6 +80,10 @@ class HDC(Connector):
             logger.warning(msg)
             raise HDCError(msg)
 
+        if self._session:
+            _, out = self._session.shell(' '.join([quote(arg) for arg in extra_args]))
+            return self._grep_lines(out, grep_args)
+
         args = self.cmd_prefix + ['shell'] + [quote(arg) for arg in extra_args]
         grep_args = ['grep'] + [quote(arg) for arg in grep_args]
 
@@ -82,6 +98,21 @@ class HDC(Connector):
         return out
 
     def page_info(self):
+        if self._watcher is not None and self._watcher.alive:
+            self.info = self._watcher.info
+            return self.info
+        return self._poll_page_info()
+
+    def _watch_args(self):
+        return self.cmd_prefix + ['shell', 'hilog', '-T', 'AbilityManagerService']
+
+    def _parse_watch_line(self, line):
+        # hilog does not carry the whole mission, re-poll the mission list on foreground changes
+        if 'foreground' in line.lower():
+            return True
+        return None
+
+    def _poll_page_info(self):
         missions = self._hidumper(ability='AbilityManagerService', extra_args='-l')
         missions = missions.split('}')
         infos_re = re.compile('.*app name \[(.*)\].*main name \[(.*)\].*bundle name \[(.*)\].*ability type.*',
@@ -106,70 +137,89 @@ class HDC(Connector):
         logger.debug('return: %s' % r)
         return r.splitlines()
 
-    def get_uid(self, bundle=None):
+    def _ps(self, bundle=None):
         if not bundle:
             if not self.info:
                 self.info = self.page_info()
             bundle = self.info.bundle
         ps_info = self.shell_grep("ps -ef", bundle).split()
         if len(ps_info) > 2:
-            return ps_info[0]
+            return ps_info[0], ps_info[1]
+        return None, None
+
+    def checkpoint_app(self, bundle, archive):
+        # App data lives in an encrypted el2 partition, only reachable on a rooted device
+        remote = '/data/local/tmp/%s.ckpt.tar' % bundle
+        self.shell('aa force-stop %s' % bundle)
+        out = self.shell('tar -cf %s -C /data/app/el2/100/base/%s . && echo ok' % (remote, bundle))
+        if not out.endswith('ok'):
+            raise HDCError('cannot checkpoint the data of %s: %s' % (bundle, out))
+        self.run_cmd(['file', 'recv', remote, archive])
+        self.shell('rm -f %s' % remote)
+
+    def restore_app(self, bundle, archive):
+        remote = '/data/local/tmp/%s.ckpt.tar' % bundle
+        data_dir = '/data/app/el2/100/base/%s' % bundle
+        self.shell('aa force-stop %s' % bundle)
+        self.run_cmd(['file', 'send', archive, remote])
+        out = self.shell('rm -rf %s/* && tar -xf %s -C %s && echo ok' % (data_dir, remote, data_dir))
+        self.shell('rm -f %s' % remote)
+        if not out.endswith('ok'):
+            raise HDCError('cannot restore the data of %s: %s' % (bundle, out))
+
+    def start_ability(self, bundle, ability):
+        self.shell('aa start -b %s -a %s' % (bundle, ability))
+
+    def is_installed(self, bundle):
+        # bm dump prints the bundle info as JSON, or an error for an unknown bundle
+        out = self.shell('bm dump -n %s' % bundle)
+        return bundle in out and not out.startswith('error')
+
+    def get_uid(self, bundle=None):
+        return self._ps(bundle)[0]
 
     def get_pid(self, bundle=None):
-        if not bundle:
-            if not self.info:
-                self.info = self.page_info()
-            bundle = self.info.bundle
-        ps_info = self.shell_grep("ps -ef", bundle).split()
-        if len(ps_info) > 2:
-            return ps_info[1]
+        return self._ps(bundle)[1]
 
     def get_resources(self, bundle=None):
         if not bundle:
             if not self.info:
                 self.info = self.page_info()
             bundle = self.info.bundle
-        return Resource(audio=self.get_audio(bundle),
-                        camera=self.get_camera(bundle))
+        return self._cached_resources(bundle, lambda: Resource(audio=self.get_audio(bundle),
+                                                               camera=self.get_camera(bundle)))
 
     def get_audio(self, bundle=None):
-        uid = self.get_uid(bundle)
-        pid = self.get_pid(bundle)
+        uid, pid = self._ps(bundle)
         # todo
         type = AudioType.MUSIC
 
-        session_id_infos = self.shell_grep("hidumper -s AudioDistributed", "sessionId").splitlines()
+        # Dump once and parse every field from the same buffer
+        audio_lines = self.shell("hidumper -s AudioDistributed").splitlines()
+        session_id_re = re.compile(f'.*sessionId: (\d+).*appUid: {uid}.*appPid: {pid}.*')
+        stream_id_re = re.compile('.*Stream Id: (\d+).*')
+        status_re = re.compile('.*Status:(.*)')
         session_id = 0
-        for session_id_info in session_id_infos:
-            session_id_info = session_id_info.strip()
-            session_id_re = re.compile(f'.*sessionId: (\d+).*appUid: {uid}.*appPid: {pid}.*')
-            match = session_id_re.match(session_id_info)
-            if match:
-                session_id = match.group(1)
-
-        stream_id_infos = self.shell_grep("hidumper -s AudioDistributed", "Stream").splitlines()
         stream_id_list = []
-        for stream_id_info in stream_id_infos:
-            stream_id_re = re.compile('.*Stream Id: (\d+).*')
-            match = stream_id_re.match(stream_id_info)
-            if match:
-                stream_id = match.groups()[0]
-                stream_id_list.append(stream_id)
-
-        status_infos = self.shell_grep("hidumper -s AudioDistributed", "Status").splitlines()
         status_list = []
-        for status_info in status_infos:
-            status_info = status_info.strip()
-            status_re = re.compile('.*Status:(.*)')
-            match = status_re.match(status_info)
-            if match:
-                status = match.groups()[0]
-                status_list.append(status)
+        for audio_line in audio_lines:
+            if 'sessionId' in audio_line:
+                match = session_id_re.match(audio_line.strip())
+                if match:
+                    session_id = match.group(1)
+            if 'Stream' in audio_line:
+                match = stream_id_re.match(audio_line)
+                if match:
+                    stream_id_list.append(match.groups()[0])
+            if 'Status' in audio_line:
+                match = status_re.match(audio_line.strip())
+                if match:
+                    status_list.append(match.groups()[0])
         status = ''
         for index, stream_id in enumerate(stream_id_list):
             if stream_id == session_id:
                 status = status_list[index]
-        print(f'status={status}')
+        logger.debug(f'status={status}')
         if status in ['RUNNING']:
             return AudioInfo(type, Status.RUNNING)
         return AudioInfo(type, Status.STOPPED)
@@ -0,0 +1,104 @@
+from .connector import Connector
+from hmbot.device.simulator import Recording
+from hmbot.utils.exception import DeviceError
+from hmbot.utils.proto import Transport, ShellResult, Resource, AudioInfo, AudioType, CameraInfo, CameraType, Status
+import json
+
+
+class SimConnector(Connector):
+    """
+    The connector of a simulated device; its serial is the path of a recorded exploration.
+    """
+    def __init__(self, device=None, transport=Transport.SUBPROCESS):
+        from hmbot.device.device import Device
+        if isinstance(device, Device):
+            self.serial = device.serial
+        else:
+            raise DeviceError
+        self.recording = Recording.of(self.serial)
+        self.transport = Transport(transport)
+        self._session = None
+        self._resource_cache = {}
+        self.resource_ttl = 2.0
+        self._watcher = None
+        self._crash_monitor = None
+        self._event_hub = None
+        self._event_source = None
+        # The state saved by the last restore_app(), resumed by start_ability()
+        self._restored = None
+        self.info = self.page_info()
+
+    def run_cmd(self, extra_args):
+        if isinstance(extra_args, list):
+            extra_args = ' '.join(extra_args)
+        if extra_args.startswith('shell '):
+            return self._simulate(extra_args[len('shell '):])
+        return ''
+
+    def shell(self, extra_args):
+        return self._simulate(extra_args)
+
+    def shell_grep(self, extra_args, grep_args):
+        if isinstance(extra_args, list):
+            extra_args = ' '.join(extra_args)
+        if isinstance(grep_args, str):
+            grep_args = grep_args.split()
+        return self._grep_lines(self._simulate(extra_args), grep_args)
+
+    def batch_shell(self, cmds):
+        return [ShellResult(command=cmd, returncode=0, output=self._simulate(cmd)) for cmd in cmds]
+
+    def _simulate(self, cmd):
+        # Only the queries the explorer relies on are answered, other commands succeed silently
+        if 'dumpsys window' in cmd:
+            info = self.page_info()
+            return '  mCurrentFocus=Window{0 u0 %s/%s}' % (info.bundle, info.ability)
+        return ''
+
+    def page_info(self):
+        return self.recording.info()
+
+    def _poll_page_info(self):
+        return self.recording.info()
+
+    def checkpoint_app(self, bundle, archive):
+        with open(archive, 'w', encoding='utf-8') as f:
+            json.dump(self.recording.state(), f)
+        self.recording.stop()
+
+    def restore_app(self, bundle, archive):
+        with open(archive, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.recording.stop()
+        self._restored = state
+
+    def start_ability(self, bundle, ability):
+        (state, self._restored) = (self._restored, None)
+        if state is not None and state.get('current') is not None:
+            self.recording.set_state(state)
+        else:
+            self.recording.launch()
+
+    def is_installed(self, bundle):
+        return bundle == self.recording.bundle
+
+    def _event_source_for(self, hub):
+        from .events import SimulatedEventSource
+        source = SimulatedEventSource(hub)
+        # The recording reports its own page transitions through the source
+        self.recording.events = source
+        return source
+
+    def stop_events(self):
+        super().stop_events()
+        self.recording.events = None
+
+    def get_resources(self, bundle=None):
+        return self._cached_resources(bundle or self.recording.bundle,
+                                      lambda: Resource(audio=self.get_audio(bundle), camera=self.get_camera(bundle)))
+
+    def get_audio(self, bundle=None):
+        return AudioInfo(type=AudioType.MUSIC, stat=Status.STOPPED)
+
+    def get_camera(self, bundle=None):
+        return CameraInfo(type=CameraType.REAR, stat=Status.STOPPED)
@@ -0,0 +1,160 @@
+from loguru import logger
+from queue import Queue, Empty
+import subprocess
+import threading
+import uuid
+
+
+class ShellSession(object):
+    """
+    A long-lived interactive shell on the device, multiplexing commands over one host process.
+
+    Every command is followed by a unique marker line carrying its exit code, so the output
+    of consecutive commands can be split apart without spawning a new process per call.
+    """
+    def __init__(self, args, timeout=30):
+        """
+        Args:
+            args (list): The host command that opens an interactive shell, e.g. ['hdc', '-t', serial, 'shell'].
+            timeout (float): Seconds to wait for a single command before the session is dropped.
+        """
+        self.args = args
+        self.timeout = timeout
+        self._marker = '__hmbot_%s__' % uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._proc = None
+        self._lines = None
+
+    def _open(self):
+        self._proc = subprocess.Popen(self.args,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT)
+        self._lines = Queue()
+        reader = threading.Thread(target=self._read, args=(self._proc, self._lines), daemon=True)
+        reader.start()
+        # Some shells allocate a pty: silence echo and prompt before the first real command
+        self._send("stty -echo 2>/dev/null; export PS1=''")
+        self._collect()
+
+    @staticmethod
+    def _read(proc, lines):
+        for line in iter(proc.stdout.readline, b''):
+            lines.put(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+        lines.put(None)
+
+    def _send(self, cmd):
+        script = "%s </dev/null 2>&1; printf '\\n%s %%d\\n' $?\n" % (cmd, self._marker)
+        self._proc.stdin.write(script.encode('utf-8'))
+        self._proc.stdin.flush()
+
+    def _collect(self):
+        out = []
+        prefix = self._marker + ' '
+        while True:
+            try:
+                line = self._lines.get(timeout=self.timeout)
+            except Empty:
+                self.close()
+                raise TimeoutError('shell session %s timed out' % self.args)
+            if line is None:
+                self.close()
+                raise ConnectionError('shell session %s closed' % self.args)
+            if line.startswith(prefix) and line[len(prefix):].isdigit():
+                if out and out[-1] == '':
+                    out.pop()
+                return int(line[len(prefix):]), '\n'.join(out)
+            out.append(line)
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def shell(self, cmd):
+        """
+        Run a shell-command in the session.
+
+        Args:
+            cmd (str): The command line to run on the device.
+
+        Returns:
+            (int, str): The exit code and the merged stdout/stderr of the command.
+        """
+        with self._lock:
+            if not self.alive:
+                self._open()
+            self._send(cmd)
+            return self._collect()
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+            except OSError:
+                pass
+            self._proc = None
+
+
+class AdbSession(object):
+    """
+    A long-lived adbutils handle to one device; shell-commands talk to the adb server
+    socket directly instead of launching an `adb` process per call.
+    """
+    def __init__(self, serial, timeout=30):
+        import adbutils
+        self.serial = serial
+        self.timeout = timeout
+        self._device = adbutils.adb.device(serial=serial)
+
+    @property
+    def alive(self):
+        return True
+
+    def shell(self, cmd):
+        """
+        Run a shell-command through the adb server.
+
+        Args:
+            cmd (str): The command line to run on the device.
+
+        Returns:
+            (int, str): The exit code and the output of the command.
+        """
+        r = self._device.shell2(cmd, timeout=self.timeout)
+        return r.returncode, r.output
+
+    def close(self):
+        pass
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(kind, serial):
+    """
+    Return the shared persistent session of a device, opening it on first use.
+
+    Args:
+        kind (str): 'adb' or 'hdc'.
+        serial (str): The serial of device.
+    """
+    with _sessions_lock:
+        session = _sessions.get((kind, serial))
+        if session is None:
+            if kind == 'adb':
+                session = AdbSession(serial)
+            elif kind == 'hdc':
+                session = ShellSession(['hdc', '-t', serial, 'shell'])
+            else:
+                raise ValueError('unknown session kind: %s' % kind)
+            _sessions[(kind, serial)] = session
+            logger.debug('opened %s session to device:%s' % (kind, serial))
+        return session
+
+
+def close_session(kind, serial):
+    with _sessions_lock:
+        session = _sessions.pop((kind, serial), None)
+    if session is not None:
+        session.close()
@@ -0,0 +1,148 @@
+from hmbot.utils.proto import Transition
+from collections import deque
+from loguru import logger
+import subprocess
+import threading
+import time
+
+
+class LineWatcher(object):
+    """
+    Follows the output of a long-running host command (e.g. `adb logcat`) line by line
+    in a daemon thread, restarting the command with a bounded backoff if it exits.
+    """
+    def __init__(self, args, name='watcher'):
+        """
+        Args:
+            args (list): The host command to follow.
+            name (str): Name used in logs.
+        """
+        self.args = args
+        self.name = name
+        self._proc = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive() \
+            and self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+            except OSError:
+                pass
+
+    def _run(self):
+        backoff = 1
+        while not self._stopped.is_set():
+            started = time.time()
+            try:
+                self._proc = subprocess.Popen(self.args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                for line in iter(self._proc.stdout.readline, b''):
+                    try:
+                        self.on_line(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                    except Exception as e:
+                        logger.debug('%s failed on line %r: %s' % (self.name, line, e))
+            except OSError as e:
+                logger.warning('%s cannot run %s: %s' % (self.name, self.args, e))
+            if self._stopped.is_set():
+                break
+            backoff = 1 if time.time() - started > 30 else min(backoff * 2, 30)
+            logger.debug('%s stream ended, restart in %ss' % (self.name, backoff))
+            self._stopped.wait(backoff)
+
+    def on_line(self, line):
+        raise NotImplementedError
+
+
+class ActivityWatcher(LineWatcher):
+    """
+    Keeps an always-current PageInfo of a device by following its activity transitions.
+    """
+    def __init__(self, connector, args, parse, capacity=256):
+        """
+        Args:
+            connector (Connector): The connector of the device, used to seed and re-poll the page info.
+            args (list): The host command streaming transitions.
+            parse (callable): Maps a streamed line to a PageInfo, to True if the page info
+            must be re-polled, or to None if the line is irrelevant.
+            capacity (int): How many of the latest transitions are kept.
+        """
+        super().__init__(args, name='activity watcher of %s' % connector.serial)
+        self._connector = connector
+        self._parse = parse
+        self._transitions = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._dirty = threading.Event()
+        self.info = connector._poll_page_info()
+
+    def start(self):
+        super().start()
+        threading.Thread(target=self._repoll, daemon=True).start()
+
+    def on_line(self, line):
+        r = self._parse(line)
+        if r is True:
+            self._dirty.set()
+        elif r is not None:
+            self._publish(r)
+
+    def _repoll(self):
+        # Coalesce bursts of re-poll requests into one poll
+        while not self._stopped.is_set():
+            if not self._dirty.wait(1):
+                continue
+            self._stopped.wait(0.2)
+            self._dirty.clear()
+            try:
+                self._publish(self._connector._poll_page_info())
+            except Exception as e:
+                logger.debug('%s failed to re-poll: %s' % (self.name, e))
+
+    def _publish(self, info, ts=None):
+        if info is None:
+            return
+        with self._cond:
+            if info == self.info:
+                return
+            self.info = info
+            self._transitions.append(Transition(ts=time.time() if ts is None else ts, info=info))
+            self._cond.notify_all()
+
+    def transitions(self, since=0):
+        """
+        Returns:
+            list: The kept transitions that happened after `since`, oldest first.
+        """
+        with self._cond:
+            return [t for t in self._transitions if t.ts > since]
+
+    def wait_for_transition(self, since=None, timeout=5):
+        """
+        Wait until a transition happens after `since` (default: now).
+
+        Returns:
+            Transition: The first such transition, or None on timeout.
+        """
+        since = time.time() if since is None else since
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                for t in self._transitions:
+                    if t.ts > since:
+                        return t
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
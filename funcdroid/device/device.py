@@ -1,29 +1,48 @@
+import os
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 from loguru import logger
 from ..utils.exception import*
-from ..utils.proto import SwipeDirection
+from ..utils.proto import SwipeDirection, Transport, CaptureMode, Checkpoint, UIEventType
 from ..utils.rfl.system_rfl import system_rfl
 from ..model.page import Page
 
+# UI events that change what is on screen
+_LAYOUT_EVENTS = (UIEventType.WINDOW_STATE_CHANGED, UIEventType.WINDOW_CONTENT_CHANGED, UIEventType.WINDOWS_CHANGED)
+
 class Device(object):
     """
     The class describes a connected device
     """
 
-    def __init__(self, device_serial, operating_system):
+    def __init__(self, device_serial, operating_system, transport=Transport.SUBPROCESS,
+                 capture=CaptureMode.SEQUENTIAL, raw_screenshot=False, probe_resources=True,
+                 precompute=False):
         """
         Initialize a device connection
         Args:
             device_serial (str): The serial of device.
             operating_system (str): The operating system of device.
+            transport (Transport): How the connector reaches the device, see Connector.
+            capture (CaptureMode): Whether dump_page runs its probes one after another or concurrently.
+            raw_screenshot (bool): Keep the JPEG bytes of the device in captured pages, decoding them only on demand.
+            probe_resources (bool): Probe the audio/camera resources in dump_page; off when no hardware goal is active.
+            precompute (bool): Compute the fingerprints of captured pages (image hash, structure hash, encoded
+                screenshot) in the background; otherwise each is computed when first read.
         """
         self.serial = device_serial
         self.operating_system = operating_system
+        self.capture = CaptureMode(capture)
+        self.raw_screenshot = raw_screenshot
+        self.probe_resources = probe_resources
+        self.precompute = precompute
+        self._capture_executor = None
         try:
             connector_cls, automator_cls = system_rfl[self.operating_system]
-            self.connector = connector_cls(self)
+            self.connector = connector_cls(self, transport=transport)
             self.automator = automator_cls(self)
         except OSKeyError:
             logger.error("%s is not supported" % operating_system)
@@ -57,6 +76,52 @@ class Device(object):
     def restart_app_by_bundle(self, bundle):
         self.automator.restart_app_by_bundle(bundle)
 
+    def checkpoint(self, bundle=None, archive=None):
+        """
+        Snapshot the private data of an app together with its foreground ability, so the app
+        can later be reset to this state without replaying the actions that led to it.
+        The app is stopped while its data is archived.
+
+        Args:
+            bundle (str): The bundle name of the app, defaults to the foreground app.
+            archive (str): The host path of the archive, defaults to a temporary file.
+
+        Returns:
+            Checkpoint: The saved state, to be passed to restore().
+        """
+        info = self.page_info()
+        if bundle is None:
+            bundle = info.bundle
+        if archive is None:
+            directory = os.path.join(tempfile.gettempdir(), 'hmbot-checkpoints', self.serial)
+            os.makedirs(directory, exist_ok=True)
+            archive = os.path.join(directory, '%s-%d.tar' % (bundle, time.time() * 1000))
+        self.connector.checkpoint_app(bundle, archive)
+        logger.debug("checkpoint of %s on device:%s saved to %s" % (bundle, self.serial, archive))
+        return Checkpoint(bundle=bundle, archive=archive,
+                          info=info if info and info.bundle == bundle else None, ts=time.time())
+
+    def restore(self, checkpoint, relaunch=True):
+        """
+        Reset an app to a checkpoint: replace its data and relaunch the ability that was in the foreground.
+
+        Args:
+            checkpoint (Checkpoint): A checkpoint returned by checkpoint().
+            relaunch (bool): Launch the app after restoring its data.
+        """
+        self.connector.restore_app(checkpoint.bundle, checkpoint.archive)
+        self.automator._acted()
+        if not relaunch:
+            return
+        if checkpoint.info is not None and checkpoint.info.ability:
+            try:
+                self.connector.start_ability(checkpoint.bundle, checkpoint.info.ability)
+                return
+            except Exception as e:
+                # e.g. the ability is not exported, fall back to the entry ability
+                logger.debug("cannot launch %s directly: %s" % (checkpoint.info.ability, e))
+        self.restart_app_by_bundle(checkpoint.bundle)
+
     def click(self, x, y):
         return self.automator.click(x, y)
 
@@ -88,8 +153,10 @@ class Device(object):
             device = self
         return self.automator.dump_hierarchy(device)
 
-    def screenshot(self, path=''):
-        return self.automator.screenshot(path)
+    def screenshot(self, path='', raw=None):
+        if raw is None:
+            raw = self.raw_screenshot
+        return self.automator.screenshot(path, raw)
 
     def home(self):
         self.automator.home()
@@ -102,18 +169,219 @@ class Device(object):
     
     def page_info(self):
         return self.connector.page_info()
+
+    def watch(self):
+        """
+        Follow activity transitions in a background watcher, so page_info() becomes a memory read.
+        """
+        return self.connector.watch()
+
+    def monitor_crashes(self, bundle=None):
+        """
+        Report crashes and ANRs of an app as they appear in the device log.
+
+        Returns:
+            CrashMonitor: The crash monitor, see CrashMonitor.since() and CrashMonitor.on_crash().
+        """
+        return self.connector.monitor_crashes(bundle)
+
+    def wait_for_transition(self, since=None, timeout=5):
+        """
+        Wait for the foreground page to change after `since` (default: now).
+
+        Returns:
+            Transition: The transition with its timestamp, or None on timeout or without a watcher.
+        """
+        watcher = self.connector._watcher
+        if watcher is None:
+            return None
+        return watcher.wait_for_transition(since, timeout)
     
-    def dump_page(self, device=None, refresh=False):
+    def incidents(self):
+        """
+        Returns:
+            list: The Incident records of hung or broken driver sessions, oldest first.
+        """
+        watchdog = getattr(self.automator, 'watchdog', None)
+        return list(watchdog.incidents) if watchdog is not None else []
+
+    def close(self):
+        """
+        Stop the background work of the device (watchers, event and frame streams, heartbeat).
+        """
+        self.connector.unwatch()
+        self.connector.stop_events()
+        if self.connector._crash_monitor is not None:
+            self.connector._crash_monitor.stop()
+            self.connector._crash_monitor = None
+        self.automator.detach_frame_source()
+        watchdog = getattr(self.automator, 'watchdog', None)
+        if watchdog is not None:
+            watchdog.stop()
+        if self._capture_executor is not None:
+            self._capture_executor.shutdown(wait=False)
+            self._capture_executor = None
+
+    def events(self, types=None):
+        """
+        Subscribe to the UI events (window and content changes, toasts) of the device.
+
+        Args:
+            types (iterable): The UIEventTypes to deliver, all if None.
+
+        Returns:
+            Subscription: A blocking iterator over the events published from now on; close() it when done.
+        """
+        return self.connector.events().subscribe(types)
+
+    @property
+    def ui_events(self):
+        """
+        Returns:
+            EventHub: The event hub of the device, None while no events are streamed.
+        """
+        return self.connector._event_hub
+
+    def wait_for_event(self, types=None, since=None, timeout=5):
+        """
+        Wait for a UI event of the given types after `since` (default: now).
+
+        Returns:
+            UIEvent: The event, or None on timeout or while no events are streamed.
+        """
+        hub = self.ui_events
+        if hub is None:
+            return None
+        return hub.wait_for(types, since, timeout)
+
+    def wait_for_idle(self, timeout=5, stable_frames=2, interval=0.3, settle=0.5, signals=('activity', 'img')):
+        """
+        Wait until the UI stops changing, instead of sleeping for a fixed time after an action.
+
+        Args:
+            timeout (float): Give up after so many seconds.
+            stable_frames (int): How many consecutive samples must agree.
+            interval (float): Seconds between two samples.
+            settle (float): Seconds to wait before the first sample, so that a transition has begun.
+            signals (tuple): Any of 'activity' (foreground page), 'img' (screenshot phash), 'vht' (layout hash).
+                While UI events are streamed (see events()), the events replace the samples.
+
+        Returns:
+            bool: True if the UI became stable before the deadline.
+        """
+        hub = self.ui_events
+        if hub is not None:
+            return self._wait_for_quiet(hub, timeout, stable_frames * interval, settle)
+        deadline = time.time() + timeout
+        time.sleep(min(settle, timeout))
+        last, stable = None, 0
+        while True:
+            sample = self._idle_sample(signals)
+            if sample is None:
+                # A device that does not answer is not idle
+                stable = 0
+            elif last is not None and self._same_sample(last, sample):
+                stable += 1
+            else:
+                stable = 1
+            if stable >= stable_frames:
+                return True
+            last = sample
+            if time.time() + interval > deadline:
+                logger.debug("UI of device:%s is not idle after %ss" % (self.serial, timeout))
+                return False
+            time.sleep(interval)
+
+    def _wait_for_quiet(self, hub, timeout, quiet, settle):
+        # The first window event ends the settle time, then the UI is idle once events stop
+        start = time.time()
+        hub.wait_for(_LAYOUT_EVENTS, since=start - 0.05, timeout=min(settle, timeout))
+        if hub.wait_for_quiet(quiet, max(0, timeout - (time.time() - start)), _LAYOUT_EVENTS):
+            return True
+        logger.debug("UI of device:%s is not idle after %ss" % (self.serial, timeout))
+        return False
+
+    def _idle_sample(self, signals):
+        from ..utils.cv import phash
+        sample = {}
+        try:
+            if 'activity' in signals:
+                sample['activity'] = self.page_info()
+            if 'img' in signals:
+                sample['img'] = phash(self.screenshot(raw=False))
+            if 'vht' in signals:
+                sample['vht'] = self.dump_hierarchy().structure_hash()
+        except Exception as e:
+            logger.debug("idle sample failed on device:%s: %s" % (self.serial, e))
+            return None
+        return sample
+
+    @staticmethod
+    def _same_sample(last, sample, img_distance=2):
+        if last.keys() != sample.keys():
+            return False
+        for (signal, value) in sample.items():
+            if signal == 'img':
+                if value - last[signal] > img_distance:
+                    return False
+            elif value != last[signal]:
+                return False
+        return True
+
+    def dump_page(self, device=None, refresh=False, retries=2):
+        """
+        Capture the current page, or return the last one captured.
+
+        Args:
+            device (Device): The device whose hierarchy is dumped, this device by default.
+            refresh (bool): Capture a new page even if one was captured before.
+            retries (int): In CaptureMode.CONCURRENT, how many times to capture again when the foreground
+                page changes while the probes are running. The last capture is kept and marked inconsistent.
+        Returns:
+            Page: The captured page.
+        """
         if device is None:
             device = self
         if self.page == None or refresh:
-            vht = self.dump_hierarchy(device=device)
-            img = self.screenshot()
-            info = self.page_info()
-            rsc = self.resources()
-            self.page = Page(vht=vht, img=img, rsc=rsc, info=info)
+            probes = {'vht': lambda: self.dump_hierarchy(device=device),
+                      'img': self.screenshot,
+                      'info': self.page_info,
+                      'rsc': self.resources if self.probe_resources else lambda: None}
+            if self.capture == CaptureMode.CONCURRENT:
+                if self._capture_executor is None:
+                    self._capture_executor = ThreadPoolExecutor(max_workers=len(probes))
+                for attempt in range(retries + 1):
+                    (parts, consistent) = self._capture_concurrently(probes)
+                    if consistent:
+                        break
+                    logger.debug("foreground page changed during capture on device:%s, attempt %d/%d"
+                                 % (self.serial, attempt + 1, retries + 1))
+            else:
+                parts = {name: self._timed(probe) for (name, probe) in probes.items()}
+                consistent = True
+            self.page = Page(vht=parts['vht'][0], img=parts['img'][0], rsc=parts['rsc'][0], info=parts['info'][0])
+            self.page.timestamps = {name: part[1] for (name, part) in parts.items()}
+            self.page.consistent = consistent
+            if self.precompute:
+                self.page.precompute()
+            if not consistent:
+                logger.warning("foreground page kept changing during capture on device:%s" % self.serial)
         return self.page
 
+    def _capture_concurrently(self, probes):
+        # The foreground page must be the same before, during and after the probes
+        before = self.page_info()
+        futures = {name: self._capture_executor.submit(self._timed, probe) for (name, probe) in probes.items()}
+        parts = {name: future.result() for (name, future) in futures.items()}
+        consistent = before == parts['info'][0] == self.page_info()
+        return parts, consistent
+
+    @staticmethod
+    def _timed(probe):
+        start = time.time()
+        result = probe()
+        return result, (start, time.time())
+
     def hop(self, dst_device_name=None, app_name=None):
         return self.automator.hop(dst_device_name, app_name)
     
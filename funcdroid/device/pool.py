@@ -0,0 +1,287 @@
+from .device import Device
+from hmbot.utils.exception import DeviceError, LeaseTimeoutError
+from hmbot.utils.proto import OperatingSystem
+from hmbot.utils.utils import get_android_available_devices, get_harmony_available_devices
+from loguru import logger
+import threading
+import time
+
+
+class Lease(object):
+    """
+    Exclusive use of one device of a DevicePool until release().
+
+    Used as a context manager it yields the device; a DeviceError (or a connection error)
+    escaping the block marks the device unhealthy, so it is checked before its next lease.
+    """
+    def __init__(self, pool, entry, owner):
+        self.pool = pool
+        self.device = entry.device
+        self.owner = owner
+        self.acquired_at = time.time()
+        self.healthy = True
+        self.released = False
+        self._entry = entry
+
+    @property
+    def serial(self):
+        return self.device.serial
+
+    def mark_unhealthy(self):
+        self.healthy = False
+
+    def release(self):
+        self.pool.release(self)
+
+    def __enter__(self):
+        return self.device
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, (DeviceError, ConnectionError, TimeoutError)):
+            self.mark_unhealthy()
+        self.release()
+
+
+class _Entry(object):
+    FREE = 'free'
+    LEASED = 'leased'
+    QUARANTINED = 'quarantined'
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.device = None
+        self.state = _Entry.FREE
+        self.owner = ''
+        self.last_used = 0.0
+        self.leases = 0
+        self.gone = False
+
+
+class DevicePool(object):
+    """
+    Hands out exclusive leases on the devices of a farm to concurrent workers.
+
+    Serials are discovered through adb/hdc (or given). A device is connected on its first
+    lease and kept connected between leases; a device left idle for `idle_timeout` seconds
+    is closed and reconnected on demand. Every device passes a health check before it is
+    leased; a failing device is quarantined and re-checked in the background until it recovers.
+    """
+    def __init__(self, operating_system, serials=None, health_check=None, idle_timeout=600,
+                 check_interval=30, **device_kwargs):
+        """
+        Args:
+            operating_system (str): The operating system of the devices.
+            serials (list): The devices of the pool; discovered (and re-discovered periodically) if None.
+            health_check (callable): Takes a device and raises or returns False if it is unusable.
+                Defaults to querying the foreground page.
+            idle_timeout (float): Seconds a free device stays connected.
+            check_interval (float): Seconds between two rounds of discovery, eviction and quarantine checks.
+            device_kwargs: Passed to Device when a device is connected.
+        """
+        self.operating_system = OperatingSystem(operating_system)
+        self.discovering = serials is None
+        self.health_check = health_check or (lambda device: device.page_info() is not None)
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.device_kwargs = device_kwargs
+        self._entries = {}
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._janitor = None
+        if self.discovering:
+            self.discover()
+        else:
+            for serial in serials:
+                self._entries[serial] = _Entry(serial)
+
+    def discover(self):
+        """
+        Add newly connected devices to the pool and drop disconnected ones.
+
+        Returns:
+            list: The serials currently in the pool.
+        """
+        if self.operating_system == OperatingSystem.ANDROID:
+            serials = get_android_available_devices()
+        elif self.operating_system == OperatingSystem.HARMONY:
+            serials = get_harmony_available_devices()
+        else:
+            serials = list(self._entries)
+        closing = []
+        with self._cond:
+            for serial in serials:
+                if serial not in self._entries:
+                    self._entries[serial] = _Entry(serial)
+                    logger.info('device:%s joined the pool' % serial)
+                self._entries[serial].gone = False
+            for serial in [s for s in self._entries if s not in serials]:
+                entry = self._entries[serial]
+                if entry.state == _Entry.LEASED:
+                    # Dropped once its holder releases it
+                    entry.gone = True
+                else:
+                    closing.append(self._entries.pop(serial).device)
+                logger.info('device:%s left the pool' % serial)
+            self._cond.notify_all()
+        for device in closing:
+            self._close(device)
+        return list(self._entries)
+
+    def start(self):
+        """
+        Run discovery, idle eviction and quarantine checks in the background.
+        """
+        if self._janitor is not None and self._janitor.is_alive():
+            return self
+        self._stopped.clear()
+        self._janitor = threading.Thread(target=self._maintain, name='device pool', daemon=True)
+        self._janitor.start()
+        return self
+
+    def acquire(self, timeout=None, serial=None, owner=''):
+        """
+        Lease a healthy device, waiting until one is free.
+
+        Args:
+            timeout (float): Seconds to wait; forever if None.
+            serial (str): Lease this device only.
+            owner (str): Who holds the lease, shown in stats().
+
+        Returns:
+            Lease: The lease of the device.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._cond:
+                entry = self._pick(serial)
+                while entry is None:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise LeaseTimeoutError('no %s device is free after %ss' % (serial or 'healthy', timeout))
+                    self._cond.wait(remaining)
+                    entry = self._pick(serial)
+                # Reserved, the (slow) connection and health check run outside the lock
+                entry.state = _Entry.LEASED
+                entry.owner = owner
+            if self._check(entry):
+                entry.leases += 1
+                logger.debug('device:%s leased to %s' % (entry.serial, owner or 'anonymous'))
+                return Lease(self, entry, owner)
+            self._quarantine(entry)
+
+    def _pick(self, serial):
+        # Connected devices first, then the one idle the longest
+        free = [e for e in self._entries.values()
+                if e.state == _Entry.FREE and not e.gone and (serial is None or e.serial == serial)]
+        if not free:
+            return None
+        return min(free, key=lambda e: (e.device is None, e.last_used))
+
+    def _check(self, entry, quiet=False):
+        try:
+            if entry.device is None:
+                entry.device = Device(entry.serial, self.operating_system, **self.device_kwargs)
+            if self.health_check(entry.device) is False:
+                raise DeviceError('health check returned False')
+            return True
+        except Exception as e:
+            (logger.debug if quiet else logger.warning)('device:%s failed its health check: %s' % (entry.serial, e))
+            return False
+
+    def _quarantine(self, entry):
+        (device, entry.device) = (entry.device, None)
+        with self._cond:
+            entry.state = _Entry.QUARANTINED
+            entry.owner = ''
+            self._cond.notify_all()
+        self._close(device)
+
+    def release(self, lease):
+        if lease.released:
+            return
+        lease.released = True
+        entry = lease._entry
+        if not lease.healthy:
+            self._quarantine(entry)
+        with self._cond:
+            if lease.healthy:
+                entry.state = _Entry.FREE
+                entry.owner = ''
+            entry.last_used = time.time()
+            if entry.gone and self._entries.get(entry.serial) is entry:
+                del self._entries[entry.serial]
+                closing = entry.device
+            else:
+                closing = None
+            self._cond.notify_all()
+        self._close(closing)
+        logger.debug('device:%s released after %.1fs' % (entry.serial, time.time() - lease.acquired_at))
+
+    def _maintain(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                if self.discovering:
+                    self.discover()
+                self._evict_idle()
+                self._recheck_quarantined()
+            except Exception as e:
+                logger.warning('device pool maintenance failed: %s' % e)
+
+    def _evict_idle(self):
+        closing = []
+        with self._cond:
+            for entry in self._entries.values():
+                if entry.state == _Entry.FREE and entry.device is not None \
+                        and time.time() - entry.last_used > self.idle_timeout:
+                    closing.append(entry.device)
+                    entry.device = None
+        for device in closing:
+            logger.debug('device:%s idle for %ss, disconnected' % (device.serial, self.idle_timeout))
+            self._close(device)
+
+    def _recheck_quarantined(self):
+        with self._cond:
+            entries = [e for e in self._entries.values() if e.state == _Entry.QUARANTINED]
+            for entry in entries:
+                entry.state = _Entry.LEASED
+        for entry in entries:
+            if self._check(entry, quiet=True):
+                with self._cond:
+                    entry.state = _Entry.FREE
+                    entry.last_used = time.time()
+                    self._cond.notify_all()
+                logger.info('device:%s recovered' % entry.serial)
+            else:
+                self._quarantine(entry)
+
+    @staticmethod
+    def _close(device):
+        if device is None:
+            return
+        try:
+            device.close()
+        except Exception as e:
+            logger.debug('closing device:%s failed: %s' % (device.serial, e))
+
+    def stats(self):
+        """
+        Returns:
+            dict: serial -> (state, owner, number of leases so far).
+        """
+        with self._cond:
+            return {e.serial: (e.state, e.owner, e.leases) for e in self._entries.values()}
+
+    def close(self):
+        self._stopped.set()
+        with self._cond:
+            devices = [e.device for e in self._entries.values()]
+            for entry in self._entries.values():
+                entry.device = None
+        for device in devices:
+            self._close(device)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
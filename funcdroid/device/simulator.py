@@ -0,0 +1,249 @@
+from hmbot.model.vht import VHT, VHTNode, VHTParser
+from hmbot.utils.proto import PageInfo
+from loguru import logger
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+import time
+import cv2
+
+
+class Recording(object):
+    """
+    The class replays a recorded exploration (a ptg.json and its page artifacts) as an app.
+
+    The current page is a node of the recorded page transition graph. A click that lands
+    on the recorded position of an edge moves to the page the edge leads to, back() returns
+    to the previous page. The recorded hierarchy and screenshot of a page are served when
+    they were kept, otherwise both are synthesized from the edges of the page.
+    Connector and automator of the same recording share one instance.
+    """
+    LAUNCHER = 'com.hmbot.launcher'
+    _recordings = {}
+    _recordings_lock = threading.Lock()
+
+    @classmethod
+    def of(cls, path):
+        """
+        Return the recording at a path, loading it on first use.
+
+        Args:
+            path (str): A ptg.json file, or the directory holding it.
+        """
+        path = os.path.abspath(path)
+        with cls._recordings_lock:
+            if path not in cls._recordings:
+                cls._recordings[path] = cls(path)
+            return cls._recordings[path]
+
+    def __init__(self, path, radius=60, latency=0.0):
+        """
+        Args:
+            path (str): A ptg.json file, or the directory holding it.
+            radius (int): How far (in pixels) from a recorded position a click still hits the widget.
+            latency (float): Seconds every device call is delayed, to mimic a real device in benchmarks.
+        """
+        ptg_file = path if path.endswith('.json') else os.path.join(path, 'ptg.json')
+        with open(ptg_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.base_dir = os.path.dirname(ptg_file)
+        self.bundle = data.get('app_bundle', '')
+        self.nodes = {node['index']: node for node in data.get('nodes', [])}
+        if not self.nodes:
+            raise ValueError('%s records no page' % ptg_file)
+        self.entry = 0 if 0 in self.nodes else min(self.nodes)
+        self.radius = radius
+        self.latency = latency
+        self.current = None
+        self.text = ''
+        self._stack = []
+        self._lock = threading.RLock()
+        self._images = {}
+        # The SimulatedEventSource of the connector while UI events are streamed
+        self.events = None
+        (self.width, self.height) = self._screen_size()
+        logger.debug('loaded recording of %s with %d nodes from %s' % (self.bundle, len(self.nodes), ptg_file))
+
+    def _artifact(self, node, key):
+        rel = node.get('page_details', {}).get(key, '')
+        if not rel:
+            return None
+        path = os.path.join(self.base_dir, *rel.replace('\\', '/').split('/'))
+        return path if os.path.exists(path) else None
+
+    def _screen_size(self):
+        for node in self.nodes.values():
+            img_file = self._artifact(node, 'screenshot_path')
+            if img_file:
+                img = cv2.imread(img_file, cv2.IMREAD_COLOR)
+                if img is not None:
+                    return img.shape[1], img.shape[0]
+        xs, ys = [0], [0]
+        for node in self.nodes.values():
+            for edge in node.get('edges', []):
+                if edge.get('position'):
+                    xs.append(edge['position'][0])
+                    ys.append(edge['position'][1])
+        return max(1080, max(xs) + self.radius), max(2400, max(ys) + self.radius)
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def launch(self):
+        with self._lock:
+            self._delay()
+            self.current = self.entry
+            self._stack = []
+            self._emit('TYPE_WINDOW_STATE_CHANGED')
+
+    def stop(self):
+        with self._lock:
+            self.current = None
+            self._stack = []
+
+    def back(self):
+        with self._lock:
+            self._delay()
+            self.current = self._stack.pop() if self._stack else None
+            self._emit('TYPE_WINDOW_STATE_CHANGED')
+
+    def tap(self, x, y):
+        """
+        Click at (x, y) on the current page.
+
+        Returns:
+            bool: True if the click hit a recorded widget.
+        """
+        with self._lock:
+            self._delay()
+            edge = self._hit(x, y)
+            if edge is None:
+                return False
+            self._emit('TYPE_VIEW_CLICKED', edge.get('description', ''))
+            target = edge.get('page_node')
+            if edge.get('is_leaf') or target not in self.nodes or target == self.current:
+                self._emit('TYPE_WINDOW_CONTENT_CHANGED')
+                return True
+            if self.nodes[target].get('type', 'page') != 'page':
+                self._emit('TYPE_WINDOW_CONTENT_CHANGED')
+                return True
+            self._stack.append(self.current)
+            self.current = target
+            self._emit('TYPE_WINDOW_STATE_CHANGED')
+            return True
+
+    def input(self, text):
+        with self._lock:
+            self.text = text
+            self._emit('TYPE_VIEW_TEXT_CHANGED', text)
+
+    def _emit(self, type, text=''):
+        if self.events is not None:
+            info = self.info()
+            self.events.emit(type, package=info.bundle, class_name=info.ability, text=text)
+
+    def _hit(self, x, y):
+        if self.current is None:
+            return None
+        (best, best_distance) = (None, self.radius)
+        for edge in self.nodes[self.current].get('edges', []):
+            position = edge.get('position')
+            if not position:
+                continue
+            distance = max(abs(position[0] - x), abs(position[1] - y))
+            if distance <= best_distance:
+                (best, best_distance) = (edge, distance)
+        return best
+
+    def state(self):
+        with self._lock:
+            return {'current': self.current, 'stack': list(self._stack)}
+
+    def set_state(self, state):
+        with self._lock:
+            self.current = state.get('current')
+            self._stack = list(state.get('stack', []))
+            self._emit('TYPE_WINDOW_STATE_CHANGED')
+
+    def info(self):
+        with self._lock:
+            current = self.current
+        if current is None:
+            return PageInfo(bundle=Recording.LAUNCHER, ability='Launcher', name='launcher')
+        details = self.nodes[current].get('page_details', {})
+        return PageInfo(bundle=details.get('bundle', self.bundle),
+                        ability=details.get('ability', ''),
+                        name='page%d' % current)
+
+    def hierarchy(self, device=None):
+        with self._lock:
+            self._delay()
+            current = self.current
+        if current is not None:
+            vht_file = self._artifact(self.nodes[current], 'vht_path')
+            if vht_file:
+                return VHTParser.load(vht_file, device)
+        return self._synthesize_hierarchy(current, device)
+
+    def screenshot(self):
+        with self._lock:
+            self._delay()
+            current = self.current
+        if current not in self._images:
+            img = None
+            if current is not None:
+                img_file = self._artifact(self.nodes[current], 'screenshot_path')
+                img = cv2.imread(img_file, cv2.IMREAD_COLOR) if img_file else None
+            self._images[current] = img if img is not None else self._synthesize_image(current)
+        return self._images[current].copy()
+
+    def _widgets(self, current):
+        if current is None:
+            return []
+        widgets = []
+        half = self.radius // 2
+        for (i, edge) in enumerate(self.nodes[current].get('edges', [])):
+            position = edge.get('position')
+            if not position:
+                continue
+            (x, y) = position
+            bounds = [[max(0, x - half), max(0, y - half)], [min(self.width, x + half), min(self.height, y + half)]]
+            widgets.append((i, edge, bounds))
+        return widgets
+
+    def _synthesize_hierarchy(self, current, device):
+        info = self.info()
+        common = {'bundle': info.bundle, 'page': info.ability, 'longClickable': 'false', 'selected': 'false',
+                  'checkable': 'false', 'checked': 'false', 'enabled': 'true', 'focused': 'false'}
+        root = VHTNode(device=device, attrib=common,
+                       bounds=[[0, 0], [self.width, self.height]],
+                       center=[self.width // 2, self.height // 2],
+                       clickable='false', type='android.widget.FrameLayout', id='', text='')
+        for (i, edge, bounds) in self._widgets(current):
+            root.append(VHTNode(device=device, attrib=common,
+                                bounds=bounds,
+                                center=[(bounds[0][0] + bounds[1][0]) // 2, (bounds[0][1] + bounds[1][1]) // 2],
+                                clickable='true',
+                                type='android.widget.EditText' if edge.get('action') == 'input' else 'android.widget.Button',
+                                id='%s:id/edge%d' % (info.bundle, i),
+                                text=edge.get('description', '')))
+        return VHT(root)
+
+    def _synthesize_image(self, current):
+        # Every page gets its own background and widget layout, so that page hashes tell pages apart
+        seed = hashlib.md5(str(current).encode('utf-8')).digest()
+        img = np.full((self.height, self.width, 3), (seed[0], seed[1], seed[2]), dtype=np.uint8)
+        if current is None:
+            cv2.putText(img, 'launcher', (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+            return img
+        title = self.nodes[current].get('function_description', '') or 'page %d' % current
+        cv2.putText(img, title[:40], (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        for (i, edge, bounds) in self._widgets(current):
+            color = (seed[(3 + i) % 16], seed[(7 + i) % 16], seed[(11 + i) % 16])
+            cv2.rectangle(img, tuple(bounds[0]), tuple(bounds[1]), color, -1)
+            cv2.putText(img, edge.get('description', '')[:24], (bounds[0][0], bounds[1][1] + 24),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
+        return img
@@ -12,10 +12,11 @@ from hmbot.explorer.prompt import *
 import json, time
 from hmbot.explorer.utils import *
 from hmbot.explorer.action import *
+from hmbot.explorer.macro import compile_macro
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from hmbot.model.vht import VHTParser
 from hmbot.utils.cv import encode_image
-from hmbot.utils.proto import PageInfo
+from hmbot.utils.proto import PageInfo, UIEventType
 from collections import deque
 from hmbot.explorer.knowledge import KnowledgeBaseRetriever
 from pathlib import Path
@@ -26,27 +27,15 @@ IMG_WEIGHT = 1
 SIMILARITY_THRESHOLD_MATCH = 0.95
 
 
-def get_current_app_package() -> str:
-    def _run(cmd: str) -> str:
-        p = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        return (p.stdout or "").strip()
-
-    out = _run(r'adb shell dumpsys window | findstr mCurrentFocus')
-    m = re.search(r"\s([a-zA-Z0-9_\.]+)\/", out)
-    if m:
-        return m.group(1)
-
-    return ""
-
-
 class Explorer:
     def __init__(self, device: Device, app_name, app: App=None):
         self.device = device
         # self.app = app
         self.app_name = app_name
         # self.app_bundle = app.package_name
-        self.app_bundle = get_current_app_package()
+        self.app_bundle = get_current_app_package(device)
         self.app_abilities = app.abilities if app else []
+        self.app_permissions = getattr(app, "permissions", None)
         self.explored_abilities = []
 
         self.page_nodes: list[PageNode] = []
@@ -65,7 +54,20 @@ class Explorer:
         self.bug_detector_thread.start()
         self.bug_counter = 0
 
-        self.lock = threading.Lock()
+        # 崩溃 / ANR 由后台 logcat 实时捕获并按栈签名去重，不经过 LLM
+        try:
+            self.crash_monitor = self.device.monitor_crashes(self.app_bundle)
+            self.crash_monitor.on_crash(self._record_crash)
+        except NotImplementedError:
+            self.crash_monitor = None
+
+        # 后台跟随前台页面切换：page_info() 变为内存读取，并记录每个动作经过的页面
+        try:
+            self.watcher = self.device.watch()
+        except NotImplementedError:
+            self.watcher = None
+
+        self.lock = threading.RLock()
 
         self.output_dir = ""
         self.start_time = time.time()
@@ -74,6 +76,16 @@ class Explorer:
 
         self.depth_limit = 10
 
+        # 测试阶段的基线快照（应用数据 + 入口页面），见 checkpoint_baseline()
+        self.baseline = None
+        self._baseline_tried = False
+
+        # 已由 Provisioner 安装、授权并冷启动时，探索开始前不再重复授权
+        self.provisioned = False
+
+        # 路径回放宏在设备端一次执行（步间固定停顿），否则在主机端逐步 idle 等待
+        self.replay_on_device = False
+
         # self.kb_retriever = KnowledgeBaseRetriever()
 
         self._declared_activities = set()   # manifest declared
@@ -101,7 +113,8 @@ class Explorer:
         self._act_cov_path = out / "activity_coverage.json"
         self._act_cov_hist_path = out / "activity_coverage_history.jsonl"
 
-        grant_all_permissions(self.app_bundle)
+        if not self.provisioned:
+            grant_all_permissions(self.device, self.app_bundle, self.app_permissions)
 
         self.root_page_node = PageNode(index=-1, page=None)
         self.root_page_node.edges.append({
@@ -753,7 +766,7 @@ Output STRICT JSON (NO extra text, NO markdown):
             success = False
             for _ in range(3):
                 self.device.back()
-                time.sleep(2)
+                self.device.wait_for_idle(timeout=3)
                 new_page = self.device.dump_page(refresh=True)
                 new_page_index = self._is_page_exist(new_page)
 
@@ -768,21 +781,13 @@ Output STRICT JSON (NO extra text, NO markdown):
                         break
 
                 if found_index != -1:
-                    for i in self.path[found_index:]:
-                        self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
-                        edge = i[1]
-                        self._excute_action(edge)
+                    self._replay_from(found_index, page_node)
                     success = True
                     break  
                     
             if not success:
                 logger.info("Return attempts failed, restarting app.")
-                self.device.restart_app_by_bundle(self.app_bundle)
-                time.sleep(15)
-                for i in self.path:
-                    self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
-                    edge = i[1]
-                    self._excute_action(edge)
+                self._restart_and_replay(page_node)
 
         logger.info(f"Explore {page_node.index} finished.")
 
@@ -807,15 +812,17 @@ Output STRICT JSON (NO extra text, NO markdown):
             
             if edge["is_leaf"]:
                 print("leaf node reached.")
-                new_page_node = PageNode(index=len(self.page_nodes), page=page_node.page)
-                new_page_node.type = "widget"
-                self.page_nodes.append(new_page_node)
+                with self.lock:
+                    new_page_node = PageNode(index=len(self.page_nodes), page=page_node.page)
+                    new_page_node.type = "widget"
+                    self.page_nodes.append(new_page_node)
                 new_page_node.function_description = edge["description"]
                 edge["page_node"] = new_page_node
                 continue
 
             print(f"Executing edge action: {edge['action']} at position: {edge['position']}")
 
+            acted_at = time.time()
             if page_node.index != -1:
                 if self._excute_action(edge) is False:
                     edge["is_leaf"] = True
@@ -828,9 +835,33 @@ Output STRICT JSON (NO extra text, NO markdown):
                 self.device.back()
                 edge["is_leaf"] = True
                 edge["page_node"] = page_node
-                time.sleep(3)
+                self.device.wait_for_idle(timeout=3)
                 continue
-            index = self._is_page_exist(new_page)
+
+            if self.crash_monitor is not None:
+                crashes = self.crash_monitor.since(acted_at)
+                if crashes:
+                    # 把本次动作触发的崩溃挂到边上，随 PTG 一起保存
+                    edge["crashes"] = sorted({c.signature for c in crashes})
+                    logger.warning(f"[CRASH] edge '{edge['description']}' triggered {edge['crashes']}")
+
+            toasts = self._toasts_since(acted_at)
+            if toasts:
+                # Toast 转瞬即逝，截图往往抓不到，从无障碍事件中记录
+                edge["toasts"] = toasts
+
+            if self.watcher is not None:
+                # 动作触发的页面切换（含闪屏、跳转等中间页面），按时间顺序
+                transitions = self.watcher.transitions(acted_at)
+                if transitions:
+                    edge["transitions"] = [t.info.ability for t in transitions]
+
+            new_page_node = None
+            if self._is_unchanged(page_node.page, new_page):
+                # 动作前后层次结构无差异：界面未变化，跳过页面匹配（及其可能的 LLM 调用）
+                index = page_node.index
+            else:
+                index, new_page_node = self._register_page(new_page)
 
             if index == page_node.index:
                 page_node.page = new_page
@@ -847,9 +878,7 @@ Output STRICT JSON (NO extra text, NO markdown):
             }
             self.bug_queue.put(task)
 
-            if index == len(self.page_nodes):
-                new_page_node = PageNode(index=index, page=new_page)
-                self.page_nodes.append(new_page_node)
+            if new_page_node is not None:
                 edge["page_node"] = new_page_node
                 
                 future = self.executor.submit(
@@ -873,16 +902,13 @@ Output STRICT JSON (NO extra text, NO markdown):
                     break
 
             if found_index != -1:
-                for i in self.path[found_index:]:
-                    self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
-                    edge = i[1]
-                    self._excute_action(edge)
+                self._replay_from(found_index, page_node)
                 continue
 
             success = False
             for _ in range(3):
                 self.device.back()
-                time.sleep(3)
+                self.device.wait_for_idle(timeout=3)
                 new_page = self.device.dump_page(refresh=True)
                 new_page_index = self._is_page_exist(new_page)
 
@@ -897,22 +923,14 @@ Output STRICT JSON (NO extra text, NO markdown):
                         break
 
                 if found_index != -1:
-                    for i in self.path[found_index:]:
-                        self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
-                        edge = i[1]
-                        self._excute_action(edge)
+                    self._replay_from(found_index, page_node)
                     success = True
                     break  
 
             if not success:
                 logger.info("Return attempts failed, restarting app.")
                 # self.device.restart_app(self.app)
-                self.device.restart_app_by_bundle(self.app_bundle)
-                time.sleep(15)
-                for i in self.path:
-                    self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
-                    edge = i[1]
-                    self._excute_action(edge)
+                self._restart_and_replay(page_node)
 
         if futures:
             for f in futures:
@@ -922,8 +940,110 @@ Output STRICT JSON (NO extra text, NO markdown):
                     logger.error(f"[ERROR] get_widgets_from_page task failed: {e}")
 
 
+    def _replay_edges(self, edges: list, target: PageNode, macro=None) -> bool:
+        # 用边上记录的坐标编译成宏一次性回放，只校验最终页面；失败时由调用方逐步回放
+        macro = compile_macro(edges) if macro is None else macro
+        if macro is None or len(macro) == 0:
+            return False
+        start = time.time()
+        try:
+            if self.replay_on_device:
+                macro.run_on_device(self.device)
+            else:
+                macro.run(self.device)
+        except Exception as e:
+            logger.warning(f"[macro] replay failed: {e}")
+            return False
+        if not self._reached(target, "[macro] replay"):
+            return False
+        logger.info(f"[macro] replayed {len(macro)} steps to page {target.index} in {time.time() - start:.1f}s")
+        return True
+
+    def _reached(self, target: PageNode, what="replay") -> bool:
+        # 校验当前页面是否为 target，是则以新截取的页面更新它；
+        # 只做匹配、不登记新节点，无需持有共享锁（匹配可能请求 LLM）
+        try:
+            page = self.device.dump_page(refresh=True)
+        except Exception as e:
+            logger.warning(f"{what} failed: {e}")
+            return False
+        index = self._is_page_exist(page)
+        if index != target.index:
+            logger.info(f"{what} reached page {index} instead of {target.index}")
+            return False
+        target.page = page
+        return True
+
+    def _replay_from(self, start: int, page_node: PageNode):
+        # 当前位于 self.path[start] 的源页面，回放剩余路径回到 page_node
+        if self._replay_edges([edge for _, edge in self.path[start:]], page_node):
+            return
+        self._restart_and_replay(page_node, macro=False)
+
+    def _restart_and_replay(self, page_node: PageNode, macro=True):
+        edges = [edge for _, edge in self.path]
+        # 先编译：只有宏确实执行且到达了错误页面时才需要再次重启
+        compiled = compile_macro(edges) if macro else None
+        self.device.restart_app_by_bundle(self.app_bundle)
+        self.device.wait_for_idle(timeout=15, stable_frames=3)
+        if not edges:
+            self._reached(page_node, "restart")
+            return
+        if compiled is not None:
+            if self._replay_edges(edges, page_node, compiled):
+                return
+            self.device.restart_app_by_bundle(self.app_bundle)
+            self.device.wait_for_idle(timeout=15, stable_frames=3)
+        # 逐步回放：每步重新截图并由 LLM 定位控件
+        for i in self.path:
+            self.page_nodes[i[0]].page = self.device.dump_page(refresh=True)
+            self._excute_action(i[1])
+
     def _excute_action(self, edge: dict):
         page = self.device.dump_page(refresh=True)
+        # 边上记录过控件且在当前页面唯一命中时，直接点击其中心，省去一次 LLM 定位
+        real_pos = self._locate_widget(page, edge.get("widget"))
+        if real_pos is None:
+            real_pos = self._ask_position(page, edge)
+        if real_pos is None:
+            return
+
+        if edge["action"] == "click":
+            if real_pos and real_pos != (0, 0):
+                edge["position"] = real_pos
+                self.device.click(real_pos[0], real_pos[1])
+                self.device.wait_for_idle(timeout=5)
+                return True
+            else:
+                # self.device.click(edge["position"][0], edge["position"][1])
+                return False
+
+        # elif edge["action"] == "long_click":
+        #     self.device.long_click(edge["position"][0], edge["position"][1])
+
+        elif edge["action"] == "input":
+            if real_pos and real_pos != (0, 0):
+                edge["position"] = real_pos
+                self.device.click(real_pos[0], real_pos[1])
+                self.device.wait_for_idle(timeout=5)
+            else:
+                # self.device.click(edge["position"][0], edge["position"][1])
+                return False
+
+            time.sleep(1)
+            try:
+                if edge["content"]:
+                    self.device.input(edge["content"])
+                else:
+                    self.device.input("test input")
+                self.device.wait_for_idle(timeout=5)
+                return True
+            except Exception as e:
+                print(f"Input action failed: {e}")
+                return False
+            
+
+    def _ask_position(self, page, edge: dict):
         content = [
             {"type": "input_text", "text": get_position_prompt},
             {"type": "input_text", "text": "Current page screenshot:"},
@@ -981,49 +1101,41 @@ Output STRICT JSON (NO extra text, NO markdown):
 
         if parsed_pos is None:
             logger.warning(f"[LLM][pos] all retries failed, skip action. last_err={last_err}")
-            return
+            return None
 
-        real_pos = None
         image_height, image_width = page.img.shape[:2]
         real_pos = (
             int(parsed_pos[0] / 1000 * image_width),
             int(parsed_pos[1] / 1000 * image_height),
         )
+        # 记下坐标处的控件，回放时可直接在 VHT 索引中找到它
+        widget = self._widget_at(page, real_pos)
+        if widget:
+            edge["widget"] = widget
+        return real_pos
+
+    @staticmethod
+    def _widget_at(page, pos):
+        # 坐标处最内层的可点击控件（没有则取最内层控件），只记录能在页面中区分它的属性
+        if page is None or page.vht is None:
+            return None
+        node = page.vht.node_at(pos[0], pos[1], clickable="true") or page.vht.node_at(pos[0], pos[1])
+        if node is None:
+            return None
+        widget = {key: node.attribute.get(key, "") for key in ("type", "id", "text")}
+        if not widget["id"] and not widget["text"]:
+            return None
+        return widget
 
-        if edge["action"] == "click":
-            if real_pos and real_pos != (0, 0):
-                edge["position"] = real_pos
-                self.device.click(real_pos[0], real_pos[1])
-                time.sleep(5)
-                return True
-            else:
-                # self.device.click(edge["position"][0], edge["position"][1])
-                return False
-
-        # elif edge["action"] == "long_click":
-        #     self.device.long_click(edge["position"][0], edge["position"][1])
-
-        elif edge["action"] == "input":
-            if real_pos and real_pos != (0, 0):
-                edge["position"] = real_pos
-                self.device.click(real_pos[0], real_pos[1])
-                time.sleep(5)
-            else:
-                # self.device.click(edge["position"][0], edge["position"][1])
-                return False
-
-            time.sleep(1)
-            try:
-                if edge["content"]:
-                    self.device.input(edge["content"])
-                else:
-                    self.device.input("test input")
-                time.sleep(5)
-                return True
-            except Exception as e:
-                print(f"Input action failed: {e}")
-                return False
-            
+    @staticmethod
+    def _locate_widget(page, widget):
+        if not widget or page is None or page.vht is None:
+            return None
+        nodes = page.vht(**widget)
+        if len(nodes) != 1:
+            return None
+        center = nodes[0].attribute.get("center")
+        return tuple(center) if center else None
 
     def get_widgets_from_page(self, page_node_before: PageNode, page_node_after: PageNode, action: str):
         if page_node_after.page.info.bundle != self.app_bundle:
@@ -1586,14 +1698,39 @@ Output STRICT JSON ONLY (and nothing else):
             #     print(f"[AppTest] detect_bug_from_path_record failed for {producer_idx}->{consumer_idx}: {e}")
 
 
+    def checkpoint_baseline(self, relaunch=True):
+        # 从冷启动状态给应用数据拍快照，之后的测试用例都从该快照恢复，而不是带着上一个用例的数据重启
+        self._baseline_tried = True
+        self.device.restart_app_by_bundle(self.app_bundle)
+        self.device.wait_for_idle(timeout=10, stable_frames=3)
+        try:
+            self.baseline = self.device.checkpoint(self.app_bundle)
+        except Exception as e:
+            logger.warning(f"[Checkpoint] baseline not available, tests start from a restart: {e}")
+            self.baseline = None
+        if relaunch:
+            # 拍快照会停止应用
+            self.device.restart_app_by_bundle(self.app_bundle)
+            self.device.wait_for_idle(timeout=10, stable_frames=3)
+        return self.baseline
+
+    def _cold_start(self):
+        # 基线在第一个测试用例回放前才拍摄，紧接着就从它恢复并启动应用
+        if self.baseline is None and not self._baseline_tried:
+            self.checkpoint_baseline(relaunch=False)
+        if self.baseline is not None:
+            self.device.restore(self.baseline)
+        else:
+            self.device.restart_app_by_bundle(self.app_bundle)
+        self.device.wait_for_idle(timeout=10, stable_frames=3)
+
     def _replay_to_page(self, page_node):
             root = self.page_nodes[0]
             target = page_node
 
             if target is root:
                 # self.device.restart_app(self.app)
-                self.device.restart_app_by_bundle(self.app_bundle)
-                time.sleep(10)
+                self._cold_start()
                 return True
             
             q = deque()
@@ -1626,9 +1763,12 @@ Output STRICT JSON ONLY (and nothing else):
             )
 
             # self.device.restart_app(self.app)
-            self.device.restart_app_by_bundle(self.app_bundle)
-            time.sleep(10)
+            self._cold_start()
 
+            if self._replay_edges(shortest_path_edges, target):
+                return True
+
+            self._cold_start()
             for edge in shortest_path_edges:
                 self._excute_action(edge)
 
@@ -1715,6 +1855,7 @@ Output STRICT JSON ONLY (and nothing else):
             action_type = parsed_output.get("action")
 
             path_record.append((page.img, parsed_output.get("description", "")))
+            acted_at = time.time()
 
             if action_type == "finished":
                 logger.info("Task finished as per LLM instruction.")
@@ -1739,7 +1880,7 @@ Output STRICT JSON ONLY (and nothing else):
             elif action_type == "press_back":
                 self.device.back()
 
-            time.sleep(3)
+            self.device.wait_for_idle(timeout=3)
 
             page = self.device.dump_page(refresh=True)
             self._is_page_exist(page, llm_open=False)
@@ -1748,10 +1889,11 @@ Output STRICT JSON ONLY (and nothing else):
             if max_operations <= 0:
                 return path_record
 
+            toasts = self._toasts_since(acted_at)
             conversation_history.append(
                 {
                     "role": "user",
-                    "content": [
+                    "content": ([{"type": "input_text", "text": f"上一步操作后弹出的 Toast: {toasts}"}] if toasts else []) + [
                         {
                             "type": "input_image",
                             "image_url": f"data:image/jpeg;base64,{page.encoded_img}"
@@ -1892,18 +2034,42 @@ Output STRICT JSON ONLY (and nothing else):
         return bug_info
 
 
-    def _is_page_exist(self, page: Page, llm_open=True) -> int:
+    def _register_page(self, page: Page):
+        """
+        多设备共享 page_nodes 时登记页面：匹配（可能请求 LLM）在锁外进行，
+        锁内只复核匹配期间其他设备新增的页面，并追加新节点，保证同一页面只有一个 index。
+
+        Returns:
+            tuple: (页面的 index, 新建的 PageNode；已存在时为 None)
+        """
+        count = len(self.page_nodes)
+        index = self._is_page_exist(page, stop=count)
+        if index < count:
+            return index, None
+        with self.lock:
+            if len(self.page_nodes) > count:
+                index = self._is_page_exist(page, start=count)
+                if index < len(self.page_nodes):
+                    return index, None
+            new_page_node = PageNode(index=len(self.page_nodes), page=page)
+            self.page_nodes.append(new_page_node)
+            return new_page_node.index, new_page_node
+
+    def _is_page_exist(self, page: Page, llm_open=True, start=0, stop=None) -> int:
+        # 只与 index 位于 [start, stop) 的页面比较；未命中时返回 len(self.page_nodes)
         if page.info is None or not page.info.ability:
             return len(self.page_nodes)
         
         current_ability = page.info.ability
 
-        if current_ability not in self.explored_abilities:
-            self.explored_abilities.append(current_ability)
-            return len(self.page_nodes)
+        with self.lock:
+            if current_ability not in self.explored_abilities:
+                self.explored_abilities.append(current_ability)
+                return len(self.page_nodes)
 
+        stop = len(self.page_nodes) if stop is None else stop
         found_indices = [
-            p.index for p in self.page_nodes
+            p.index for p in self.page_nodes[start:stop]
             if p.page and p.page.info and p.page.info.ability == current_ability and p.type == "page"
         ]
         # print(found_indices)
@@ -1974,6 +2140,13 @@ Output STRICT JSON ONLY (and nothing else):
                 return len(self.page_nodes)
 
 
+    def _is_unchanged(self, old_page: Page, new_page: Page) -> bool:
+        if old_page is None or new_page is None or old_page.info != new_page.info:
+            return False
+        if new_page.img_hash - old_page.img_hash > 2:
+            return False
+        return new_page.vht.diff(old_page.vht).empty
+
     def _page_similarity(self, page1, page2) -> float:
 
         def _calculate_vht_similarity(page1, page2):
@@ -2163,11 +2336,11 @@ Output STRICT JSON ONLY (and nothing else):
 
                         try:
                             if page_before is not None and page_before.img is not None:
-                                before_path = os.path.join(bug_dir, "before.png")
-                                cv2.imwrite(before_path, page_before.img)
+                                before_path = os.path.join(bug_dir, "before" + page_before.img_ext)
+                                page_before.save_img(before_path)
                             if page_after is not None and page_after.img is not None:
-                                after_path = os.path.join(bug_dir, "after.png")
-                                cv2.imwrite(after_path, page_after.img)
+                                after_path = os.path.join(bug_dir, "after" + page_after.img_ext)
+                                page_after.save_img(after_path)
                         except Exception as e_img:
                             logger.warning(f"[BUG-DETECT] failed to save screenshots for {bug_dir}: {e_img}")
 
@@ -2191,6 +2364,26 @@ Output STRICT JSON ONLY (and nothing else):
         return None
 
 
+    def _toasts_since(self, ts):
+        # 仅在设备推送 UI 事件时可用（见 Device.events()），否则返回空
+        hub = self.device.ui_events
+        if hub is None:
+            return []
+        events = hub.since(ts, (UIEventType.NOTIFICATION_STATE_CHANGED,))
+        return [e.text for e in events if "Toast" in e.class_name and e.text]
+
+    def _record_crash(self, crash, first):
+        if not first:
+            return
+        output_dir = getattr(self, "output_dir", "") or "output"
+        crash_dir = os.path.join(output_dir, "crashes")
+        os.makedirs(crash_dir, exist_ok=True)
+        try:
+            with open(os.path.join(crash_dir, f"{crash.kind}_{crash.signature}.json"), "w", encoding="utf-8") as f:
+                json.dump(crash.__dict__, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"[CRASH] failed to save crash {crash.signature}: {e}")
+
     def save_PTG(self, out_dir: str):
         os.makedirs(out_dir, exist_ok=True)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -2218,8 +2411,8 @@ Output STRICT JSON ONLY (and nothing else):
 
                 if getattr(node.page, "img", None) is not None:
                     try:
-                        screenshot_path = os.path.join(page_subdir, "screenshot.png")
-                        cv2.imwrite(screenshot_path, node.page.img)
+                        screenshot_path = os.path.join(page_subdir, "screenshot" + node.page.img_ext)
+                        node.page.save_img(screenshot_path)
                         screenshot_rel_path = os.path.relpath(screenshot_path, out_dir)
                     except Exception as e:
                         logger.error(f"Failed to save screenshot for node {node.index}: {e}")
@@ -0,0 +1,90 @@
+import shlex
+from dataclasses import dataclass
+from loguru import logger
+from hmbot.device.device import Device
+from hmbot.utils.proto import OperatingSystem
+
+
+# 设备端单条命令模板：点击与文本输入
+_TAP = {
+    OperatingSystem.ANDROID: "input tap {x} {y}",
+    OperatingSystem.HARMONY: "uitest uiInput click {x} {y}",
+}
+_TEXT = {
+    OperatingSystem.ANDROID: "input text {text}",
+    OperatingSystem.HARMONY: "uitest uiInput inputText {x} {y} {text}",
+}
+
+
+@dataclass
+class MacroStep:
+    action: str
+    x: int
+    y: int
+    content: str = ""
+
+
+class Macro:
+    """
+    由已知路径上的边编译而成的回放宏。
+
+    回放时不再逐步 dump 页面、调用 LLM 定位控件，而是直接使用边上记录的坐标，
+    步与步之间只做 idle 等待，最终页面由调用方校验一次。
+    """
+
+    def __init__(self, steps: list[MacroStep]):
+        self.steps = steps
+
+    def __len__(self):
+        return len(self.steps)
+
+    def run(self, device: Device, step_timeout=3):
+        # 主机端回放：每步之后等待界面稳定
+        for step in self.steps:
+            device.click(step.x, step.y)
+            device.wait_for_idle(timeout=step_timeout)
+            if step.action == "input":
+                device.input(step.content or "test input")
+                device.wait_for_idle(timeout=step_timeout)
+
+    def commands(self, operating_system, step_delay=1.5) -> list[str]:
+        # 设备端命令序列：无法在设备侧判断 idle，步间固定停顿
+        tap, text = _TAP[operating_system], _TEXT[operating_system]
+        lines = []
+        for step in self.steps:
+            lines.append(tap.format(x=step.x, y=step.y))
+            lines.append("sleep %s" % step_delay)
+            if step.action == "input":
+                content = step.content or "test input"
+                if operating_system == OperatingSystem.ANDROID:
+                    # input text 不支持空格，需要转成 %s
+                    content = content.replace(" ", "%s")
+                lines.append(text.format(x=step.x, y=step.y, text=shlex.quote(content)))
+                lines.append("sleep %s" % step_delay)
+        return lines
+
+    def run_on_device(self, device: Device, step_delay=1.5) -> bool:
+        # 整个宏作为一次 shell 调用在设备上执行，最后再等待界面稳定
+        results = device.connector.batch_shell(self.commands(OperatingSystem(device.operating_system), step_delay))
+        device.wait_for_idle(timeout=5)
+        return all(r.returncode == 0 for r in results)
+
+
+def compile_macro(edges: list) -> Macro | None:
+    """
+    把一串边编译为回放宏；任意一条边缺少可用坐标或动作不受支持时返回 None，
+    由调用方退回逐步回放。
+    """
+    steps = []
+    for edge in edges:
+        action = edge.get("action")
+        position = edge.get("position")
+        if action not in ("click", "input"):
+            logger.debug(f"[macro] unsupported action {action!r}, cannot compile path")
+            return None
+        if not position or len(position) != 2 or tuple(position) == (0, 0):
+            logger.debug(f"[macro] edge {edge.get('description', '')!r} has no stored position")
+            return None
+        steps.append(MacroStep(action=action, x=int(position[0]), y=int(position[1]),
+                               content=edge.get("content", "") or ""))
+    return Macro(steps)
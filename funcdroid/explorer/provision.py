@@ -0,0 +1,108 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from hmbot.explorer.utils import grant_all_permissions, disable_input_methods
+from hmbot.utils.proto import OperatingSystem, ProvisionReport
+
+
+class Provisioner:
+    """
+    多设备并行准备被测应用：安装、授权、禁用输入法、冷启动。
+
+    每一步以就绪探测（应用已安装、应用页面在前台）结束，而不是固定等待；
+    各设备在独立线程中进行，每一步的耗时记录在 ProvisionReport 中。
+    """
+
+    def __init__(self, devices, app, install_timeout=300, launch_timeout=30, interval=0.5):
+        """
+        Args:
+            devices (list): The devices to provision.
+            app (App): The application under test.
+            install_timeout (float): Seconds an installation may take until the package is reported.
+            launch_timeout (float): Seconds a cold start may take until the app is in the foreground.
+            interval (float): Seconds between two readiness probes.
+        """
+        self.devices = devices
+        self.app = app
+        self.install_timeout = install_timeout
+        self.launch_timeout = launch_timeout
+        self.interval = interval
+        # Harmony 从路径加载的应用没有包名，此时只能以安装调用返回作为就绪
+        self.bundle = getattr(app, "package_name", "") or getattr(app, "bundle", "")
+        self.reports = {}
+
+    def run(self):
+        """
+        Provision all devices at once.
+
+        Returns:
+            list: The ProvisionReport of every device, in the order of devices.
+        """
+        if not self.devices:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as pool:
+            reports = list(pool.map(self.provision, self.devices))
+        for report in reports:
+            self.reports[report.serial] = report
+            logger.info(f"[PROVISION] device:{report.serial} {'ready' if report.ok else 'FAILED'} "
+                        f"in {report.total:.1f}s {self._format_steps(report.steps)}"
+                        + (f" error: {report.error}" if report.error else ""))
+        return reports
+
+    @property
+    def ready(self):
+        return [device for device in self.devices
+                if device.serial in self.reports and self.reports[device.serial].ok]
+
+    def provision(self, device):
+        steps = {}
+        start = time.time()
+        try:
+            self._step(steps, "install", self._install, device)
+            if device.operating_system == OperatingSystem.ANDROID:
+                # pm grant 与 settings 仅适用于 Android
+                self._step(steps, "grant", grant_all_permissions, device, self.bundle,
+                           getattr(self.app, "permissions", None))
+                self._step(steps, "disable_ime", disable_input_methods, device)
+            self._step(steps, "launch", self._cold_start, device)
+        except Exception as e:
+            logger.exception(f"[PROVISION] device:{device.serial} failed: {e}")
+            return ProvisionReport(serial=device.serial, ok=False, steps=steps,
+                                   total=time.time() - start, error=str(e))
+        return ProvisionReport(serial=device.serial, ok=True, steps=steps, total=time.time() - start, error="")
+
+    @staticmethod
+    def _step(steps, name, func, *args):
+        start = time.time()
+        func(*args)
+        steps[name] = time.time() - start
+
+    def _install(self, device):
+        device.install_app(self.app)
+        if self.bundle and not self._poll(lambda: device.connector.is_installed(self.bundle), self.install_timeout):
+            raise TimeoutError(f"{self.bundle} is not installed after {self.install_timeout}s")
+
+    def _cold_start(self, device):
+        device.stop_app(self.app)
+        device.start_app(self.app)
+        if self.bundle:
+            if not self._poll(lambda: device.page_info().bundle == self.bundle, self.launch_timeout):
+                raise TimeoutError(f"{self.bundle} is not in the foreground after {self.launch_timeout}s")
+        # 应用已在前台，再等首屏渲染稳定（闪屏页跳转等）
+        device.wait_for_idle(timeout=self.launch_timeout, stable_frames=3)
+
+    def _poll(self, probe, timeout):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                if probe():
+                    return True
+            except Exception as e:
+                logger.debug(f"[PROVISION] readiness probe failed: {e}")
+            if time.time() + self.interval > deadline:
+                return False
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _format_steps(steps):
+        return " ".join(f"{name}={seconds:.1f}s" for (name, seconds) in steps.items())
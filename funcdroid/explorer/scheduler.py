@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from loguru import logger
+from hmbot.explorer.explorer import Explorer
+from hmbot.explorer.fdg import PageNode
+from hmbot.explorer.macro import compile_macro
+from hmbot.explorer.utils import grant_all_permissions
+
+
+class Scheduler:
+    """
+    多设备并行探索调度器。
+
+    所有设备上的 Explorer 共享同一张 PTG（page_nodes / explored_abilities / lock），
+    页面匹配在锁外进行，锁内复核并登记新节点（见 Explorer._register_page），保证同一页面只会得到一个 index。
+    每台设备从共享前沿中领取一个尚未探索的页面，重启应用并沿记录的路径回放到该页面，
+    再执行它的边；新发现的页面在该设备完成后才进入前沿，避免领取到边尚未生成完的节点。
+    """
+
+    def __init__(self, explorers: list[Explorer]):
+        if not explorers:
+            raise ValueError("Scheduler needs at least one explorer")
+        self.primary = explorers[0]
+        self.explorers = explorers
+        for explorer in explorers[1:]:
+            explorer.page_nodes = self.primary.page_nodes
+            explorer.explored_abilities = self.primary.explored_abilities
+            explorer.lock = self.primary.lock
+            explorer.start_time = self.primary.start_time
+            explorer.time_limit_seconds = self.primary.time_limit_seconds
+
+        # 前沿：(page_node, 从启动页到该页面的路径)
+        self._frontier = deque()
+        self._cond = threading.Condition()
+        self._busy = 0
+
+    def run(self, output_dir: str):
+        primary = self.primary
+        primary.output_dir = output_dir
+        primary._declared_activities = set(primary.app_abilities or [])
+        out = Path(output_dir)
+        primary._act_cov_path = out / "activity_coverage.json"
+        primary._act_cov_hist_path = out / "activity_coverage_history.jsonl"
+
+        for explorer in self.explorers:
+            serial = explorer.device.serial
+            if explorer is not primary:
+                # 各设备的 bug 截图与日志写入独立子目录，PTG 只由主设备保存
+                explorer.output_dir = os.path.join(output_dir, serial)
+                os.makedirs(explorer.output_dir, exist_ok=True)
+            if not explorer.provisioned:
+                grant_all_permissions(explorer.device, explorer.app_bundle, explorer.app_permissions)
+
+        primary.root_page_node = PageNode(index=-1, page=None)
+        primary.root_page_node.edges.append({
+            "description": "",
+            "action": "click",
+            "position": [0, 0],
+            "content": "",
+            "is_leaf": False,
+            "page_node": None
+        })
+
+        try:
+            # 启动页由主设备探索，其余设备在前沿出现后加入
+            primary._excute_edges(primary.root_page_node)
+            self._expand(primary.root_page_node, [])
+
+            workers = [
+                threading.Thread(target=self._work, args=(explorer,), daemon=True)
+                for explorer in self.explorers
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            logger.info("Parallel exploration completed successfully.")
+        except Exception as e:
+            logger.exception(f"Error occurred in parallel explore: {e}")
+        finally:
+            logger.info("Parallel exploration finished. Saving PTG...")
+            for explorer in self.explorers:
+                explorer._bug_detector_running = False
+            primary.save_PTG(output_dir)
+
+    def _stopped(self):
+        return any(e.stop_exploration or e._time_exceeded() for e in self.explorers)
+
+    def _expand(self, page_node: PageNode, path: list):
+        with self._cond:
+            for edge in page_node.edges:
+                if edge["is_leaf"] or edge["page_node"] is None:
+                    continue
+                if page_node.index == -1:
+                    self._frontier.append((edge["page_node"], []))
+                else:
+                    self._frontier.append((edge["page_node"], path + [(page_node.index, edge)]))
+            self._cond.notify_all()
+
+    def _claim(self):
+        # 调用方需持有 self._cond
+        while self._frontier:
+            page_node, path = self._frontier.popleft()
+            if page_node.is_visited or page_node.type != "page" or page_node.edges == []:
+                continue
+            if len(path) >= self.primary.depth_limit:
+                continue
+            page_node.is_visited = True
+            return page_node, path
+        return None
+
+    def _work(self, explorer: Explorer):
+        serial = explorer.device.serial
+        while True:
+            with self._cond:
+                task = self._claim()
+                while task is None and self._busy > 0 and not self._stopped():
+                    self._cond.wait(timeout=5)
+                    task = self._claim()
+                if task is None:
+                    self._cond.notify_all()
+                    logger.info(f"[{serial}] no page left to explore.")
+                    return
+                self._busy += 1
+
+            page_node, path = task
+            explored = False
+            try:
+                logger.info(f"[{serial}] claimed page {page_node.index} (depth {len(path)})")
+                if self._navigate(explorer, page_node, path):
+                    explorer.path = list(path)
+                    explorer._excute_edges(page_node)
+                    explored = True
+            except Exception as e:
+                logger.exception(f"[{serial}] failed to explore page {page_node.index}: {e}")
+            finally:
+                explorer.path = []
+                with self._cond:
+                    # 子页面先入前沿再释放 busy，其他设备才不会误判探索已结束
+                    if explored:
+                        self._expand(page_node, path)
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _navigate(self, explorer: Explorer, page_node: PageNode, path: list) -> bool:
+        device = explorer.device
+        edges = [edge for _, edge in path]
+        # 先编译：路径为空或无法编译时不需要为宏回放多重启一次
+        macro = compile_macro(edges)
+        device.restart_app_by_bundle(explorer.app_bundle)
+        device.wait_for_idle(timeout=15, stable_frames=3)
+        if not edges:
+            return explorer._reached(page_node, f"[{device.serial}] restart")
+        if macro is not None:
+            if explorer._replay_edges(edges, page_node, macro):
+                return True
+            device.restart_app_by_bundle(explorer.app_bundle)
+            device.wait_for_idle(timeout=15, stable_frames=3)
+
+        for index, edge in path:
+            explorer.page_nodes[index].page = device.dump_page(refresh=True)
+            if explorer._excute_action(edge) is False:
+                logger.info(f"[{device.serial}] replay broke at page {index}, skip page {page_node.index}")
+                return False
+
+        return explorer._reached(page_node, f"[{device.serial}] replay")
@@ -1,49 +1,59 @@
-import subprocess
+import re
 
 
-def disable_input_methods():
+DANGEROUS_PERMISSIONS = [
+    "android.permission.READ_CALENDAR",
+    "android.permission.WRITE_CALENDAR",
+    "android.permission.CAMERA",
+    "android.permission.READ_CONTACTS",
+    "android.permission.WRITE_CONTACTS",
+    "android.permission.GET_ACCOUNTS",
+    "android.permission.ACCESS_FINE_LOCATION",
+    "android.permission.ACCESS_COARSE_LOCATION",
+    "android.permission.RECORD_AUDIO",
+    "android.permission.READ_PHONE_STATE",
+    "android.permission.CALL_PHONE",
+    "android.permission.READ_CALL_LOG",
+    "android.permission.WRITE_CALL_LOG",
+    "android.permission.ADD_VOICEMAIL",
+    "android.permission.USE_SIP",
+    "android.permission.PROCESS_OUTGOING_CALLS",
+    "android.permission.BODY_SENSORS",
+    "android.permission.SEND_SMS",
+    "android.permission.RECEIVE_SMS",
+    "android.permission.READ_SMS",
+    "android.permission.RECEIVE_WAP_PUSH",
+    "android.permission.RECEIVE_MMS",
+    "android.permission.READ_EXTERNAL_STORAGE",
+    "android.permission.WRITE_EXTERNAL_STORAGE",
+]
+
+
+def disable_input_methods(device):
         """禁用所有输入法，防止输入法弹出干扰"""
-        cmd = [
-            "adb",
-            "shell",
-            "settings", "put", "secure",
-            "default_input_method",
-            "com.android.inputmethod.none/.NullIME"
-        ]
-        subprocess.run(cmd, capture_output=True, text=True)
+        device.connector.batch_shell([
+            "settings put secure default_input_method com.android.inputmethod.none/.NullIME"
+        ])
+
+
+def grant_all_permissions(device, package_name: str, permissions=None):
+    """
+    一次往返授予所有危险权限；若给出 permissions（APK manifest 中声明的权限），只授予其中的危险权限
+    """
+    perms = DANGEROUS_PERMISSIONS
+    if permissions is not None:
+        declared = set(permissions)
+        perms = [perm for perm in DANGEROUS_PERMISSIONS if perm in declared]
+    return device.connector.batch_shell([f"pm grant {package_name} {perm}" for perm in perms])
 
 
-def grant_all_permissions(package_name: str):
-    dangerous_perms = [
-        "android.permission.READ_CALENDAR",
-        "android.permission.WRITE_CALENDAR",
-        "android.permission.CAMERA",
-        "android.permission.READ_CONTACTS",
-        "android.permission.WRITE_CONTACTS",
-        "android.permission.GET_ACCOUNTS",
-        "android.permission.ACCESS_FINE_LOCATION",
-        "android.permission.ACCESS_COARSE_LOCATION",
-        "android.permission.RECORD_AUDIO",
-        "android.permission.READ_PHONE_STATE",
-        "android.permission.CALL_PHONE",
-        "android.permission.READ_CALL_LOG",
-        "android.permission.WRITE_CALL_LOG",
-        "android.permission.ADD_VOICEMAIL",
-        "android.permission.USE_SIP",
-        "android.permission.PROCESS_OUTGOING_CALLS",
-        "android.permission.BODY_SENSORS",
-        "android.permission.SEND_SMS",
-        "android.permission.RECEIVE_SMS",
-        "android.permission.READ_SMS",
-        "android.permission.RECEIVE_WAP_PUSH",
-        "android.permission.RECEIVE_MMS",
-        "android.permission.READ_EXTERNAL_STORAGE",
-        "android.permission.WRITE_EXTERNAL_STORAGE",
-    ]
+def get_current_app_package(device) -> str:
+    results = device.connector.batch_shell(["dumpsys window | grep mCurrentFocus"])
+    m = re.search(r"\s([a-zA-Z0-9_\.]+)\/", results[0].output)
+    if m:
+        return m.group(1)
 
-    for perm in dangerous_perms:
-        cmd = ["adb", "shell", "pm", "grant", package_name, perm]
-        subprocess.run(cmd, capture_output=True, text=True)
+    return ""
 
 
 def clean_llm_json(raw: str) -> str:
@@ -1,9 +1,11 @@
-import time
 from .app.android_app import AndroidApp
 from .app.harmony_app import HarmonyApp
 from .device.device import Device
 from .model.event import StartAppEvent
 from .explorer.llm import LLM
+from .explorer.explorer import Explorer
+from .explorer.scheduler import Scheduler
+from .explorer.provision import Provisioner
 from .utils.proto import OperatingSystem, ExploreGoal
 from .model.page import Page
 from .model.ptg import PTG
@@ -22,7 +24,7 @@ class HMBot(object):
         for serial in serials:
             self.devices.append(Device(serial, os))
 
-    def explore(self, args):
+    def _load_app(self, args):
         if args.os == OperatingSystem.HARMONY:
             if not args.app_path.endswith('.hap'):
                 logger.error("Harmony application path must end with .hap!")
@@ -35,14 +37,21 @@ class HMBot(object):
                 exit(1)
             else:
                 self.app = AndroidApp(app_path=args.app_path)
+        else:
+            logger.error("%s is not supported" % args.os)
+            exit(1)
+        return self.app
+
+    def explore(self, args):
+        self._load_app(args)
 
-        for device in self.devices:
+        provisioner = Provisioner(self.devices, self.app)
+        provisioner.run()
+        for device in provisioner.ready:
             llm = LLM(device=device, url=self.llm_config['base_url'], model=self.llm_config['model'],
                       api_key=self.llm_config['api_key'])
-            device.install_app(self.app)
-            time.sleep(5)
-            device.start_app(self.app)
-            time.sleep(10)
+            # Resource probing is only needed when exploring for hardware goals
+            device.probe_resources = bool(args.hardware)
 
             output_dir = args.output
             if not output_dir.endswith('/'):
@@ -85,3 +94,24 @@ class HMBot(object):
                             os.makedirs(testcase_dir)
                         llm.explore(key=ExploreGoal.TESTCASE, value=script, max_steps=args.max_steps,
                                     output_dir=testcase_dir)
+
+    def explore_parallel(self, args):
+        """
+        Explore one application on all devices at once, the devices sharing a single page transition graph.
+        """
+        self._load_app(args)
+
+        provisioner = Provisioner(self.devices, self.app)
+        provisioner.run()
+        explorers = []
+        for device in provisioner.ready:
+            # Functional exploration has no hardware goal, so skip resource probing in dump_page
+            device.probe_resources = False
+            explorer = Explorer(device, getattr(self.app, 'app_name', ''), self.app)
+            # Permissions were granted while provisioning
+            explorer.provisioned = True
+            explorers.append(explorer)
+
+        if not os.path.exists(args.output):
+            os.makedirs(args.output)
+        Scheduler(explorers).run(args.output)
@@ -0,0 +1,302 @@
+import numpy as np
+import sys
+from .vht import VHT, VHTNode, _pack, _unpack, _parse_bounds, _stream_xml, _FLAGS, _FLAG_CODES, _FLAG_SHIFTS
+
+# Columns holding categorical codes, and the node slot each one fills
+_CATEGORICAL = {'bundle': '_bundle', 'page': '_page', 'type': '_type', 'id': '_id'}
+_HAS_BOUNDS = 1
+_HAS_CENTER = 2
+
+
+class _LazyNode(VHTNode):
+    """
+    A node materialised from an ArrayVHT; its children are materialised when first read.
+    """
+    __slots__ = ('_vht', '_index', '_kids')
+
+    @property
+    def _children(self):
+        if self._kids is None:
+            self._kids = [self._vht.node(j) for j in self._vht.children(self._index)]
+        return self._kids
+
+    @_children.setter
+    def _children(self, children):
+        self._kids = children
+
+
+class _Columns(object):
+    # Collects the rows of an ArrayVHT in pre-order
+    def __init__(self):
+        self.parent, self.has, self.flags, self.bounds, self.center, self.texts = [], [], [], [], [], []
+        self.codes = {key: [] for key in _CATEGORICAL}
+        self.categories = {key: [] for key in _CATEGORICAL}
+        self.index = {key: {} for key in _CATEGORICAL}
+        self.extra = {}
+
+    def add(self, parent, strings, text, flags, bounds, center, extra=None):
+        i = len(self.parent)
+        self.parent.append(parent)
+        for (key, value) in strings.items():
+            code = self.index[key].get(value)
+            if code is None:
+                code = self.index[key][value] = len(self.categories[key])
+                self.categories[key].append(sys.intern(value) if isinstance(value, str) else value)
+            self.codes[key].append(code)
+        self.texts.append(text)
+        self.flags.append(flags)
+        self.has.append((_HAS_BOUNDS if bounds is not None else 0) | (_HAS_CENTER if center is not None else 0))
+        self.bounds.append(bounds if bounds is not None else (0, 0, 0, 0))
+        self.center.append(center if center is not None else (0, 0))
+        if extra:
+            self.extra[i] = extra
+        return i
+
+
+class ArrayVHT(VHT):
+    """
+    A view hierarchy tree stored as arrays (struct of arrays, nodes in pre-order).
+
+    Every node is a row: its parent, bounds, center, flag bits (as in VHTNode) and
+    categorical codes for type, id, bundle and page. Attribute queries, spatial queries
+    and node counts are vectorized; VHTNode objects are only built for the nodes a
+    caller actually receives, and their children only when read. The arrays are a
+    snapshot: changes to materialised nodes are not written back.
+    """
+    def __init__(self, columns, device=None):
+        n = len(columns.parent)
+        self.device = device
+        self.parent = np.asarray(columns.parent, dtype=np.int32).reshape(n)
+        self.has = np.asarray(columns.has, dtype=np.uint8).reshape(n)
+        self.flags = np.asarray(columns.flags, dtype=np.uint16).reshape(n)
+        self.bounds = np.asarray(columns.bounds, dtype=np.int32).reshape(n, 4)
+        self.center = np.asarray(columns.center, dtype=np.int32).reshape(n, 2)
+        self.texts = np.empty(n, dtype=object)
+        self.texts[:] = columns.texts
+        self.codes = {key: np.asarray(codes, dtype=np.int32).reshape(n) for (key, codes) in columns.codes.items()}
+        self.categories = columns.categories
+        self.extra = columns.extra
+        self.end = self._subtree_ends(columns.parent)
+        self._nodes = {}
+
+    @staticmethod
+    def _subtree_ends(parent):
+        # In pre-order a subtree is the slice [i, end[i])
+        n = len(parent)
+        size = [1] * n
+        for i in range(n - 1, 0, -1):
+            size[parent[i]] += size[i]
+        return np.arange(n, dtype=np.int32) + np.asarray(size, dtype=np.int32).reshape(n)
+
+    @classmethod
+    def from_adb_xml(cls, source, device=None):
+        """
+        Stream a uiautomator dump straight into arrays, without building nodes or an element tree.
+        """
+        def build(events):
+            columns = _Columns()
+            stack = []
+            for (event, elem) in events:
+                if event == 'end':
+                    stack.pop()
+                    elem.clear()
+                    continue
+                parent = stack[-1] if stack else -1
+                if elem.tag == 'node':
+                    extra = elem.attrib
+                    bounds = _parse_bounds(extra['bounds'])
+                    if bounds is None or bounds == (2147483647, 2147483647, -2147483648, -2147483648):
+                        bounds = (0, 0, 100, 100)
+                    (x1, y1, x2, y2) = bounds
+                    strings = {'bundle': extra['package'], 'page': '', 'type': extra['class'], 'id': extra['resource-id']}
+                    values = (extra['clickable'], extra['long-clickable'], extra['selected'], extra['checkable'],
+                              extra['checked'], extra['enabled'], extra['focused'])
+                    text = extra['text']
+                else:
+                    x1, y1, x2, y2 = 0, 0, 0, 0
+                    strings = {'bundle': '', 'page': '', 'type': '', 'id': ''}
+                    values = ('',) * len(_FLAGS)
+                    text = ''
+                (flags, odd) = (0, None)
+                for (i, value) in enumerate(values):
+                    code = _FLAG_CODES.get(value)
+                    if code is None:
+                        odd = odd or {}
+                        odd[_FLAGS[i]] = value
+                    else:
+                        flags |= code << (2 * i)
+                i = columns.add(parent, strings, text, flags, (x1, y1, x2, y2),
+                                (int((x1 + x2)/2), int((y1 + y2)/2)), odd)
+                stack.append(i)
+            return columns
+        return cls(_stream_xml(source, build), device)
+
+    @classmethod
+    def from_vht(cls, vht):
+        """
+        Convert a tree of nodes (e.g. from the HDC parser) into arrays.
+        """
+        columns = _Columns()
+        stack = [(vht._root, -1)] if vht._root is not None else []
+        device = None
+        while stack:
+            (node, parent) = stack.pop()
+            device = device or node._device
+            strings = {key: getattr(node, slot) for (key, slot) in _CATEGORICAL.items()}
+            bounds = tuple(_unpack(node._bounds, 4)) if node._bounds is not None else None
+            center = tuple(_unpack(node._center, 2)) if node._center is not None else None
+            i = columns.add(parent, strings, node._text, node._flags, bounds, center,
+                            dict(node._extra) if node._extra else None)
+            stack.extend([(child, i) for child in reversed(node._children)])
+        return cls(columns, device)
+
+    def get_node_count(self):
+        return len(self.parent)
+
+    @property
+    def _root(self):
+        return self.node(0) if len(self.parent) else None
+
+    def node(self, i):
+        """
+        Returns:
+            VHTNode: The node of row i, the same object on every call.
+        """
+        i = int(i)
+        node = self._nodes.get(i)
+        if node is not None:
+            return node
+        node = _LazyNode.__new__(_LazyNode)
+        for (key, slot) in _CATEGORICAL.items():
+            setattr(node, slot, self.categories[key][self.codes[key][i]])
+        node._text = self.texts[i]
+        node._flags = int(self.flags[i])
+        node._extra = dict(self.extra[i]) if i in self.extra else None
+        node._bounds = node._center = None
+        if self.has[i] & _HAS_BOUNDS:
+            node._set('bounds', [[int(v) for v in self.bounds[i][:2]], [int(v) for v in self.bounds[i][2:]]])
+        if self.has[i] & _HAS_CENTER:
+            node._set('center', [int(v) for v in self.center[i]])
+        node._device = self.device
+        node._compressed = None
+        node._vht = self
+        node._index = i
+        node._kids = None
+        self._nodes[i] = node
+        return node
+
+    def children(self, i):
+        """
+        Returns:
+            list: The rows of the children of row i.
+        """
+        (j, end, rows) = (i + 1, int(self.end[i]), [])
+        while j < end:
+            rows.append(j)
+            j = int(self.end[j])
+        return rows
+
+    def _mask(self, key, value):
+        if key in _CATEGORICAL:
+            categories = self.categories[key]
+            mask = np.zeros(len(self.parent), dtype=bool)
+            for (code, category) in enumerate(categories):
+                if category is not None and category == value:
+                    mask |= self.codes[key] == code
+        elif key in _FLAG_SHIFTS:
+            code = _FLAG_CODES.get(value) if isinstance(value, str) else None
+            if code is None:
+                mask = np.zeros(len(self.parent), dtype=bool)
+            else:
+                mask = ((self.flags >> _FLAG_SHIFTS[key]) & 3) == code
+        elif key == 'text':
+            mask = self.texts == value if isinstance(value, str) else np.zeros(len(self.parent), dtype=bool)
+        elif key in ('bounds', 'center'):
+            try:
+                values = [v for point in value for v in point] if key == 'bounds' else list(value)
+            except TypeError:
+                values = []
+            column = self.bounds if key == 'bounds' else self.center
+            if len(values) != column.shape[1]:
+                mask = np.zeros(len(self.parent), dtype=bool)
+            else:
+                present = (self.has & (_HAS_BOUNDS if key == 'bounds' else _HAS_CENTER)) != 0
+                mask = present & (column == np.asarray(values)).all(axis=1)
+        else:
+            mask = np.zeros(len(self.parent), dtype=bool)
+        # Values kept outside the columns override them
+        for (i, extra) in self.extra.items():
+            if key in extra:
+                mask[i] = extra[key] == value
+        return mask
+
+    def select(self, within=None, **kwds):
+        """
+        Find nodes by attribute values and, optionally, by position.
+
+        Args:
+            within (tuple): (x1, y1, x2, y2); only nodes whose bounds lie inside are selected.
+            kwds: Attribute values the nodes must have, as in VHTNode.__call__.
+
+        Returns:
+            np.ndarray: The rows of the matching nodes, in pre-order.
+        """
+        mask = np.ones(len(self.parent), dtype=bool)
+        for (key, value) in kwds.items():
+            mask &= self._mask(key, value)
+        if within is not None:
+            (x1, y1, x2, y2) = within
+            b = self.bounds
+            mask &= ((self.has & _HAS_BOUNDS) != 0) & (b[:, 0] >= x1) & (b[:, 1] >= y1) & (b[:, 2] <= x2) & (b[:, 3] <= y2)
+        return np.flatnonzero(mask)
+
+    def find(self, within=None, **kwds):
+        """
+        Returns:
+            list: The matching nodes (see select()), materialised.
+        """
+        return [self.node(i) for i in self.select(within, **kwds)]
+
+    def __call__(self, **kwds):
+        return self.find(**kwds)
+
+    def nodes_at(self, x, y, **kwds):
+        """
+        Returns:
+            list: The nodes whose bounds contain the point, outermost first (as VHT.nodes_at).
+        """
+        (x, y) = (int(x), int(y))
+        if x < 0 or y < 0:
+            return []
+        b = self.bounds
+        mask = ((self.has & _HAS_BOUNDS) != 0) & (b[:, 0] <= x) & (b[:, 1] <= y) & (b[:, 2] > x) & (b[:, 3] > y)
+        for (key, value) in kwds.items():
+            mask &= self._mask(key, value)
+        return [self.node(i) for i in np.flatnonzero(mask)]
+
+    def subtree(self, node):
+        """
+        Returns:
+            ArrayVHT: The subtree rooted at a node (or row) of this tree, sharing its categories.
+        """
+        i = node._index if isinstance(node, _LazyNode) and node._vht is self else int(node)
+        j = int(self.end[i])
+        sub = ArrayVHT.__new__(ArrayVHT)
+        sub.device = self.device
+        sub.parent = self.parent[i:j] - i
+        sub.parent[0] = -1
+        sub.has = self.has[i:j]
+        sub.flags = self.flags[i:j]
+        sub.bounds = self.bounds[i:j]
+        sub.center = self.center[i:j]
+        sub.texts = self.texts[i:j]
+        sub.codes = {key: codes[i:j] for (key, codes) in self.codes.items()}
+        sub.categories = self.categories
+        sub.extra = {k - i: v for (k, v) in self.extra.items() if i <= k < j}
+        sub.end = self.end[i:j] - i
+        sub._nodes = {}
+        return sub
+
+    def _compress(self, node):
+        raise NotImplementedError('an ArrayVHT is not compressed')
+
@@ -1,68 +1,224 @@
 from .vht import VHT, VHTParser
-from ..utils.cv import write
-import imagehash, cv2
-from PIL import Image
-import hashlib
+from ..utils.cv import write, phash, decode
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib, base64, threading, time
 from hmbot.utils.cv import encode_image
 
+# 后台预计算页面指纹的共享线程池，首次使用时创建
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _fingerprint_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='page-fingerprint')
+        return _pool
+
+
+class _Lazy(object):
+    """
+    A Page field computed by Page._compute_<name> on first read, then memoized.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, page, owner=None):
+        if page is None:
+            return self
+        return page._field(self.name)
+
+    def __set__(self, page, value):
+        with page._lock:
+            page._values[self.name] = value
+
+
 class Page(object):
+    # 按需计算的字段，precompute() 默认在后台计算其中耗时的几项
+    FINGERPRINTS = ('encoded_img', 'img_hash', 'vht_hash', 'feature_set')
+    EXPENSIVE = ('encoded_img', 'img_hash', 'vht_hash')
+
+    # LLM 载荷：截图的 base64 JPEG
+    encoded_img = _Lazy()
+    # 截图哈希值，用于快速比较两个页面的视觉相似度
+    img_hash = _Lazy()
+    # 结构哈希值，用于快速比较两个页面的结构相似度
+    vht_hash = _Lazy()
+    # 节点结构化特征集合，结构哈希不同时用于计算相似度
+    feature_set = _Lazy()
+
     def __init__(self, vht=None, img=None, rsc=None, info=None):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pending = {}
+        # 各字段的计算耗时（秒）{'vht_hash': 0.004, ...}
+        self.timings = {}
         self.vht = vht
         self.img = img
-        self.encoded_img = encode_image(img)
+        # 指纹基于标准化之前的完整树计算
+        self._fingerprint_vht = vht
         self.rsc = rsc
         self.info = info
-        # 结构哈希值，用于快速比较两个页面的结构相似度
-        self.vht_hash, self.feature_set = self._process_vht_recursively(vht._root)
-        # 截图哈希值，用于快速比较两个页面的视觉相似度
-        self.img_hash = imagehash.phash(Image.fromarray(cv2.cvtColor(self.img, cv2.COLOR_BGR2RGB)))
         self._standardize()
         self.abstract = ""
+        # 各部分采集的起止时间 {'vht': (start, end), ...}
+        self.timestamps = {}
+        # 采集期间前台页面是否保持不变
+        self.consistent = True
 
+    def precompute(self, fields=EXPENSIVE, executor=None):
+        """
+        Compute fingerprints in the background; reading one before it is done waits for it.
 
-    def _process_vht_recursively(self, node):
+        Args:
+            fields (iterable): The fields to compute, among FINGERPRINTS.
+            executor (Executor): Where to compute them, a shared pool by default.
         """
-        1. 计算节点的结构哈希值 (自下而上构建)。
-        2. 提取节点及其所有子节点的结构化特征集合 (聚合)。
+        executor = executor or _fingerprint_pool()
+        for name in fields:
+            with self._lock:
+                if name in self._values or name in self._pending:
+                    continue
+                future = self._pending[name] = Future()
+            executor.submit(self._run, name, future)
+        return self
+
+    def _field(self, name):
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+            future = self._pending.get(name)
+            if future is None:
+                future = self._pending[name] = Future()
+                owner = True
+            else:
+                owner = False
+        if owner:
+            self._run(name, future)
+        return future.result()
+
+    def _run(self, name, future):
+        start = time.time()
+        try:
+            value = getattr(self, '_compute_' + name)()
+        except BaseException as e:
+            # 失败不缓存，下次读取时重试
+            with self._lock:
+                self._pending.pop(name, None)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._values[name] = value
+            self._pending.pop(name, None)
+            self.timings[name] = time.time() - start
+        future.set_result(value)
+
+    def _forget(self, *names):
+        with self._lock:
+            for name in names:
+                self._values.pop(name, None)
+                self.timings.pop(name, None)
+
+    def _compute_encoded_img(self):
+        if self.img_bytes is not None:
+            # 设备返回的 JPEG 字节直接作为 LLM 载荷，省去解码后再编码
+            return base64.b64encode(self.img_bytes).decode('utf-8')
+        if self._img is None:
+            return ''
+        return encode_image(self._img)
+
+    def _compute_img_hash(self):
+        img = self.img
+        return phash(img) if img is not None else None
+
+    def _compute_vht_hash(self):
+        vht = self._fingerprint_vht
+        return self._vht_hash(vht._root) if vht is not None else ''
+
+    def _compute_feature_set(self):
+        vht = self._fingerprint_vht
+        features = set()
+        stack = [vht._root] if vht is not None and vht._root is not None else []
+        while stack:
+            node = stack.pop()
+            # 与结构哈希一致，叶子节点不计入
+            if node._children:
+                features.add(self._node_feature(node)[0])
+                stack.extend(node._children)
+        return features
+
+    @property
+    def img(self):
+        # 像素按需解码，只在 phash、裁剪等需要时进行
+        if self._img is None and self.img_bytes is not None:
+            self._img = decode(self.img_bytes)
+        return self._img
+
+    @img.setter
+    def img(self, img):
+        self._forget('encoded_img', 'img_hash')
+        if isinstance(img, (bytes, bytearray)):
+            self.img_bytes = bytes(img)
+            self._img = None
+        else:
+            self.img_bytes = None
+            self._img = img
+
+    @property
+    def img_ext(self):
+        return '.jpeg' if self.img_bytes is not None else '.png'
+
+    def save_img(self, path):
+        """
+        Save the screenshot, writing the device bytes as they are when the extension allows it.
         """
-        if not node:
-            return ('', set()) # 基本情况：空节点返回空哈希和空集合
-
-        # 1. 提取当前节点自身的属性和特征
-        t = node.attribute.get('type', '')
-        clickable = node.attribute.get('clickable', '')
-        bounds = node.attribute.get('bounds', '')
-        
+        if self.img_bytes is not None and path.lower().endswith(('.jpg', '.jpeg')):
+            write(path, self.img_bytes)
+        else:
+            write(path, self.img)
+
+    @staticmethod
+    def _node_feature(node):
+        """
+        Returns:
+            tuple: 节点自身的特征，以及参与结构哈希的 (type, clickable, 尺寸) 描述。
+        """
+        t = node._get('type', '')
+        clickable = node._get('clickable', '')
+        bounds = node._get('bounds', '')
+
         if isinstance(bounds, list) and len(bounds) == 2 and bounds[0] and bounds[1]:
             w = bounds[1][0] - bounds[0][0]
             h = bounds[1][1] - bounds[0][1]
             bounds_repr = f"{w}x{h}"
         else:
             bounds_repr = "invalid_bounds"
-        
-        # 当前节点自身的特征
-        current_node_feature = f"type={t}|clickable={clickable}|bounds={bounds_repr}"
-        # 初始化最终的特征集，包含当前节点的特征
-        total_features = {current_node_feature}
-
-        # 2. 递归处理所有子节点
-        child_hashes = []
-        for child in node._children:
-            # 递归调用，获取子节点的哈希和特征集
-            child_hash, child_features = self._process_vht_recursively(child)
-            
-            # 收集子节点的哈希，用于构建当前节点的哈希
-            child_hashes.append(child_hash)
-            # 聚合子节点的特征集
-            total_features.update(child_features)
-
-        # 3. 计算当前节点的哈希值
-        child_hashes.sort()
-        content_for_hash = f"{t}|{clickable}|{bounds_repr}|{'-'.join(child_hashes)}"
-        final_hash = hashlib.md5(content_for_hash.encode('utf-8')).hexdigest()
-
-        # 4. 返回当前节点处理完成的哈希和聚合后的总特征集
-        return (final_hash, total_features)
+        return (f"type={t}|clickable={clickable}|bounds={bounds_repr}", f"{t}|{clickable}|{bounds_repr}")
+
+    @classmethod
+    def _vht_hash(cls, root):
+        """
+        节点的结构哈希值自下而上构建：自身描述加上排序后的子节点哈希。
+        以显式栈后序遍历，深层树不会触发递归上限。
+        叶子节点（VHTNode 的真值为其子节点数）的哈希为空串，也不贡献特征。
+        """
+        if root is None or not root._children:
+            return ''
+        hashes = {}
+        stack = [(root, False)]
+        while stack:
+            (node, expanded) = stack.pop()
+            if not node._children:
+                hashes[id(node)] = ''
+            elif not expanded:
+                stack.append((node, True))
+                stack.extend([(child, False) for child in node._children])
+            else:
+                child_hashes = sorted(hashes.pop(id(child)) for child in node._children)
+                content_for_hash = f"{cls._node_feature(node)[1]}|{'-'.join(child_hashes)}"
+                hashes[id(node)] = hashlib.md5(content_for_hash.encode('utf-8')).hexdigest()
+        return hashes[id(root)]
 
     def _standardize(self):
         if not self.info:
@@ -70,7 +226,7 @@ class Page(object):
         if self.info.name == '':
             roots = self.vht(bundle=self.info.bundle)
             if len(roots) :
-                self.vht = VHT(roots[0])
+                self.vht = self.vht.subtree(roots[0])
                 self.info.name = self.vht._root.attribute['page']
 
     def __call__(self, **kwds):
@@ -78,9 +234,9 @@ class Page(object):
     
     def _dump(self, id, dir_path):
         vht_file = dir_path + str(id) + '.json'
-        img_file = dir_path + str(id) + '.png'
+        img_file = dir_path + str(id) + self.img_ext
         VHTParser.dump(self.vht, vht_file)
-        write(img_file, self.img)
+        self.save_img(img_file)
         return (vht_file, img_file)
     
     def _dict(self, vht_file='', img_file=''):
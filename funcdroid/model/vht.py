@@ -1,6 +1,56 @@
 import xml.etree.ElementTree as ET
 from ..utils.exception import*
-import json, re
+from dataclasses import dataclass, field
+from collections import defaultdict, deque
+from collections.abc import Mapping, MutableMapping
+import json, re, hashlib, sys, io
+
+try:
+    from lxml import etree as _etree
+except ImportError:
+    _etree = ET
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+
+@dataclass
+class VHTDiff:
+    """
+    Differences between two view hierarchy trees.
+    added / removed hold the roots of whole inserted / deleted subtrees,
+    changed holds (old, new) pairs of matched nodes whose own attributes differ.
+    """
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+
+    @property
+    def empty(self):
+        return not (self.added or self.removed or self.changed)
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+
+def _match_children(old_children, new_children):
+    """
+    Pair every new child with an old child of the same type and id, in order of appearance.
+
+    Returns:
+        list: For every new child, its old counterpart or None.
+    """
+    candidates = defaultdict(deque)
+    for child in old_children:
+        candidates[(child._get('type', ''), child._get('id', ''))].append(child)
+    matches = []
+    for child in new_children:
+        queue = candidates.get((child._get('type', ''), child._get('id', '')))
+        matches.append(queue.popleft() if queue else None)
+    return matches
+
 
 class VHT(object):
     """
@@ -10,12 +60,113 @@ class VHT(object):
         self._root = root
         if compressed:
             self._compress(self._root)
+        # Built on the first query, see reindex()
+        self._index = None
+        self._grid = None
 
     def __str__(self):
         return str(self._root._json_dict())
     
     def __call__(self, **kwds):
-        return self._root(**kwds)
+        """
+        Find the nodes with the given attribute values, in pre-order (as VHTNode.__call__).
+        Queries on an indexed attribute (see _INDEXED) look their candidates up instead of
+        walking the tree.
+        """
+        if self._root is None:
+            return []
+        keys = [key for key in kwds if key in _INDEXED]
+        if not keys:
+            return self._root(**kwds)
+        index = self._attribute_index()
+        try:
+            candidates = min([index.get((key, kwds[key]), ()) for key in keys], key=len)
+        except TypeError:
+            # An unhashable value is never indexed, the tree is walked instead
+            return self._root(**kwds)
+        return [node for node in candidates if node._satisfy(kwds)]
+
+    def reindex(self):
+        """
+        Drop the attribute and spatial indexes, to be rebuilt on the next query.
+        The indexes are a snapshot of the tree: call this after changing nodes in place.
+        """
+        self._index = None
+        self._grid = None
+
+    def _attribute_index(self):
+        # (attribute, value) -> nodes, in pre-order
+        if self._index is None:
+            index = {}
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                for key in _INDEXED:
+                    value = node._get(key, _MISSING)
+                    if value is _MISSING:
+                        continue
+                    try:
+                        index.setdefault((key, value), []).append(node)
+                    except TypeError:
+                        pass
+                stack.extend(reversed(node._children))
+            self._index = index
+        return self._index
+
+    def _spatial_index(self):
+        # A grid of square cells, each listing (in pre-order) the nodes whose bounds overlap it
+        if self._grid is None:
+            boxes = []
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                stack.extend(reversed(node._children))
+                if node._bounds is not None:
+                    (x1, y1, x2, y2) = _unpack(node._bounds, 4)
+                else:
+                    try:
+                        ((x1, y1), (x2, y2)) = node._get('bounds', None)
+                        (x1, y1, x2, y2) = (int(x1), int(y1), int(x2), int(y2))
+                    except (TypeError, ValueError):
+                        continue
+                box = (max(x1, 0), max(y1, 0), x2, y2, node)
+                if box[0] < box[2] and box[1] < box[3]:
+                    boxes.append(box)
+            extent = max([max(box[2], box[3]) for box in boxes] + [1])
+            cell = max(_CELL, -(-extent // _MAX_CELLS))
+            cells = {}
+            for box in boxes:
+                (x1, y1, x2, y2) = box[:4]
+                for cx in range(x1 // cell, (x2 - 1) // cell + 1):
+                    for cy in range(y1 // cell, (y2 - 1) // cell + 1):
+                        cells.setdefault((cx, cy), []).append(box)
+            self._grid = (cell, cells)
+        return self._grid
+
+    def nodes_at(self, x, y, **kwds):
+        """
+        Args:
+            x (int): The abscissa of a point on the screen.
+            y (int): The ordinate of the point.
+            kwds: Attribute values the nodes must have, as in __call__.
+
+        Returns:
+            list: The nodes whose bounds contain the point, outermost first.
+        """
+        (cell, cells) = self._spatial_index()
+        (x, y) = (int(x), int(y))
+        if x < 0 or y < 0:
+            return []
+        return [node for (x1, y1, x2, y2, node) in cells.get((x // cell, y // cell), ())
+                if x1 <= x < x2 and y1 <= y < y2 and node._satisfy(kwds)]
+
+    def node_at(self, x, y, **kwds):
+        """
+        Returns:
+            VHTNode: The innermost node under the point (see nodes_at()), or None.
+        """
+        nodes = self.nodes_at(x, y, **kwds)
+        return nodes[-1] if nodes else None
     
     def _compress(self, node):
         if self._assert_compress(node):
@@ -28,35 +179,273 @@ class VHT(object):
 
     def _assert_compress(self, node):
         if len(node._children) == 1:
-            s_attri = node.attribute
-            c_attri = node._children[0].attribute
-            if s_attri['bounds'] == c_attri['bounds']:
+            if node._get('bounds') == node._children[0]._get('bounds'):
                 return True
         return False
 
     def get_node_count(self):
-        def _count(node):
-            cnt = 1 
-            for child in getattr(node, "_children", []):
-                cnt += _count(child)
-            return cnt
+        cnt = 0
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            cnt += 1
+            stack.extend(getattr(node, "_children", []))
+        return cnt
 
+    def subtree(self, node):
+        """
+        Returns:
+            VHT: The tree rooted at a node of this tree.
+        """
+        return VHT(node)
+
+    def structure_hash(self):
+        """
+        Hash the layout of the tree (type and bounds of every node, in pre-order).
+        Texts are left out, so a blinking cursor or a ticking clock does not change it.
+        """
+        md5 = hashlib.md5()
+        stack = [(self._root, 0)] if self._root is not None else []
+        while stack:
+            node, depth = stack.pop()
+            md5.update(('%d|%s|%s;' % (depth, node._get('type', ''), node._get('bounds', ''))).encode('utf-8'))
+            stack.extend([(child, depth + 1) for child in reversed(node._children)])
+        return md5.hexdigest()
+
+    def diff(self, previous):
+        """
+        Compare the tree against an earlier one. Subtrees shared with it (see the incremental
+        mode of VHTParser) are skipped without being walked.
+
+        Args:
+            previous (VHT): The earlier tree, e.g. the hierarchy before an action.
+
+        Returns:
+            VHTDiff: The added, removed and changed nodes.
+        """
+        diff = VHTDiff()
+        if previous is None or previous._root is None:
+            if self._root is not None:
+                diff.added.append(self._root)
+            return diff
         if self._root is None:
-            return 0
-        return _count(self._root)
+            diff.removed.append(previous._root)
+            return diff
+        stack = [(previous._root, self._root)]
+        while stack:
+            old, new = stack.pop()
+            if old is new:
+                continue
+            if old._state() != new._state():
+                diff.changed.append((old, new))
+            matches = _match_children(old._children, new._children)
+            for (child, match) in zip(new._children, matches):
+                if match is None:
+                    diff.added.append(child)
+                else:
+                    stack.append((match, child))
+            matched = {id(match) for match in matches if match is not None}
+            diff.removed.extend([child for child in old._children if id(child) not in matched])
+        return diff
     
 
+# Keys every node carries, in the order the parsers produce them
+_FLAGS = ('clickable', 'longClickable', 'selected', 'checkable', 'checked', 'enabled', 'focused')
+_KEYS = ('bundle', 'page', 'bounds', 'clickable', 'longClickable', 'selected', 'checkable', 'checked',
+         'type', 'id', 'text', 'enabled', 'focused', 'center')
+_STRING_SLOTS = {'bundle': '_bundle', 'page': '_page', 'type': '_type', 'id': '_id', 'text': '_text'}
+_INTERNED = ('bundle', 'page', 'type', 'id')
+# A flag takes 2 bits: absent, 'false', 'true' or ''
+_FLAG_SHIFTS = {name: 2 * i for (i, name) in enumerate(_FLAGS)}
+_FLAG_CODES = {'false': 1, 'true': 2, '': 3}
+_FLAG_VALUES = (None, 'false', 'true', '')
+# Coordinates are packed into one int, 20 bits each
+_COORD_BITS = 20
+_COORD_OFFSET = 1 << (_COORD_BITS - 1)
+_COORD_MASK = (1 << _COORD_BITS) - 1
+_MISSING = object()
+_REQUIRED = object()
+# Attributes a VHT indexes for its queries
+_INDEXED = ('id', 'text', 'type', 'bundle', 'clickable', 'checkable')
+# Cells of the spatial index are at least _CELL pixels wide, at most _MAX_CELLS per side
+_CELL = 256
+_MAX_CELLS = 64
+
+
+def _pack(values):
+    packed = 0
+    for value in values:
+        if type(value) is not int or not -_COORD_OFFSET <= value < _COORD_OFFSET:
+            return None
+        packed = (packed << _COORD_BITS) | (value + _COORD_OFFSET)
+    return packed
+
+
+def _unpack(packed, count):
+    values = []
+    for _ in range(count):
+        values.append((packed & _COORD_MASK) - _COORD_OFFSET)
+        packed >>= _COORD_BITS
+    values.reverse()
+    return values
+
+
 class VHTNode(object):
     """
     The class describes a node of view hierarchy tree
+
+    Nodes are compact: type, id, bundle and page are interned, the boolean flags share
+    one bitfield and bounds and center are packed integers. `attribute` is a dict-like
+    view over them; values of another form (e.g. bounds given as a string) are kept as given.
     """
+    __slots__ = ('_bundle', '_page', '_type', '_id', '_text', '_flags', '_bounds', '_center',
+                 '_extra', '_children', '_device', '_compressed')
+
     def __init__(self, device=None, attrib={}, **extra):
         if not isinstance(attrib, dict):
             raise TypeError("attrib must be dict, not %s" % (attrib.__class__.__name__,))
-        self.attribute = {**attrib, **extra}
+        self._bundle = self._page = self._type = self._id = self._text = None
+        self._flags = 0
+        self._bounds = self._center = None
+        self._extra = None
         self._children = []
         self._device = device
-        self._compressed = set()
+        self._compressed = None
+        for (key, value) in attrib.items():
+            self._set(key, value)
+        for (key, value) in extra.items():
+            self._set(key, value)
+
+    @classmethod
+    def _make(cls, device, bundle, page, x1, y1, x2, y2, flags, type, id, text):
+        """
+        Build a node from parsed fields, without going through the attribute dict.
+
+        Args:
+            flags (tuple): The values of _FLAGS, in order.
+        """
+        node = cls.__new__(cls)
+        node._bundle = sys.intern(bundle)
+        node._page = sys.intern(page)
+        node._type = sys.intern(type)
+        node._id = sys.intern(id)
+        node._text = text
+        packed, extra = 0, None
+        for (i, value) in enumerate(flags):
+            code = _FLAG_CODES.get(value)
+            if code is None:
+                extra = extra or {}
+                extra[_FLAGS[i]] = value
+            else:
+                packed |= code << (2 * i)
+        node._flags = packed
+        node._bounds = _pack((x1, y1, x2, y2))
+        node._center = _pack((int((x1 + x2)/2), int((y1 + y2)/2)))
+        if node._bounds is None or node._center is None:
+            extra = extra or {}
+            extra['bounds'] = [[x1, y1], [x2, y2]]
+            extra['center'] = [int((x1 + x2)/2), int((y1 + y2)/2)]
+        node._extra = extra
+        node._children = []
+        node._device = device
+        node._compressed = None
+        return node
+
+    @property
+    def attribute(self):
+        return _AttributeView(self)
+
+    @attribute.setter
+    def attribute(self, attrib):
+        for key in list(self._keys()):
+            self._del(key)
+        for (key, value) in attrib.items():
+            self._set(key, value)
+
+    def _get(self, key, default=_REQUIRED):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        slot = _STRING_SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+        elif key in _FLAG_SHIFTS:
+            value = _FLAG_VALUES[(self._flags >> _FLAG_SHIFTS[key]) & 3]
+        elif key == 'bounds':
+            value = None if self._bounds is None else self._bounds_list()
+        elif key == 'center':
+            value = None if self._center is None else _unpack(self._center, 2)
+        else:
+            value = None
+        if value is None:
+            if default is _REQUIRED:
+                raise KeyError(key)
+            return default
+        return value
+
+    def _bounds_list(self):
+        (x1, y1, x2, y2) = _unpack(self._bounds, 4)
+        return [[x1, y1], [x2, y2]]
+
+    def _set(self, key, value):
+        stored = False
+        slot = _STRING_SLOTS.get(key)
+        if slot is not None:
+            if isinstance(value, str):
+                setattr(self, slot, sys.intern(value) if key in _INTERNED else value)
+                stored = True
+        elif key in _FLAG_SHIFTS:
+            code = _FLAG_CODES.get(value) if isinstance(value, str) else None
+            if code is not None:
+                shift = _FLAG_SHIFTS[key]
+                self._flags = (self._flags & ~(3 << shift)) | (code << shift)
+                stored = True
+        elif key in ('bounds', 'center'):
+            try:
+                values = [v for point in value for v in point] if key == 'bounds' else list(value)
+            except TypeError:
+                values = []
+            packed = _pack(values) if len(values) == (4 if key == 'bounds' else 2) else None
+            if packed is not None:
+                setattr(self, '_' + key, packed)
+                stored = True
+        if stored:
+            if self._extra is not None and key in self._extra:
+                del self._extra[key]
+            return
+        self._clear(key)
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def _clear(self, key):
+        slot = _STRING_SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, None)
+        elif key in _FLAG_SHIFTS:
+            self._flags &= ~(3 << _FLAG_SHIFTS[key])
+        elif key in ('bounds', 'center'):
+            setattr(self, '_' + key, None)
+
+    def _del(self, key):
+        if self._get(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+        self._clear(key)
+        if self._extra is not None:
+            self._extra.pop(key, None)
+
+    def _keys(self):
+        for key in _KEYS:
+            if self._get(key, _MISSING) is not _MISSING:
+                yield key
+        if self._extra is not None:
+            for key in self._extra:
+                if key not in _KEYS:
+                    yield key
+
+    def _state(self):
+        # Equal for two nodes exactly when their attributes are equal
+        return (self._bundle, self._page, self._type, self._id, self._text, self._flags,
+                self._bounds, self._center, self._extra or None)
 
     def __str__(self):
         return str(self.attribute)
@@ -107,50 +496,161 @@ class VHTNode(object):
         }
 
     def _json(self):
-        attribute = self.attribute
-        attribute['bounds'] = ''.join([str(sublist) for sublist in self.attribute['bounds']])
+        attribute = dict(self.attribute)
+        attribute['bounds'] = ''.join([str(sublist) for sublist in attribute['bounds']])
         attribute['center'] = str(attribute['center'])
         return attribute
     
     def _satisfy(self, attrib):
         for key, value in attrib.items():
-            if key not in self.attribute or self.attribute[key] != value:
+            if self._get(key, _MISSING) is _MISSING or self._get(key) != value:
                 return False
         return True
     
     def _compress(self, node):
-        for (key, value) in self.attribute.items():
-             if key in ['clickable', 'longClickable', 'selected', 'checkable', 'checked', 'focused', 'enabled']:
-                if value == 'true' or node.attribute[key] == 'true':
-                    self.attribute[key] = 'true'
-        if self.attribute['text'] == '':
-            self.attribute['text'] = node.attribute['text']
-        elif node.attribute['text'] not in self.attribute['text']:
-            self.attribute['text'] += ',' + node.attribute['text']
-        if node.attribute['type'] not in self.attribute['type']:
-            self.attribute['type'] = node.attribute['type']
+        for key in _FLAGS:
+            value = self._get(key, _MISSING)
+            if value is not _MISSING:
+                if value == 'true' or node._get(key) == 'true':
+                    self._set(key, 'true')
+        text = self._get('text')
+        if text == '':
+            self._set('text', node._get('text'))
+        elif node._get('text') not in text:
+            self._set('text', text + ',' + node._get('text'))
+        if node._get('type') not in self._get('type'):
+            self._set('type', node._get('type'))
+        if self._compressed is None:
+            self._compressed = set()
         self._compressed.add(node)
         self._compressed.add(self)
     
     def click(self):
-        x, y = self.attribute['center']
+        x, y = self._get('center')
         self._device.click(x, y)
 
     def long_click(self):
-        x, y = self.attribute['center']
+        x, y = self._get('center')
         self._device.long_click(x, y)
 
     def input(self, text):
         self._device.input(self, text)
 
     def get_children(self):
-        if self.attribute['bundle'] == 'com.android.systemui':
+        if self._get('bundle') == 'com.android.systemui':
             return []
         # if self.attribute['type'] and ('Layout' not in self.attribute['type'] and 'Group' not in self.attribute['type']):
         #     return []
         return self._children
-    
-    
+
+
+class _AttributeView(MutableMapping):
+    """
+    The attributes of a VHTNode as a dict, read and written through to the node.
+    """
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        self._node = node
+
+    def __getitem__(self, key):
+        return self._node._get(key)
+
+    def get(self, key, default=None):
+        return self._node._get(key, default)
+
+    def __contains__(self, key):
+        return self._node._get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        self._node._set(key, value)
+
+    def __delitem__(self, key):
+        self._node._del(key)
+
+    def __iter__(self):
+        return self._node._keys()
+
+    def __len__(self):
+        return sum(1 for _ in self._node._keys())
+
+    def __eq__(self, other):
+        if isinstance(other, _AttributeView):
+            return self._node._state() == other._node._state()
+        if isinstance(other, Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def copy(self):
+        return dict(self.items())
+
+
+_BOUNDS_RE = re.compile(r'\[\s*(-?\d+),\s*(-?\d+)\]\[\s*(-?\d+),\s*(-?\d+)\]')
+
+
+def _parse_bounds(text):
+    """
+    Parse '[x1,y1][x2,y2]' (spaces allowed) without a regex on the common path.
+
+    Returns:
+        tuple: (x1, y1, x2, y2), or None if the text is not in that form.
+    """
+    try:
+        (x1, y1, x2, y2) = text.strip()[1:-1].replace('][', ',').split(',')
+        return (int(x1), int(y1), int(x2), int(y2))
+    except (ValueError, AttributeError):
+        match = _BOUNDS_RE.match(text) if isinstance(text, str) else None
+        return tuple(map(int, match.groups())) if match else None
+
+
+def _stream_xml(source, build):
+    """
+    Run build() over the (start, end) events of an XML document, with lxml when available.
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if _etree is not ET:
+        try:
+            return build(_etree.iterparse(io.BytesIO(source), events=('start', 'end'), huge_tree=True))
+        except _etree.XMLSyntaxError:
+            # libxml2 limits the nesting depth even with huge_tree, expat does not
+            pass
+    return build(ET.iterparse(io.BytesIO(source), events=('start', 'end')))
+
+
+def _share_unchanged(root, old_root):
+    """
+    Replace the subtrees of a new tree that equal their counterpart in an old tree by the old
+    subtree, so unchanged parts are shared between the two (see VHT.diff()).
+
+    Returns:
+        VHTNode: The root to use, the old root if nothing changed.
+    """
+    pairs = []
+    stack = [(root, old_root)]
+    while stack:
+        (new, old) = stack.pop()
+        pairs.append((new, old))
+        for (child, match) in zip(new._children, _match_children(old._children, new._children)):
+            if match is not None:
+                stack.append((child, match))
+    shared = {}
+    # Pre-order reversed: every node comes after all of its descendants
+    for (new, old) in reversed(pairs):
+        children = [shared.get(id(child), child) for child in new._children]
+        new._children = children
+        if new._state() == old._state() and len(children) == len(old._children) \
+                and all(child is prev for (child, prev) in zip(children, old._children)):
+            shared[id(new)] = old
+    return shared.get(id(root), root)
+
 
 class VHTParser(object):
     """
@@ -175,97 +675,115 @@ class VHTParser(object):
         with open(file, 'w', encoding='utf-8') as write_file:
             json.dump(vht._root._json_dict(), write_file, indent=indent, ensure_ascii=False)
     
+    @classmethod
+    def load(cls, file, device=None):
+        """
+        Load a hierarchy written by dump().
+        """
+        with open(file, 'rb') as read_file:
+            source = _loads(read_file.read())
+        root = None
+        stack = [(source, None)]
+        while stack:
+            (item, parent) = stack.pop()
+            attrib = dict(item['attributes'])
+            (x1, y1, x2, y2) = _parse_bounds(str(attrib.get('bounds', ''))) or (0, 0, 0, 0)
+            attrib['bounds'] = [[x1, y1], [x2, y2]]
+            attrib['center'] = [int((x1 + x2)/2), int((y1 + y2)/2)]
+            node = VHTNode(device=device, attrib=attrib)
+            if parent is None:
+                root = node
+            else:
+                parent._children.append(node)
+            stack.extend([(child, node) for child in reversed(item.get('children', []))])
+        return VHT(root)
+
     @classmethod
     def _parse_hdc_json(cls, source, device):
-        root = VHTParser.__parse_hdc_json(source, device)
+        """
+        Args:
+            source (dict or str or bytes): The hierarchy dumped by hmdriver2, parsed or as JSON text.
+            device (Device): The device the nodes act on.
+        """
+        if isinstance(source, (str, bytes, bytearray)):
+            source = _loads(source)
+        root = None
+        # Iterative: deep (e.g. WebView) hierarchies must not hit the recursion limit
+        stack = [(source, None)]
+        while stack:
+            (item, parent) = stack.pop()
+            node = VHTParser.__hdc_node(item, device)
+            if parent is None:
+                root = node
+            else:
+                parent._children.append(node)
+            stack.extend([(child, node) for child in reversed(item.get('children', []))])
         return VHT(root)
 
     @classmethod
-    def __parse_hdc_json(cls, source, device):
-        if 'attributes' in source:
-            extra = source['attributes']
-            bound_re = r'\[(\d+),\s*(\d+)\]\[(\d+),\s*(\d+)\]'
-            match = re.match(bound_re, extra['bounds'])
-            if match:
-                (x1, y1, x2, y2) = map(int, match.groups())
-            else: 
-                raise BoundsError('%s is not in form [x1,y1][x2,y2]' % extra['bounds'])
-            attrib = {'bundle': '', 'page': ''}
-            if 'bundleName' in extra:
-                attrib['bundle'] = extra['bundleName']
-                attrib['page'] = extra['pagePath']
-
-            root = VHTNode(device=device,
-                           attrib=attrib,
-                           bounds = [[x1,y1],[x2,y2]],
-                           clickable = extra['clickable'],
-                           longClickable = extra['longClickable'],
-                           selected = extra['selected'],
-                           checkable = extra['checkable'],
-                           checked = extra['checked'],
-                           type = extra['type'],
-                           id = extra['id'],
-                           text = extra['text'],
-                           enabled = extra['enabled'],
-                           focused = extra['focused'],
-                           center = [int((x1 + x2)/2), int((y1 + y2)/2)])
-            if 'children' in source:
-                children = source['children']
-                for child in children:
-                    root.append(VHTParser.__parse_hdc_json(child, device))
-            return root
-        else:
+    def __hdc_node(cls, source, device):
+        if 'attributes' not in source:
             raise JsonKeyError('expected key: attributes')
+        extra = source['attributes']
+        bounds = _parse_bounds(extra['bounds'])
+        if bounds is None:
+            raise BoundsError('%s is not in form [x1,y1][x2,y2]' % extra['bounds'])
+        (x1, y1, x2, y2) = bounds
+        (bundle, page) = ('', '')
+        if 'bundleName' in extra:
+            bundle = extra['bundleName']
+            page = extra['pagePath']
+        return VHTNode._make(device, bundle, page, x1, y1, x2, y2,
+                             (extra['clickable'], extra['longClickable'], extra['selected'], extra['checkable'],
+                              extra['checked'], extra['enabled'], extra['focused']),
+                             extra['type'], extra['id'], extra['text'])
 
     @classmethod
-    def _parse_adb_xml(cls, source, device):
-        source = ET.fromstring(source)
-        root = VHTParser.__parse_adb_xml(source, device)
+    def _parse_adb_xml(cls, source, device, previous=None):
+        """
+        Args:
+            source (str or bytes): The XML dump of uiautomator.
+            device (Device): The device the nodes act on.
+            previous (VHT): An earlier tree of the same screen. When given, the whole tree is still
+            parsed, then every subtree equal to its counterpart in `previous` is replaced by that
+            subtree. The two trees share those nodes, which saves memory and lets diff() skip them;
+            it does not make parsing cheaper.
+        """
+        root = VHTParser.__stream_adb_xml(source, device)
+        if previous is not None and previous._root is not None and root is not None:
+            root = _share_unchanged(root, previous._root)
         return VHT(root)
 
     @classmethod
-    def __parse_adb_xml(cls, source, device):
-        attrib = {'bundle': '', 'page': ''}
-        if source.tag == 'hierarchy':
-            root = VHTNode(device=device,
-                           attrib=attrib,
-                           bounds = [[0,0],[0,0]],
-                           clickable = '',
-                           longClickable = '',
-                           selected = '',
-                           checkable = '',
-                           checked = '',
-                           type = '',
-                           id = '',
-                           text = '',
-                           enabled = '',
-                           focused = '',
-                           center = [0,0])
-        elif source.tag == 'node':
+    def __stream_adb_xml(cls, source, device):
+        # Nodes are built as their start tags stream in, no element tree is kept
+        def build(events):
+            root, stack = None, []
+            for (event, elem) in events:
+                if event == 'start':
+                    node = VHTParser.__adb_node(elem, device)
+                    if stack:
+                        stack[-1]._children.append(node)
+                    else:
+                        root = node
+                    stack.append(node)
+                else:
+                    stack.pop()
+                    elem.clear()
+            return root
+        return _stream_xml(source, build)
+
+    @classmethod
+    def __adb_node(cls, source, device):
+        if source.tag == 'node':
             extra = source.attrib
-            bound_re = '\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]'
-            match = re.match(bound_re, extra['bounds'])
-            if match:
-                (x1, y1, x2, y2) = map(int, match.groups())
-                if x1 == 2147483647 and y1 == 2147483647 and x2 == -2147483648 and y2 == -2147483648:
-                    x1, y1, x2, y2 = 0, 0, 100, 100
-            else: 
-                x1, y1, x2, y2 = 0, 0, 100, 100
-            attrib['bundle'] = extra['package']
-            root = VHTNode(device=device,
-                           attrib=attrib,
-                           bounds = [[x1,y1],[x2,y2]],
-                           clickable = extra['clickable'],
-                           longClickable = extra['long-clickable'],
-                           selected = extra['selected'],
-                           checkable = extra['checkable'],
-                           checked = extra['checked'],
-                           type = extra['class'],
-                           id = extra['resource-id'],
-                           text = extra['text'],
-                           enabled = extra['enabled'],
-                           focused =  extra['focused'],
-                           center = [int((x1 + x2)/2), int((y1 + y2)/2)])
-        for child in source:
-            root.append(VHTParser.__parse_adb_xml(child, device))
-        return root
\ No newline at end of file
+            bounds = _parse_bounds(extra['bounds'])
+            if bounds is None or bounds == (2147483647, 2147483647, -2147483648, -2147483648):
+                bounds = (0, 0, 100, 100)
+            (x1, y1, x2, y2) = bounds
+            return VHTNode._make(device, extra['package'], '', x1, y1, x2, y2,
+                                 (extra['clickable'], extra['long-clickable'], extra['selected'], extra['checkable'],
+                                  extra['checked'], extra['enabled'], extra['focused']),
+                                 extra['class'], extra['resource-id'], extra['text'])
+        # The <hierarchy> root, and any unknown tag, carries empty attributes
+        return VHTNode._make(device, '', '', 0, 0, 0, 0, ('',) * len(_FLAGS), '', '', '')
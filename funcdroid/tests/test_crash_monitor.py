@@ -0,0 +1,48 @@
+"""
+Replays the logcats shipped with the effectiveness evaluation through CrashMonitor.
+"""
+from hmbot.device.connector.crash import CrashMonitor
+from pathlib import Path
+import re
+import pytest
+
+LOGS = sorted((Path(__file__).resolve().parents[2] / 'Effectiveness evaluation').glob('**/*.txt'))
+_header_re = re.compile(r'(?:E AndroidRuntime: FATAL EXCEPTION|E ACRA\s*: ACRA caught an? \S+ for (\S+))')
+
+
+def _replay(path, bundle=None):
+    monitor = CrashMonitor([], 'replay', bundle)
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            monitor.on_line(line.rstrip('\r\n'))
+    monitor.flush()
+    return monitor
+
+
+def _crash_logs():
+    logs = []
+    for path in LOGS:
+        text = path.read_text(encoding='utf-8', errors='replace')
+        headers = _header_re.findall(text)
+        if headers:
+            logs.append(pytest.param(path, len(headers), {b for b in headers if b}, id=path.parent.name))
+    return logs
+
+
+@pytest.mark.skipif(not LOGS, reason='evaluation logs are not available')
+@pytest.mark.parametrize('path, headers, bundles', _crash_logs())
+def test_replay_reports_crashes(path, headers, bundles):
+    monitor = _replay(path)
+    assert monitor.crashes, 'no crash reported for %s' % path.name
+    # Recurrences of one bug share a signature
+    assert len(monitor.crashes) <= headers
+    for bundle in bundles:
+        assert any(crash.process == bundle for crash in monitor.crashes.values())
+
+
+@pytest.mark.skipif(not LOGS, reason='evaluation logs are not available')
+def test_acra_crash_filtered_by_bundle():
+    path = next(p for p in LOGS if 'ACRA caught' in p.read_text(encoding='utf-8', errors='replace'))
+    bundle = _header_re.search(path.read_text(encoding='utf-8', errors='replace')).group(1)
+    assert _replay(path, bundle).crashes
+    assert not _replay(path, 'com.example.other').crashes
@@ -0,0 +1,110 @@
+"""
+Drives EventHub through SimulatedEventSource and AccessibilityStream, as a device would.
+"""
+from hmbot.device.connector.events import EventHub, SimulatedEventSource, AccessibilityStream
+from hmbot.utils.proto import UIEventType
+import sys
+import time
+import pytest
+
+STATE = UIEventType.WINDOW_STATE_CHANGED
+CONTENT = UIEventType.WINDOW_CONTENT_CHANGED
+# A `uiautomator events` line, trimmed to the fields AccessibilityStream reads
+LINE = ('EventType: TYPE_WINDOW_STATE_CHANGED; EventTime: 1; PackageName: com.example; '
+        'MovementGranularity: 0; Action: 0; ClassName: com.example.MainActivity; Text: [Example]')
+
+
+@pytest.fixture
+def source():
+    source = SimulatedEventSource(EventHub())
+    yield source
+    source.stop()
+
+
+def test_subscribe_and_unsubscribe(source):
+    subscription = source.hub.subscribe()
+    source.emit(STATE, package='com.example')
+    event = subscription.get(timeout=1)
+    assert event.type == STATE and event.package == 'com.example'
+    subscription.close()
+    assert subscription not in source.hub._subscriptions
+    source.emit(STATE)
+    assert subscription.get(timeout=0.1) is None
+
+
+def test_subscription_as_context_manager(source):
+    with source.hub.subscribe() as subscription:
+        assert subscription in source.hub._subscriptions
+    assert subscription.closed
+    assert subscription not in source.hub._subscriptions
+
+
+def test_subscription_filters_types(source):
+    subscription = source.hub.subscribe([STATE])
+    source.emit(CONTENT)
+    source.emit(STATE, class_name='com.example.MainActivity')
+    source.emit(CONTENT)
+    assert subscription.get(timeout=1).type == STATE
+    assert subscription.get(timeout=0.1) is None
+    # The hub keeps every type for queries
+    assert [e.type for e in source.hub.since(0)] == [CONTENT, STATE, CONTENT]
+    assert [e.type for e in source.hub.since(0, [CONTENT])] == [CONTENT, CONTENT]
+
+
+def test_wait_for_delayed_event(source):
+    source.emit(CONTENT, delay=0.05)
+    source.emit(STATE, delay=0.1)
+    event = source.hub.wait_for([STATE], timeout=5)
+    assert event is not None and event.type == STATE
+
+
+def test_wait_for_times_out(source):
+    source.emit(CONTENT)
+    start = time.time()
+    assert source.hub.wait_for([STATE], timeout=0.2) is None
+    assert time.time() - start >= 0.2
+    # Events published before `since` do not count
+    assert source.hub.wait_for([CONTENT], since=time.time(), timeout=0.1) is None
+
+
+def test_device_wait_for_event_times_out(source):
+    pytest.importorskip('cv2')
+    from hmbot.device.device import Device
+
+    class Connector(object):
+        _event_hub = None
+
+    device = Device.__new__(Device)
+    device.connector = Connector()
+    assert device.wait_for_event([STATE], timeout=0.1) is None
+    device.connector._event_hub = source.hub
+    source.emit(CONTENT, delay=0.05)
+    assert device.wait_for_event([STATE], timeout=0.2) is None
+    source.emit(STATE, delay=0.05)
+    assert device.wait_for_event([STATE], timeout=5).type == STATE
+
+
+def test_stop_cancels_delayed_events(source):
+    subscription = source.hub.subscribe()
+    source.emit(STATE, delay=0.1)
+    source.stop()
+    time.sleep(0.3)
+    assert subscription.get(timeout=0) is None
+    assert not source.hub.since(0)
+
+
+def test_accessibility_stream_stops():
+    hub = EventHub()
+    script = 'import sys, time\nprint(%r)\nsys.stdout.flush()\ntime.sleep(60)' % LINE
+    stream = AccessibilityStream([sys.executable, '-c', script], hub, 'replay')
+    stream.start()
+    try:
+        event = hub.wait_for([STATE], since=0, timeout=10)
+        assert event is not None
+        assert (event.package, event.class_name, event.text) == ('com.example', 'com.example.MainActivity', 'Example')
+        assert stream.alive
+    finally:
+        stream.stop()
+    stream._thread.join(timeout=5)
+    assert not stream._thread.is_alive()
+    assert not stream.alive
@@ -0,0 +1,82 @@
+"""
+Plays frames through ReplayFrameSource and checks what screenshot() is served from the ring buffer.
+"""
+from hmbot.device.automator.frame import ReplayFrameSource
+import numpy as np
+import time
+import pytest
+
+# Strings would be read as image paths, so frames are stood in for by plain objects
+BUFFERED, CAPTURED = object(), object()
+
+
+def _played(frames, capacity=4, attach=None):
+    source = ReplayFrameSource(frames, capacity=capacity, fps=1000, loop=False)
+    if attach is None:
+        source.start()
+    else:
+        attach(source)
+    source._thread.join(timeout=5)
+    return source
+
+
+class _Recording(object):
+    def __init__(self, img):
+        self.img = img
+        self.captures = 0
+
+    def screenshot(self):
+        self.captures += 1
+        return self.img
+
+
+def _sim_automator(img):
+    pytest.importorskip('cv2')
+    from hmbot.device.automator.sim import SimAutomator
+    automator = SimAutomator.__new__(SimAutomator)
+    automator.recording = _Recording(img)
+    automator._action_ts = 0
+    return automator
+
+
+def test_ring_buffer_keeps_newest_frames():
+    source = _played(list(range(6)))
+    assert [frame.img for frame in source.frames()] == [2, 3, 4, 5]
+
+
+def test_latest_returns_newest_frame():
+    source = _played(list(range(6)))
+    assert source.latest().img == 5
+    assert source.latest(newer_than=time.time() + 60) is None
+
+
+def test_latest_waits_for_a_newer_frame():
+    start = time.time()
+    source = ReplayFrameSource([BUFFERED], capacity=2, fps=1000, loop=False)
+    source.start()
+    frame = source.latest(newer_than=start - 1, timeout=5)
+    assert frame is not None and frame.img is BUFFERED
+
+
+def test_screenshot_is_served_from_fresh_frame():
+    automator = _sim_automator(CAPTURED)
+    _played([BUFFERED], attach=automator.attach_frame_source)
+    assert automator.screenshot() is BUFFERED
+    assert automator.recording.captures == 0
+
+
+def test_screenshot_falls_back_without_fresh_frame():
+    automator = _sim_automator(CAPTURED)
+    _played([BUFFERED], attach=automator.attach_frame_source)
+    # Every buffered frame is older than the last action
+    automator._acted()
+    assert automator._fresh_frame(timeout=0) is None
+    assert automator.screenshot() is CAPTURED
+    assert automator.recording.captures == 1
+
+
+def test_raw_screenshot_skips_frame_source():
+    automator = _sim_automator(np.zeros((8, 8, 3), dtype=np.uint8))
+    _played([BUFFERED], attach=automator.attach_frame_source)
+    assert automator.screenshot(raw=True) is not BUFFERED
+    assert automator.recording.captures == 1
@@ -0,0 +1,202 @@
+import os
+import time
+import statistics
+import tracemalloc
+import random
+from loguru import logger
+from .proto import Transport
+
+
+def _measure(func, rounds):
+    """
+    Call func `rounds` times and return its latency statistics in milliseconds.
+    """
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'mean': statistics.mean(samples),
+            'median': statistics.median(samples),
+            'max': max(samples)}
+
+
+def compare_transports(device, rounds=20):
+    """
+    Compare the latency of the subprocess and the persistent connector transport on one device.
+
+    Args:
+        device (Device): A connected device, its connector class is reused for both transports.
+        rounds (int): How many times every probe is repeated.
+
+    Returns:
+        dict: {transport: {probe: {'mean', 'median', 'max'}}} in milliseconds.
+    """
+    connector_cls = type(device.connector)
+    report = {}
+    for transport in Transport:
+        connector = connector_cls(device, transport=transport)
+        probes = {
+            'shell': lambda: connector.shell('echo hmbot'),
+            'shell_grep': lambda: connector.shell_grep('ps', 'system'),
+            'page_info': connector.page_info,
+        }
+        report[transport.value] = {name: _measure(probe, rounds) for (name, probe) in probes.items()}
+    for name in report[Transport.SUBPROCESS.value]:
+        old = report[Transport.SUBPROCESS.value][name]['mean']
+        new = report[Transport.PERSISTENT.value][name]['mean']
+        logger.info('%-12s subprocess %8.1f ms | persistent %8.1f ms | x%.1f' % (name, old, new, old / max(new, 1e-6)))
+    return report
+
+
+def synthetic_adb_xml(nodes=2000, fanout=6, seed=0):
+    """
+    Build a uiautomator dump of a given size, for benchmarks on hosts without a device.
+
+    Returns:
+        str: The XML dump.
+    """
+    rng = random.Random(seed)
+    classes = ['android.widget.FrameLayout', 'android.widget.LinearLayout', 'android.widget.TextView',
+               'android.widget.ImageView', 'android.widget.Button', 'androidx.recyclerview.widget.RecyclerView']
+    count = [0]
+
+    def node(x1, y1, x2, y2, depth):
+        count[0] += 1
+        index = count[0]
+        attrs = ('index="0" text="%s" resource-id="com.example:id/view%d" class="%s" package="com.example" '
+                 'content-desc="" checkable="false" checked="false" clickable="%s" enabled="true" focusable="false" '
+                 'focused="false" scrollable="false" long-clickable="false" password="false" selected="false" '
+                 'bounds="[%d,%d][%d,%d]"') % ('item %d' % index if rng.random() < 0.4 else '', index % 50,
+                                              rng.choice(classes), 'true' if rng.random() < 0.3 else 'false',
+                                              x1, y1, x2, y2)
+        children = []
+        width = fanout if depth < 12 else 0
+        for i in range(width):
+            if count[0] >= nodes:
+                break
+            h = max(1, (y2 - y1) // width)
+            children.append(node(x1, y1 + i * h, x2, y1 + (i + 1) * h, depth + 1))
+        return '<node %s>%s</node>' % (attrs, ''.join(children))
+
+    body = []
+    while count[0] < nodes:
+        body.append(node(0, 0, 1080, 2400, 0))
+    return "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">%s</hierarchy>" % ''.join(body)
+
+
+def benchmark_vht(sources=None, rounds=10):
+    """
+    Measure parse time and retained memory of view hierarchy trees.
+
+    Args:
+        sources (list): uiautomator XML dumps; synthetic dumps of 500, 2000 and 8000 nodes if None.
+        rounds (int): How many times every dump is parsed.
+
+    Returns:
+        list: {'nodes', 'parse_ms' ({'mean', 'median', 'max'}), 'bytes_per_node'} per dump.
+    """
+    from hmbot.model.vht import VHTParser
+    if sources is None:
+        sources = [synthetic_adb_xml(n) for n in (500, 2000, 8000)]
+    report = []
+    for source in sources:
+        parse_ms = _measure(lambda: VHTParser._parse_adb_xml(source, None), rounds)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        vht = VHTParser._parse_adb_xml(source, None)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        nodes = vht.get_node_count()
+        report.append({'nodes': nodes, 'parse_ms': parse_ms, 'bytes_per_node': retained / nodes})
+        logger.info('%6d nodes | parse %8.1f ms | %6.0f bytes/node' % (nodes, parse_ms['mean'], retained / nodes))
+    return report
+
+
+def _as_adb_xml(tree):
+    # A dumped hierarchy (see VHTParser.dump) written back as a uiautomator dump
+    from xml.sax.saxutils import quoteattr
+    out, stack = [], [(tree, False)]
+    while stack:
+        (item, closing) = stack.pop()
+        if closing:
+            out.append('</node>')
+            continue
+        a = item['attributes']
+        out.append('<node index="0" text=%s resource-id=%s class=%s package=%s content-desc="" checkable="%s" '
+                   'checked="%s" clickable="%s" enabled="%s" focusable="false" focused="%s" scrollable="false" '
+                   'long-clickable="%s" password="false" selected="%s" bounds="%s">'
+                   % (quoteattr(a['text']), quoteattr(a['id']), quoteattr(a['type']), quoteattr(a['bundle']),
+                      a['checkable'], a['checked'], a['clickable'], a['enabled'], a['focused'],
+                      a['longClickable'], a['selected'], a['bounds'].replace(' ', '')))
+        stack.append((item, True))
+        stack.extend([(child, False) for child in reversed(item.get('children', []))])
+    return "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">%s</hierarchy>" % ''.join(out)
+
+
+def _as_hdc_json(tree):
+    # A dumped hierarchy written back in the layout of hmdriver2
+    import json
+
+    def convert(item):
+        attributes = dict(item['attributes'])
+        attributes['bundleName'] = attributes.pop('bundle')
+        attributes['pagePath'] = attributes.pop('page')
+        return {'attributes': attributes, 'children': [convert(child) for child in item.get('children', [])]}
+    return json.dumps(convert(tree))
+
+
+def benchmark_parsers(files, rounds=10):
+    """
+    Measure the hierarchy parsers on dumped hierarchies (the vht.json files of an exploration).
+
+    Every file is parsed as written (VHTParser.load) and after conversion to the uiautomator XML
+    and hmdriver2 JSON layouts (VHTParser._parse_adb_xml / _parse_hdc_json).
+
+    Args:
+        files (list): Paths of vht.json files.
+        rounds (int): How many times every file is parsed.
+
+    Returns:
+        dict: {parser: total mean milliseconds over all files}, plus 'nodes'.
+    """
+    import json
+    from hmbot.model.vht import VHTParser
+    report = {'load': 0.0, 'adb_xml': 0.0, 'hdc_json': 0.0, 'nodes': 0}
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as f:
+            tree = json.load(f)
+        (xml, hdc) = (_as_adb_xml(tree), _as_hdc_json(tree))
+        report['load'] += _measure(lambda: VHTParser.load(file), rounds)['mean']
+        report['adb_xml'] += _measure(lambda: VHTParser._parse_adb_xml(xml, None), rounds)['mean']
+        report['hdc_json'] += _measure(lambda: VHTParser._parse_hdc_json(hdc, None), rounds)['mean']
+        report['nodes'] += VHTParser.load(file).get_node_count()
+    logger.info('%d files, %d nodes | load %.1f ms | adb xml %.1f ms | hdc json %.1f ms'
+                % (len(files), report['nodes'], report['load'], report['adb_xml'], report['hdc_json']))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    from hmbot.device.device import Device
+    parser = argparse.ArgumentParser(description='connector transport latency and view hierarchy benchmarks')
+    parser.add_argument('-s', '--serial', help='compare connector transports on this device')
+    parser.add_argument('--os', default='android')
+    parser.add_argument('-n', '--rounds', type=int, default=20)
+    parser.add_argument('--vht', nargs='*', metavar='XML', help='benchmark hierarchy parsing (synthetic dumps if no file is given)')
+    parser.add_argument('--parsers', metavar='DIR', help='benchmark the parsers on the vht.json files under a directory')
+    args = parser.parse_args()
+    if args.parsers:
+        import glob
+        benchmark_parsers(sorted(glob.glob(os.path.join(args.parsers, '**', 'vht.json'), recursive=True)), rounds=args.rounds)
+    elif args.vht is not None:
+        sources = []
+        for path in args.vht:
+            with open(path, 'r', encoding='utf-8') as f:
+                sources.append(f.read())
+        benchmark_vht(sources or None, rounds=args.rounds)
+    elif args.serial:
+        compare_transports(Device(args.serial, args.os), rounds=args.rounds)
+    else:
+        parser.error('either --serial or --vht is required')
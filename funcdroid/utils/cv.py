@@ -9,8 +9,20 @@ def read(img_path):
     return img
 
 def write(img_path, img):
+    if isinstance(img, (bytes, bytearray)):
+        # 已压缩的图像字节直接落盘，不再重新编码
+        with open(img_path, 'wb') as f:
+            f.write(img)
+        return
     cv2.imwrite(img_path, img)
 
+def decode(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def phash(img):
+    import imagehash
+    return imagehash.phash(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+
 def _crop(img, bound):
     (x1, y1), (x2, y2) = bound
     return img[y1:y2, x1:x2]
@@ -14,4 +14,10 @@ class HDCError(Exception):
     pass
 
 class ADBError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class RPCTimeoutError(DeviceError):
+    pass
+
+class LeaseTimeoutError(DeviceError):
+    pass
@@ -4,6 +4,24 @@ from dataclasses import dataclass
 class OperatingSystem(str, Enum):
     HARMONY = 'harmony'
     ANDROID = 'android'
+    SIMULATED = 'simulated'
+
+class Transport(str, Enum):
+    SUBPROCESS = 'subprocess'
+    PERSISTENT = 'persistent'
+
+class CaptureMode(str, Enum):
+    SEQUENTIAL = 'sequential'
+    CONCURRENT = 'concurrent'
+
+class UIEventType(str, Enum):
+    WINDOW_STATE_CHANGED = 'TYPE_WINDOW_STATE_CHANGED'
+    WINDOW_CONTENT_CHANGED = 'TYPE_WINDOW_CONTENT_CHANGED'
+    WINDOWS_CHANGED = 'TYPE_WINDOWS_CHANGED'
+    NOTIFICATION_STATE_CHANGED = 'TYPE_NOTIFICATION_STATE_CHANGED'
+    VIEW_CLICKED = 'TYPE_VIEW_CLICKED'
+    VIEW_SCROLLED = 'TYPE_VIEW_SCROLLED'
+    VIEW_TEXT_CHANGED = 'TYPE_VIEW_TEXT_CHANGED'
 
 class SwipeDirection(str, Enum):
     LEFT = 'left'
@@ -84,3 +102,56 @@ class PageInfo:
     bundle: str
     ability: str
     name: str
+
+@dataclass
+class ShellResult:
+    command: str
+    returncode: int
+    output: str
+
+@dataclass
+class Transition:
+    ts: float
+    info: PageInfo
+
+@dataclass
+class Incident:
+    ts: float
+    serial: str
+    call: str
+    kind: str
+    detail: str
+    recovered: bool
+
+@dataclass
+class Crash:
+    ts: float
+    kind: str
+    process: str
+    exception: str
+    signature: str
+    trace: str
+    count: int
+
+@dataclass
+class Checkpoint:
+    bundle: str
+    archive: str
+    info: PageInfo
+    ts: float
+
+@dataclass
+class UIEvent:
+    ts: float
+    type: UIEventType
+    package: str
+    class_name: str
+    text: str
+
+@dataclass
+class ProvisionReport:
+    serial: str
+    ok: bool
+    steps: dict
+    total: float
+    error: str
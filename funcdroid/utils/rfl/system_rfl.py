@@ -1,10 +1,13 @@
 from hmbot.device.connector.adb import ADB
 from hmbot.device.connector.hdc import HDC
+from hmbot.device.connector.sim import SimConnector
 from hmbot.device.automator.u2 import U2
 from hmbot.device.automator.h2 import H2
+from hmbot.device.automator.sim import SimAutomator
 from ..proto import OperatingSystem
 
 system_rfl = {
     OperatingSystem.ANDROID: (ADB, U2),
-    OperatingSystem.HARMONY: (HDC, H2)
+    OperatingSystem.HARMONY: (HDC, H2),
+    OperatingSystem.SIMULATED: (SimConnector, SimAutomator)
 }
\ No newline at end of file